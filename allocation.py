@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+按整手（100股）分配资金
+
+先按目标金额向下取整到整手，再把剩余资金按"离目标差得最多"的顺序逐手补足，
+每只股票最多超出目标金额 tolerance，整个过程按数组批量计算，400只股票
+也只需几轮循环。
+"""
+import numpy as np
+import pandas as pd
+
+
+def order_cost(value, commission=0.0003, min_commission=0):
+    """买入金额对应的总花费（含佣金），value 可以是数组"""
+    value = np.asarray(value, dtype=float)
+    fee = np.where(value > 0, np.maximum(value * commission, min_commission), 0.0)
+    return value + fee
+
+
+def allocate_lots(target_values, prices, cash, commission=0.0003, min_commission=0,
+                  slippage=0.0, lot=100, tolerance=0.2):
+    """
+    计算每只股票的买入股数（lot 的整数倍）
+    target_values: pd.Series，证券 -> 目标买入金额（顺序决定同等条件下的优先级）
+    prices: pd.Series，证券 -> 当前价格
+    cash: 可用资金
+    commission/min_commission: 买入佣金率和最低佣金
+    slippage: 双边滑点比例，买入按 价格*(1+slippage/2) 估算
+    tolerance: 单只股票最多超出目标金额的比例
+    返回 pd.Series，证券 -> 股数
+    """
+    codes = target_values.index
+    target = target_values.values.astype(float)
+    price = prices.reindex(codes).fillna(0).values.astype(float) * (1 + slippage / 2.0)
+    valid = (price > 0) & (target > 0)
+    lot_value = np.where(valid, price * lot, 0.0)
+
+    # 第一步：各自向下取整到整手
+    lots = np.zeros(len(codes), dtype=np.int64)
+    lots[valid] = np.floor(target[valid] / lot_value[valid])
+    spent = order_cost(lots * lot_value, commission, min_commission)
+    # 资金不足以按目标全部买入时按比例缩减
+    if spent.sum() > cash and spent.sum() > 0:
+        lots = np.floor(lots * cash / spent.sum()).astype(np.int64)
+        spent = order_cost(lots * lot_value, commission, min_commission)
+    remaining = cash - spent.sum()
+
+    # 第二步：剩余资金逐手补给离目标最远的股票
+    cap = target * (1 + tolerance)
+    while True:
+        value = lots * lot_value
+        step_cost = order_cost(value + lot_value, commission, min_commission) - \
+            order_cost(value, commission, min_commission)
+        eligible = valid & (value + lot_value <= cap) & (step_cost <= remaining)
+        if not eligible.any():
+            break
+        # 按缺口（以手数计）从大到小排序，取累计花费不超过剩余资金的前缀
+        shortfall = np.full(len(codes), -np.inf)
+        shortfall[eligible] = (target[eligible] - value[eligible]) / lot_value[eligible]
+        order = np.argsort(-shortfall, kind='stable')
+        order = order[eligible[order]]
+        take = order[np.cumsum(step_cost[order]) <= remaining]
+        if len(take) == 0:
+            take = order[:1]
+        lots[take] += 1
+        remaining -= step_cost[take].sum()
+
+    return pd.Series(lots * lot, index=codes)
+
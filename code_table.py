@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+证券代码映射表
+
+聚宽格式（600000.XSHG）、QMT格式（600000.SH）、纯数字（600000）和紧凑整数id
+之间的转换，以及交易所、板块、涨跌幅比例。每个证券只解析一次，之后都是
+字典O(1)查找；板块、涨跌幅等列另存为数组，供全市场向量化过滤。
+聚宽策略和iQuant执行端共用同一份实现。
+"""
+import sys
+
+import numpy as np
+
+# 交易所：(聚宽后缀, QMT后缀)
+EXCHANGES = (('XSHG', 'SH'), ('XSHE', 'SZ'), ('BJSE', 'BJ'))
+SH, SZ, BJ = 0, 1, 2
+_SUFFIX = {}
+for _i, (_jq, _qmt) in enumerate(EXCHANGES):
+    _SUFFIX[_jq] = _i
+    _SUFFIX[_qmt] = _i
+
+# 板块及其涨跌幅比例（ST另行处理）
+MAIN, CHINEXT, STAR, BSE = 0, 1, 2, 3
+BOARD_NAMES = ('main', 'chinext', 'star', 'bse')
+BOARD_LIMIT_PCT = (0.10, 0.20, 0.20, 0.30)
+
+
+def parse_code(code):
+    """解析任意格式的代码，返回 (纯数字代码, 交易所)"""
+    code = str(code).strip()
+    if '.' in code:
+        bare, suffix = code.split('.', 1)
+        exchange = _SUFFIX.get(suffix.upper())
+        if exchange is not None:
+            return bare, exchange
+    else:
+        bare = code
+    # 无后缀时按代码段推断交易所
+    if bare.startswith('92') or bare[:1] in ('4', '8'):
+        return bare, BJ
+    if bare[:1] in ('5', '6', '9'):
+        return bare, SH
+    return bare, SZ
+
+
+def board_of(bare, exchange):
+    """按代码段判断板块"""
+    if exchange == BJ:
+        return BSE
+    if exchange == SH and bare.startswith('68'):
+        return STAR
+    if exchange == SZ and bare.startswith('30'):
+        return CHINEXT
+    return MAIN
+
+
+class CodeTable(object):
+    """证券代码映射表"""
+
+    def __init__(self, codes=()):
+        self.jq = []
+        self.qmt = []
+        self.bare = []
+        self._row = {}      # 任意格式代码 -> 行号
+        self._arrays = None
+        self._exchange = []
+        self._board = []
+        self.ensure(codes)
+
+    def __len__(self):
+        return len(self.jq)
+
+    def _add(self, code):
+        bare, exchange = parse_code(code)
+        jq_code = sys.intern('%s.%s' % (bare, EXCHANGES[exchange][0]))
+        row = self._row.get(jq_code)
+        if row is None:
+            row = len(self.jq)
+            qmt_code = sys.intern('%s.%s' % (bare, EXCHANGES[exchange][1]))
+            bare = sys.intern(bare)
+            self.jq.append(jq_code)
+            self.qmt.append(qmt_code)
+            self.bare.append(bare)
+            self._exchange.append(exchange)
+            self._board.append(board_of(bare, exchange))
+            self._row[jq_code] = row
+            self._row[qmt_code] = row
+            # 纯数字代码可能在沪深重复（如指数），以先登记的为准
+            self._row.setdefault(bare, row)
+            self._arrays = None
+        self._row[code] = row
+        return row
+
+    def ensure(self, codes):
+        """批量登记证券（每日开盘前用全市场列表调用一次即可）"""
+        for code in codes:
+            if code not in self._row:
+                self._add(code)
+        return self
+
+    def row(self, code):
+        """代码对应的行号，未登记的自动登记"""
+        row = self._row.get(code)
+        return self._add(code) if row is None else row
+
+    def rows(self, codes):
+        return np.fromiter((self.row(c) for c in codes), dtype=np.int64, count=len(codes))
+
+    def to_jq(self, code):
+        return self.jq[self.row(code)]
+
+    def to_qmt(self, code):
+        return self.qmt[self.row(code)]
+
+    def to_bare(self, code):
+        return self.bare[self.row(code)]
+
+    def to_id(self, code):
+        """紧凑整数id：交易所 * 1000000 + 数字代码"""
+        return int(self.arrays()['id'][self.row(code)])
+
+    def board(self, code):
+        return self._board[self.row(code)]
+
+    def board_name(self, code):
+        return BOARD_NAMES[self.board(code)]
+
+    def limit_pct(self, code):
+        return BOARD_LIMIT_PCT[self.board(code)]
+
+    def arrays(self):
+        """按行号排列的数组列：id、exchange、board、limit_pct"""
+        if self._arrays is None:
+            exchange = np.array(self._exchange, dtype=np.int8)
+            board = np.array(self._board, dtype=np.int8)
+            numeric = np.array([int(b) if b.isdigit() else 0 for b in self.bare], dtype=np.int64)
+            self._arrays = {
+                'id': exchange.astype(np.int64) * 1000000 + numeric,
+                'exchange': exchange,
+                'board': board,
+                'limit_pct': np.array(BOARD_LIMIT_PCT)[board] if len(board) else np.zeros(0),
+            }
+        return self._arrays
+
+    def board_mask(self, codes, boards):
+        """codes 中属于 boards 的布尔数组"""
+        return np.isin(self.arrays()['board'][self.rows(codes)] if len(codes) else np.zeros(0, dtype=np.int8),
+                       boards)
+
+    def exclude_boards(self, codes, boards=(STAR, BSE)):
+        """剔除属于 boards 的证券（默认科创板、北交所），保持原顺序"""
+        codes = list(codes)
+        if not codes:
+            return codes
+        self.ensure(codes)
+        mask = self.board_mask(codes, boards)
+        return [c for c, m in zip(codes, mask) if not m]
+
+
+_shared_table = CodeTable()
+
+
+def shared_code_table():
+    """进程内共享的代码表"""
+    return _shared_table
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+上一交易日行情与盘中涨跌停状态（joinquant.py、joinquant_nodb.py 共用）
+
+上一交易日的收盘价、涨停价按天写入 BarRingBuffer，只取调用方需要的证券
+（开盘前为持仓），不再每天取全市场：
+    g.daily_bars = BarRingBuffer(DAILY_FIELDS, 1)
+    bars = update_daily_bars(g.daily_bars, context, g.hold_list, globals())
+    status = get_limit_status(g.daily_bars, context, target_list, globals())
+前收盘价优先取缓冲区，缓冲区未覆盖的证券（如调仓目标）一次批量补取；
+涨跌停价按前收盘价和ST状态在本地计算。
+
+数据接口（get_price、get_extras、history）从调用方传入的名字表 api（策略的
+globals()）中取，这样 install_profiler / install_recorder 替换后的接口同样生效。
+"""
+import numpy as np
+import pandas as pd
+
+from price_limit import limit_status
+
+DAILY_FIELDS = ['close', 'high_limit']
+
+
+def update_daily_bars(bars, context, stock_list, api):
+    """把上一交易日 stock_list 的收盘价和涨停价写入行情缓冲区，当日已写入且已覆盖时不再取数"""
+    yesterday = context.previous_date
+    stock_list = list(stock_list)
+    if not stock_list or (bars.last_time == yesterday and bars.covers(stock_list)):
+        return bars
+    bars.set_securities(stock_list)
+    panel = api['get_price'](stock_list, end_date=yesterday, frequency='daily',
+                             fields=bars.fields, count=1, skip_paused=False)
+    bars.push({f: panel[f].iloc[-1] for f in bars.fields}, yesterday)
+    return bars
+
+
+def get_pre_close(bars, context, stock_list, api):
+    """前收盘价：缓冲区中的证券直接读取，其余一次批量取数"""
+    yesterday = context.previous_date
+    stock_list = list(stock_list)
+    if bars.last_time == yesterday:
+        pre_close = pd.Series(bars.get('close', 1, stock_list)[-1], index=stock_list)
+        missing = [s for s in stock_list if s not in bars.positions]
+    else:
+        pre_close = pd.Series(np.nan, index=stock_list)
+        missing = stock_list
+    if missing:
+        pre_close[missing] = api['get_price'](missing, end_date=yesterday, frequency='daily',
+                                              fields=['close'], count=1, skip_paused=False)['close'].iloc[-1]
+    return pre_close
+
+
+def get_limit_status(bars, context, stock_list, api):
+    """按前收盘价和ST状态本地计算涨跌停，最新价一次批量取上一分钟收盘价"""
+    last_prices = api['history'](1, unit='1m', field='close', security_list=stock_list).iloc[-1]
+    pre_close = get_pre_close(bars, context, stock_list, api)
+    is_st = api['get_extras']('is_st', stock_list, end_date=context.current_dt.date(), count=1).iloc[-1]
+    return limit_status(pre_close, last_prices, is_st, context.current_dt.date())
@@ -0,0 +1,114 @@
+"""
+Multi-account fan-out for the iQuant executor
+
+The same JoinQuant order stream is executed in several accounts. Each Account
+has its own scaling ratio, position book, submission index (idempotency), fill
+tracker and order slicer, and keeps a per-order status:
+    submitted  sent to the broker
+    slicing    handed to the account's slicer, children still being sent
+    skipped    nothing to do in this account (below one lot, no position to sell)
+    error      passorder raised; retried on the next pass
+An order is claimed once from the database and fanned out to every account;
+it is marked if_deal = 1 only when it is settled (submitted or skipped) in all
+of them; a sliced order is settled when its slicer finishes, and is not
+dispatched again while it is being worked.
+
+FanOut runs the per-account passes one after another on the calling (strategy)
+thread: passorder, cancel, get_trade_detail_data and ContextInfo are not
+documented as thread-safe, so every broker call stays on the thread QMT calls
+the strategy on. A pass that raises is reported and does not stop the other
+accounts; its unsettled orders stay pending for it and are retried next pass.
+"""
+from iquant_dedupe import SubmissionIndex
+
+SUBMITTED = 'submitted'
+SLICING = 'slicing'
+SKIPPED = 'skipped'
+ERROR = 'error'
+SETTLED = (SUBMITTED, SKIPPED)
+
+LOT_SIZE = 100
+
+
+class Account(object):
+    """
+    One trading account
+    ratio: fraction of the signal's order quantity executed in this account
+    """
+
+    def __init__(self, account_id, ratio=1.0):
+        self.account_id = str(account_id)
+        self.ratio = ratio
+        self.positions = {}  # bare code -> volume
+        self.submission_index = SubmissionIndex()
+        self.fill_tracker = None
+        self.slicer = None
+        self.status = {}     # pk -> SUBMITTED / SLICING / SKIPPED / ERROR
+
+    def __repr__(self):
+        return 'Account({}, ratio={})'.format(self.account_id, self.ratio)
+
+    def scale(self, order_values):
+        """Order quantity for this account, rounded down to whole lots"""
+        return int(order_values * self.ratio) // LOT_SIZE * LOT_SIZE
+
+    def refresh_positions(self, get_trade_detail_data, normalize):
+        positions = {}
+        for ele in get_trade_detail_data(self.account_id, 'stock', 'position') or []:
+            if ele.m_nVolume > 0:
+                positions[normalize(ele.m_strInstrumentID)] = ele.m_nVolume
+        self.positions = positions
+        return positions
+
+    def settled(self, pk):
+        return self.status.get(pk) in SETTLED
+
+    def slicing(self, pk):
+        return self.status.get(pk) == SLICING
+
+    def forget(self, pks):
+        for pk in pks:
+            self.status.pop(pk, None)
+
+
+class FanOut(object):
+    """Run a per-account pass for every account, serially on the calling thread"""
+
+    def __init__(self, accounts):
+        self.accounts = list(accounts)
+        self.by_id = dict((a.account_id, a) for a in self.accounts)
+
+    @property
+    def primary(self):
+        return self.accounts[0]
+
+    def account_for(self, broker_obj):
+        """Account of a broker callback object (m_strAccountID), the primary one if absent"""
+        account_id = getattr(broker_obj, 'm_strAccountID', None)
+        return self.by_id.get(str(account_id), self.primary) if account_id else self.primary
+
+    def dispatch(self, run_pass, orders):
+        """
+        Run run_pass(account, todo) on each account with the orders it has not settled
+        Returns the accounts run
+        """
+        ran = []
+        for account in self.accounts:
+            todo = [o for o in orders if not account.settled(o['pk']) and not account.slicing(o['pk'])]
+            if not todo:
+                continue
+            ran.append(account)
+            try:
+                run_pass(account, todo)
+            except Exception as e:
+                print('Account {} pass failed: {}'.format(account.account_id, e))
+        return ran
+
+    def settled_orders(self, pks):
+        """Orders settled in every account"""
+        return [pk for pk in pks if all(a.settled(pk) for a in self.accounts)]
+
+    def forget(self, pks):
+        for account in self.accounts:
+            account.forget(pks)
+
@@ -0,0 +1,78 @@
+"""
+Idempotent order submission for the iQuant executor
+
+Each database order is submitted with a user order id derived from its pk
+(passorder's userOrderId, reported back by the broker as m_strRemark). The
+SubmissionIndex holds the ids submitted today; it is rebuilt from the broker's
+order list at start-up, so an order that was sent before a restart, or whose
+database mark was lost, is recognised and never sent twice. This lets the
+executor mark orders in the database after submitting them, in one batch.
+
+Sliced orders (iquant_slicer) are sent as children whose ids append a sequence
+number to the parent id; any child at the broker marks its parent as submitted.
+
+When passorder raises, the broker may or may not have accepted the order. The
+id is then held as uncertain and the index is refreshed from the broker before
+the order is considered again.
+"""
+import hashlib
+
+ID_PREFIX = 'jq'
+ID_DIGEST_LENGTH = 16
+CHILD_SEPARATOR = '-'
+
+
+def user_order_id(pk):
+    """Compact, deterministic broker-side id for an order pk (18 characters)"""
+    digest = hashlib.sha1(str(pk).encode('utf-8')).hexdigest()
+    return ID_PREFIX + digest[:ID_DIGEST_LENGTH]
+
+
+def child_order_id(uid, seq):
+    """User order id of the seq-th child of a sliced order"""
+    return '{}{}{}'.format(uid, CHILD_SEPARATOR, seq)
+
+
+def parent_order_id(remark):
+    return remark.split(CHILD_SEPARATOR, 1)[0]
+
+
+class SubmissionIndex(object):
+    """User order ids already submitted to the broker today"""
+
+    def __init__(self):
+        self.ids = set()
+        self.uncertain = set()
+
+    def __contains__(self, uid):
+        return uid in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, uid):
+        self.ids.add(uid)
+        self.uncertain.discard(uid)
+
+    def mark_uncertain(self, uid):
+        self.uncertain.add(uid)
+
+    def is_uncertain(self, uid):
+        return uid in self.uncertain
+
+    def rebuild(self, account_id, get_trade_detail_data):
+        """Reload the submitted ids from today's broker orders of the account"""
+        ids = set()
+        for order in get_trade_detail_data(account_id, 'stock', 'order') or []:
+            remark = getattr(order, 'm_strRemark', '') or ''
+            if remark.startswith(ID_PREFIX):
+                ids.add(parent_order_id(remark))
+        self.ids = ids
+        self.uncertain = set()
+        return len(ids)
+
+    def resolve(self, account_id, get_trade_detail_data):
+        """Refresh from the broker if any submission outcome is unknown"""
+        if self.uncertain:
+            self.rebuild(account_id, get_trade_detail_data)
+
@@ -3,17 +3,34 @@ import pymysql
 import pandas as pd
 import time
 from datetime import datetime, time as dt_time
+from code_table import shared_code_table
+from iquant_fills import FillTracker, BUY_DIRECTION, SELL_DIRECTION, FINAL_STATES
+from iquant_dedupe import user_order_id
+from iquant_journal import Journal, CLAIM, SUBMIT, ERROR, SKIP, MARK, ACK
+from iquant_accounts import Account, FanOut, SUBMITTED, SLICING, SKIPPED, ERROR as ACCOUNT_ERROR
+from iquant_slicer import SliceScheduler, PARTICIPATION
+from iquant_quotes import QuoteCache
+
+CODE_TABLE = shared_code_table()
 
 # Trading configuration
 EXECUTION_RATIO = 1  # Execute ratio of original order quantity (0.1 = 10%)
 
+# Accounts executing the order stream: (account id, execution ratio). The first one is the
+# primary account (ContextInfo.accID); its fills are written back to the order table.
+ACCOUNTS = [
+    ("330200009169", EXECUTION_RATIO),
+]
+
 # Price type configuration - based on API documentation prType parameter  
-# SOLUTION: Use price from database (JoinQuant's last_price) +/- offset
-# Database price is from JoinQuant's real-time data, much more reliable than iQuant's get_full_tick()
-BUY_PRICE_TYPE = 11   # Specified price: use DB price + offset
-SELL_PRICE_TYPE = 11  # Specified price: use DB price - offset
+# SOLUTION: Use the live counter price (ask for buys, bid for sells) +/- offset, bounded by the
+# price from database (JoinQuant's last_price at signal time); DB price +/- offset without a fresh quote
+BUY_PRICE_TYPE = 11   # Specified price: quote/DB price + offset
+SELL_PRICE_TYPE = 11  # Specified price: quote/DB price - offset
 QUICK_TRADE = 2       # 2=force immediate execution (required for non-bar-driven strategies)
 PRICE_OFFSET = 0.002  # 0.2% price offset to ensure order execution (buy higher, sell lower)
+QUOTE_MAX_AGE = 10          # seconds a tick stays usable for pricing
+QUOTE_MAX_DEVIATION = 0.03  # quote-based prices are kept within 3% of the DB price
 """
 prType price type options:
 0: Sell5 price (for buying - most aggressive)
@@ -38,33 +55,207 @@ Why quickTrade=2 is required:
 - quickTrade=2: forces immediate execution regardless of bar state (perfect for our use case)
 """
 
+# Fill reconciliation: write changed fills back at most every FILL_FLUSH_INTERVAL seconds,
+# poll the broker every FILL_POLL_INTERVAL seconds while orders are open (callbacks may lag)
+FILL_FLUSH_INTERVAL = 5
+FILL_POLL_INTERVAL = 10
+FILL_COLUMNS = (('fill_qty', 'INT'), ('fill_price', 'DOUBLE'),
+                ('fill_status', 'VARCHAR(16)'), ('fill_time', 'DATETIME'))
+
+# Each account keeps its own positions, submission index (user order ids already sent today,
+# rebuilt from the broker in init), fill tracker and per-order status
+accounts = [Account(account_id, ratio) for account_id, ratio in ACCOUNTS]
+fanout = FanOut(accounts)
+
+# Orders read from the table and not yet settled in every account (pk -> order), and pks
+# whose if_deal = 1 mark is deferred until every account has settled them
+open_orders = {}
+pending_marks = []
+
+# Latest bid/ask/last of codes with pending orders or positions, fed by tick subscriptions
+quotes = QuoteCache(QUOTE_MAX_AGE)
+
+# Order slicing (off by default): set SLICE_MIN_VOLUME to a share count, e.g. 5000, and orders of at
+# least that many shares (after the account ratio) are split into child orders over SLICE_HORIZON
+# seconds instead of one order at the quote/DB price +/- offset.
+# SLICE_SCHEDULE = TWAP gives equal slices every SLICE_INTERVAL seconds; PARTICIPATION also caps
+# each child at SLICE_PARTICIPATION of the market volume of the last interval (from 1m bars).
+# Children resting SLICE_REPRICE_AFTER seconds are cancelled and re-sent SLICE_REPRICE_STEP more
+# aggressive, at most SLICE_MAX_STEPS times.
+SLICE_MIN_VOLUME = None
+SLICE_SCHEDULE = PARTICIPATION
+SLICE_HORIZON = 600
+SLICE_INTERVAL = 30
+SLICE_PARTICIPATION = 0.1
+SLICE_REPRICE_AFTER = 20
+SLICE_REPRICE_STEP = 0.001
+SLICE_MAX_STEPS = 5
+
+# Write-ahead journal of claim/submit/mark/ack transitions, replayed by init after a restart
+JOURNAL_DIR = 'executor_journal'
+journal = None
+
 def init(ContextInfo):
-    global position_flag, delete_flag, order_flag
+    global position_flag, delete_flag, order_flag, journal
     
     position_flag = False
     delete_flag = True
     order_flag = True
-    account = "330200009169"
-    ContextInfo.accID = str(account)
-    ContextInfo.set_account(ContextInfo.accID)
-    
-    print('init - start continuous monitoring mode (EXECUTION RATIO: {}%)'.format(int(EXECUTION_RATIO * 100)))
-    print('Price config: BUY_TYPE={} (DB_price+{}%), SELL_TYPE={} (DB_price-{}%), QUICK_TRADE={}'.format(
+    for account in accounts:
+        ContextInfo.set_account(account.account_id)
+    ContextInfo.accID = fanout.primary.account_id
+    
+    print('init - start continuous monitoring mode ({} accounts)'.format(len(accounts)))
+    for account in accounts:
+        print('Account {}: EXECUTION RATIO {}%'.format(account.account_id, int(account.ratio * 100)))
+    print('Price config: BUY_TYPE={} (ask+{}%), SELL_TYPE={} (bid-{}%), QUICK_TRADE={}'.format(
         BUY_PRICE_TYPE, PRICE_OFFSET*100, SELL_PRICE_TYPE, PRICE_OFFSET*100, QUICK_TRADE))
-    print('NOTE: Using price from JoinQuant database (last_price field) +/- 0.2%')
+    print('NOTE: Quotes older than {}s fall back to the JoinQuant DB price; prices stay within {}% of it'.format(
+        QUOTE_MAX_AGE, QUOTE_MAX_DEVIATION*100))
+    
+    ensure_fill_columns()
+    for account in accounts:
+        account.fill_tracker = FillTracker(fill_writer(account), FILL_FLUSH_INTERVAL, FILL_POLL_INTERVAL)
+        if SLICE_MIN_VOLUME is not None:
+            account.slicer = make_slicer(ContextInfo, account)
+        count = account.submission_index.rebuild(account.account_id, get_trade_detail_data)
+        print('Account {}: submission index rebuilt from broker orders, {} orders already submitted today'.format(
+            account.account_id, count))
+    journal = Journal(JOURNAL_DIR)
+    recover_from_journal()
     
     start_continuous_monitoring(ContextInfo)
 
+def record(event, **fields):
+    """Append a transition to the journal (no-op until init has opened it)"""
+    if journal is not None:
+        journal.append(event, **fields)
+
+def recover_from_journal():
+    """
+    Reconcile today's journal with each account's broker order snapshot (submission_index):
+    restore per-account order status, re-apply lost if_deal marks and resume fill tracking
+    for orders still open. Sliced orders not yet settled are rebuilt in the slicer from their
+    children at the broker and the rest is re-queued. Orders claimed but absent from the broker
+    stay pending and are retried.
+    """
+    started = time.time()
+    states = journal.replay()
+    resumed = 0
+    unsent = 0
+    broker_orders = {}
+    for (account_id, pk), state in states.items():
+        account = fanout.by_id.get(account_id, fanout.primary)
+        if state.skipped and not state.marked:
+            account.status[pk] = SKIPPED
+            open_orders[pk] = None
+        if state.uid is None:
+            continue
+        if state.uid in account.submission_index:
+            if state.sliced and not state.marked and account.slicer is not None:
+                if account.account_id not in broker_orders:
+                    broker_orders[account.account_id] = get_trade_detail_data(
+                        account.account_id, 'stock', 'order') or []
+                parent = account.slicer.resume(pk, state.uid, state.code, state.direction, state.volume,
+                                               state.base_price or state.price,
+                                               broker_orders[account.account_id])
+                account.status[pk] = SLICING
+                open_orders[pk] = None
+                resumed += 1
+                print('Sliced order {} resumed in account {}: {} / {} shares sent'.format(
+                    pk, account.account_id, parent.committed, parent.volume))
+                continue
+            if not state.marked:
+                account.status[pk] = SUBMITTED
+                open_orders[pk] = None
+            if state.status not in FINAL_STATES and not state.sliced:
+                account.fill_tracker.register(pk, state.code, state.direction, state.volume, state.price,
+                                              state.uid)
+                resumed += 1
+        else:
+            unsent += 1
+            if state.submitted:
+                print('WARNING: order {} was submitted as {} in account {} but is not in its broker order list'.format(
+                    pk, state.uid, account.account_id))
+    marks = settle_orders()
+    print('Journal recovery: {} orders, {} resumed for fill tracking, {} marks re-applied, '
+          '{} not at broker ({:.1f} ms)'.format(len(states), resumed, marks, unsent,
+                                               (time.time() - started) * 1000))
+
+def make_slicer(ContextInfo, account):
+    """Slice scheduler of an account, sending children through passorder / cancel"""
+    def place(parent, child):
+        price_type = BUY_PRICE_TYPE if parent.direction == BUY_DIRECTION else SELL_PRICE_TYPE
+        passorder(parent.direction, 1101, account.account_id, parent.code, price_type, child.price, child.volume,
+                  '', QUICK_TRADE, child.uid, ContextInfo)
+        print('Child order [{}]: {} {} x {} @ {} (id={})'.format(
+            account.account_id, parent.pk, parent.code, child.volume, child.price, child.uid))
+
+    def cancel_child(child):
+        cancel(child.broker_id, account.account_id, 'stock', ContextInfo)
+
+    return SliceScheduler(
+        place, cancel_child, lambda: get_trade_detail_data(account.account_id, 'stock', 'order'),
+        writer=fill_writer(account), schedule=SLICE_SCHEDULE, horizon=SLICE_HORIZON,
+        interval=SLICE_INTERVAL, participation=SLICE_PARTICIPATION,
+        recent_volume=lambda code: recent_volume(ContextInfo, code), reprice_after=SLICE_REPRICE_AFTER,
+        reprice_step=SLICE_REPRICE_STEP, max_steps=SLICE_MAX_STEPS, price_offset=PRICE_OFFSET,
+        flush_interval=FILL_FLUSH_INTERVAL,
+        price=lambda parent, step: order_price(parent.code, parent.direction, parent.base_price,
+                                               step * SLICE_REPRICE_STEP),
+        on_done=lambda parent: slice_done(account, parent))
+
+def slice_done(account, parent):
+    """A sliced order is settled in the account once its slicer has finished"""
+    account.status[parent.pk] = SUBMITTED
+
+def recent_volume(ContextInfo, code):
+    """Market volume (shares) of the last SLICE_INTERVAL seconds from 1-minute bars; None if unavailable"""
+    try:
+        bars = ContextInfo.get_market_data(['volume'], stock_code=[CODE_TABLE.to_qmt(code)],
+                                           period='1m', count=5)
+        # bar volume is in lots of 100 shares
+        return float(bars['volume'].mean()) * 100 * SLICE_INTERVAL / 60.0
+    except Exception as e:
+        print('Failed to get recent volume of {}: {}'.format(code, e))
+        return None
+
+def watch_quotes(ContextInfo, codes=()):
+    """
+    Keep tick subscriptions on pending order codes, codes being sliced and held positions;
+    pull stale quotes of the codes about to be priced (codes and sliced orders) once
+    """
+    sliced = set(code for account in accounts if account.slicer is not None for code in account.slicer.codes())
+    pending = set(normalize_stock_code(order['code']) for order in list(open_orders.values()) if order is not None)
+    held = set(code for account in accounts for code in account.positions)
+    quotes.watch(lambda code, callback: ContextInfo.subscribe_quote(
+                     code, period='tick', dividend_type='none', result_type='dict', callback=callback),
+                 ContextInfo.unsubscribe_quote, set(codes) | pending | sliced | held)
+    quotes.refresh(ContextInfo.get_full_tick, set(codes) | sliced)
+
+def order_price(code, direction, db_price, extra_offset=0.0):
+    """Limit price from the fresh counter price +/- offset, within QUOTE_MAX_DEVIATION of the DB price"""
+    return quotes.limit_price(code, direction, db_price, PRICE_OFFSET + extra_offset, QUOTE_MAX_DEVIATION)
+
+def send_order(ContextInfo, account, order_id, uid, code, direction, volume, price, price_type, db_price):
+    """passorder for regular orders; large ones are handed to the account's slicer. Returns True if sliced"""
+    if sliced_order(account, volume):
+        account.slicer.add(order_id, uid, code, direction, volume, db_price)
+        return True
+    passorder(direction, 1101, account.account_id, code, price_type, price, volume, '', QUICK_TRADE, uid, ContextInfo)
+    return False
+
+def sliced_order(account, volume):
+    return account.slicer is not None and SLICE_MIN_VOLUME is not None and volume >= SLICE_MIN_VOLUME
+
 def normalize_stock_code(code):
     """
     Normalize stock code format
     Convert code with suffix (e.g. 603216.SH) to pure number format (e.g. 603216)
     """
     if isinstance(code, str):
-        # Remove suffix if code contains dot
-        if '.' in code:
-            return code.split('.')[0]
-        return code
+        # O(1) lookup in the shared code table (suffix is parsed once per code)
+        return CODE_TABLE.to_bare(code)
     return str(code)
 
 def get_data(query_str):
@@ -123,7 +314,10 @@ def delete_data():
     except Exception as e:
         print('Error: {}'.format(e))
 
-def mark_order_as_executed(order_id):
+def mark_orders_as_executed(order_ids):
+    """Set if_deal = 1 for a batch of submitted (or settled) orders in one round trip"""
+    if not order_ids:
+        return True
     host = "sh-cdb-kgv8etuq.sql.tencentcdb.com"
     port = 23333
     user = "root"
@@ -136,24 +330,43 @@ def mark_order_as_executed(order_id):
                                charset='utf8')
         cursor = conn.cursor()
         
-        update_query = """UPDATE `order`.joinquant_stock SET if_deal = 1 WHERE pk = %s"""
-        cursor.execute(update_query, (order_id,))
-        affected_rows = cursor.rowcount
+        update_query = """UPDATE `order`.joinquant_stock SET if_deal = 1 WHERE pk IN ({})""".format(
+            ', '.join(['%s'] * len(order_ids)))
+        cursor.execute(update_query, tuple(order_ids))
         conn.commit()
         cursor.close()
         conn.close()
-        
-        if affected_rows > 0:
-            print('Order {} marked as executed'.format(order_id))
-            return True
-        else:
-            print('Warning: Order {} not found or already executed'.format(order_id))
-            return False
+        record(MARK, pks=list(order_ids))
+        print('Orders {} marked as executed'.format(', '.join(str(o) for o in order_ids)))
+        return True
     except Exception as e:
+        # Safe to retry: the orders stay pending and the submission index blocks resubmission
         print('Failed to mark order execution status: {}'.format(e))
         return False
 
-def revert_order_status(order_id):
+def flush_pending_marks():
+    """Write the deferred if_deal marks; kept for the next loop if the write fails"""
+    # Group commit: everything journaled so far reaches disk before the database changes
+    if journal is not None:
+        journal.sync()
+    if pending_marks and mark_orders_as_executed(list(pending_marks)):
+        del pending_marks[:]
+        return True
+    return not pending_marks
+
+def settle_orders():
+    """Mark the open orders settled in every account; returns the number marked"""
+    ready = fanout.settled_orders(list(open_orders))
+    pending_marks.extend(pk for pk in ready if pk not in pending_marks)
+    if not flush_pending_marks():
+        return 0
+    fanout.forget(ready)
+    for pk in ready:
+        open_orders.pop(pk, None)
+    return len(ready)
+
+def ensure_fill_columns():
+    """Add the fill reconciliation columns to joinquant_stock if they are missing"""
     host = "sh-cdb-kgv8etuq.sql.tencentcdb.com"
     port = 23333
     user = "root"
@@ -166,14 +379,57 @@ def revert_order_status(order_id):
                                charset='utf8')
         cursor = conn.cursor()
         
-        update_query = """UPDATE `order`.joinquant_stock SET if_deal = 0 WHERE pk = %s"""
-        cursor.execute(update_query, (order_id,))
+        cursor.execute("""SELECT COLUMN_NAME FROM information_schema.COLUMNS
+                          WHERE TABLE_SCHEMA = 'order' AND TABLE_NAME = 'joinquant_stock'""")
+        existing = set(row[0] for row in cursor.fetchall())
+        for name, column_type in FILL_COLUMNS:
+            if name not in existing:
+                cursor.execute('ALTER TABLE `order`.joinquant_stock ADD COLUMN {} {} NULL'.format(name, column_type))
+                print('Added column {} to joinquant_stock'.format(name))
         conn.commit()
         cursor.close()
         conn.close()
-        print('Order {} status reverted to pending'.format(order_id))
     except Exception as e:
-        print('Failed to revert order status: {}'.format(e))
+        print('Failed to check fill columns: {}'.format(e))
+
+def fill_writer(account):
+    """Fill sink of an account: the primary account writes the order table, the others the journal only"""
+    if account is fanout.primary:
+        return lambda rows: write_fill_status(rows, account.account_id)
+    def journal_fills(rows):
+        for fill_qty, fill_price, fill_status, fill_time, pk in rows:
+            record(ACK, acct=account.account_id, pk=pk, status=fill_status, qty=fill_qty, avg_price=fill_price)
+        return True
+    return journal_fills
+
+def write_fill_status(rows, account_id=None):
+    """Batch-write (fill_qty, fill_price, fill_status, fill_time, pk) rows in one round trip"""
+    host = "sh-cdb-kgv8etuq.sql.tencentcdb.com"
+    port = 23333
+    user = "root"
+    password = "Hello2025"
+    database = 'order'
+    
+    try:
+        conn = pymysql.connect(host=host, port=port, user=user,
+                               password=password, database=database,
+                               charset='utf8')
+        cursor = conn.cursor()
+        
+        update_query = """UPDATE `order`.joinquant_stock
+                          SET fill_qty = %s, fill_price = %s, fill_status = %s, fill_time = %s
+                          WHERE pk = %s"""
+        cursor.executemany(update_query, rows)
+        conn.commit()
+        cursor.close()
+        conn.close()
+        for fill_qty, fill_price, fill_status, fill_time, pk in rows:
+            record(ACK, acct=account_id, pk=pk, status=fill_status, qty=fill_qty, avg_price=fill_price)
+        print('Fill status written for {} orders'.format(len(rows)))
+        return True
+    except Exception as e:
+        print('Failed to write fill status: {}'.format(e))
+        return False
 
 def execute_trade_orders(ContextInfo):
     current_time = datetime.now().time()
@@ -184,8 +440,9 @@ def execute_trade_orders(ContextInfo):
     if not (day_start_time <= current_time <= day_end_time):
         return False
     
-    buy_direction = 23
-    sell_direction = 24
+    # Orders settled in every account since the last pass (a slow account finishing in the
+    # background) are marked before the table is read again
+    settle_orders()
     
     query_str = """SELECT * FROM `order`.joinquant_stock WHERE if_deal = 0"""
     
@@ -202,62 +459,68 @@ def execute_trade_orders(ContextInfo):
     print('Found {} pending orders'.format(len(orders_df)))
     
     # Check order quantity limit
-    if len(orders_df) >= 10:
+    # Orders being sliced stay at if_deal = 0 until their slicer finishes and do not count
+    slicing = set(pk for pk in open_orders if any(a.slicing(pk) for a in accounts))
+    if len(orders_df) - int(orders_df['pk'].isin(slicing).sum()) >= 10:
         print('WARNING: Found {} pending orders (>= 10), skipping execution for safety! This may indicate an abnormal batch order situation.'.format(len(orders_df)))
         return False
     
-    position_info = get_trade_detail_data(ContextInfo.accID, 'stock', 'position')
-    position_code = []
-    position_volume = {}
-    if len(position_info) > 0:
-        print('Position info found: {} positions'.format(len(position_info)))
-        for ele in position_info:
-            if ele.m_nVolume > 0:
-                # Print raw code format for debugging
-                print('Position: {} (raw code: {}, volume: {})'.format(
-                    ele.m_strInstrumentName if hasattr(ele, 'm_strInstrumentName') else 'Unknown',
-                    ele.m_strInstrumentID,
-                    ele.m_nVolume
-                ))
-                # Normalize position code format
-                normalized_code = normalize_stock_code(ele.m_strInstrumentID)
-                position_code.append(normalized_code)
-                position_volume[normalized_code] = ele.m_nVolume
+    # Each order is claimed once here and fanned out to every account
+    orders = []
+    for idx, order in orders_df.iterrows():
+        if order.get('pk', None):
+            open_orders[order['pk']] = order
+            orders.append(order)
+        else:
+            print('Warning: Order missing PK, skipping')
     
-    executed_orders = []
+    # Fresh quotes for pricing: ticks are pushed for watched codes, stale ones are pulled here
+    watch_quotes(ContextInfo, [normalize_stock_code(order['code']) for order in orders])
     
     # Separate buy and sell orders
-    sell_orders = []
-    buy_orders = []
+    sell_orders = [order for order in orders if order['ordertype'] == u'\u5356']  # Sell
+    buy_orders = [order for order in orders if order['ordertype'] == u'\u4e70']   # Buy
     
-    for idx, order in orders_df.iterrows():
-        ordertype = order['ordertype']
-        if ordertype == u'\u5356':  # Sell
-            sell_orders.append(order)
-        elif ordertype == u'\u4e70':  # Buy
-            buy_orders.append(order)
-    
-    # Process sell orders first
-    print('Processing {} sell orders first'.format(len(sell_orders)))
-    for order in sell_orders:
-        order_id = process_single_order(order, ContextInfo, position_volume, executed_orders, sell_direction, buy_direction)
+    # Sells of every account first, then buys. Accounts run one after another on this
+    # thread: QMT's trading APIs and ContextInfo are not documented as thread-safe
+    executed_orders = []
+    fanout.dispatch(lambda account, todo: run_account_pass(ContextInfo, account, todo, executed_orders),
+                    sell_orders)
     
     # Wait 3 seconds before processing buy orders
     if len(buy_orders) > 0:
-        print('Waiting 3 seconds before processing buy orders...')
-        time.sleep(3)
-        print('Processing {} buy orders'.format(len(buy_orders)))
-        for order in buy_orders:
-            order_id = process_single_order(order, ContextInfo, position_volume, executed_orders, sell_direction, buy_direction)
-    
+        if sell_orders:
+            print('Waiting 3 seconds before processing buy orders...')
+            if journal is not None:
+                journal.sync()
+            time.sleep(3)
+        fanout.dispatch(lambda account, todo: run_account_pass(ContextInfo, account, todo, executed_orders),
+                        buy_orders)
+    
+    settle_orders()
     return len(executed_orders) > 0
 
-def process_single_order(order, ContextInfo, position_volume, executed_orders, sell_direction, buy_direction):
-    """Process a single order (buy or sell)"""
+def run_account_pass(ContextInfo, account, orders, executed_orders):
+    """Execute one side's orders (all sells or all buys) in one account"""
+    buy_direction = BUY_DIRECTION
+    sell_direction = SELL_DIRECTION
+    
+    # A passorder that raised may still have reached the broker: re-read its order list first
+    account.submission_index.resolve(account.account_id, get_trade_detail_data)
+    
+    position_volume = account.refresh_positions(get_trade_detail_data, normalize_stock_code)
+    print('Account {}: {} positions, processing {} orders'.format(
+        account.account_id, len(position_volume), len(orders)))
+    
+    for order in orders:
+        process_single_order(order, ContextInfo, account, executed_orders, sell_direction, buy_direction)
+
+def process_single_order(order, ContextInfo, account, executed_orders, sell_direction, buy_direction):
+    """Process a single order (buy or sell) in one account"""
     code = order['code']
     # Normalize order stock code
     normalized_code = normalize_stock_code(code)
-    print('Processing order: {} -> normalized: {}'.format(code, normalized_code))
+    print('Processing order: {} -> normalized: {} (account {})'.format(code, normalized_code, account.account_id))
     ordertype = order['ordertype']
     order_values = int(order['order_values'])
     # Use 'pk' as the primary key field
@@ -267,75 +530,106 @@ def process_single_order(order, ContextInfo, position_volume, executed_orders, s
         print('Warning: Order missing PK, skipping')
         return None
     
-    # Mark order as executed BEFORE placing order to prevent duplicates
-    if not mark_order_as_executed(order_id):
-        print('Failed to mark order {} as executed, skipping to prevent duplicates'.format(order_id))
-        return None
-    
-    # Apply execution ratio
+    # The pk-derived broker-side id makes submission idempotent: an order already sent
+    # (before a restart, or whose database mark was lost) is marked again, never resent
+    uid = user_order_id(order_id)
+    if uid in account.submission_index:
+        print('Order {} already submitted as {} in account {}, marking only'.format(
+            order_id, uid, account.account_id))
+        if account.slicer is None or not account.slicer.active(order_id):
+            account.status[order_id] = SUBMITTED
+        return order_id
+    
+    # Apply the account's execution ratio, rounded down to whole lots
     original_order_values = order_values
-    order_values = int(order_values * EXECUTION_RATIO)
-    
-    # Round down to nearest 100
-    order_values = (order_values // 100) * 100
+    order_values = account.scale(order_values)
     
     # Skip if less than 100 shares
     if order_values < 100:
-        print('Order {} skipped: {} shares after ratio adjustment is less than 100'.format(
-            code, int(original_order_values * EXECUTION_RATIO)))
-        # Revert the order status since we're not executing it
-        revert_order_status(order_id)
+        print('Order {} skipped in account {}: {} shares after ratio adjustment is less than 100'.format(
+            code, account.account_id, int(original_order_values * account.ratio)))
+        record(SKIP, acct=account.account_id, pk=order_id)
+        account.status[order_id] = SKIPPED
         return None
     
-    print('Order {} adjusted from {} to {} shares (ratio: {}%)'.format(
-        code, original_order_values, order_values, int(EXECUTION_RATIO * 100)))
+    print('Order {} adjusted from {} to {} shares (account {}, ratio: {}%)'.format(
+        code, original_order_values, order_values, account.account_id, int(account.ratio * 100)))
     
     # Get price from database (JoinQuant's last_price)
     db_price = order.get('price', None)
     if not db_price or db_price <= 0:
         print('ERROR: Invalid price from database: {}, skip order {}'.format(db_price, order_id))
-        revert_order_status(order_id)
         return None
     
     print('JoinQuant last_price from DB: {}'.format(db_price))
     
+    position_volume = account.positions
+    fill_tracker = account.fill_tracker
     try:
         if ordertype == u'\u4e70':  # Buy
             if order_values > 0:
-                # Calculate buy price: DB_price * (1 + PRICE_OFFSET)
-                buy_price = round(db_price * (1 + PRICE_OFFSET), 2)
-                print('Buy order: DB_price={}, calculated buy_price={} (+{}%)'.format(
-                    db_price, buy_price, PRICE_OFFSET*100))
+                # Calculate buy price: ask * (1 + PRICE_OFFSET), bounded by the DB price
+                buy_price = order_price(normalized_code, buy_direction, db_price)
+                print('Buy order: DB_price={}, quote={}, calculated buy_price={} (+{}%)'.format(
+                    db_price, quotes.get(normalized_code), buy_price, PRICE_OFFSET*100))
                 
-                result = passorder(buy_direction, 1101, ContextInfo.accID, normalized_code, 
-                                 BUY_PRICE_TYPE, buy_price, order_values, '', QUICK_TRADE, '', ContextInfo)
-                print('Execute buy order: {} x {} shares @ {} (prType={})'.format(
-                    normalized_code, order_values, buy_price, BUY_PRICE_TYPE))
+                sliced = sliced_order(account, order_values)
+                record(CLAIM, acct=account.account_id, pk=order_id, uid=uid, code=normalized_code,
+                       direction=buy_direction, volume=order_values, price=buy_price, base_price=db_price,
+                       sliced=sliced)
+                send_order(ContextInfo, account, order_id, uid, normalized_code, buy_direction,
+                           order_values, buy_price, BUY_PRICE_TYPE, db_price)
+                record(SUBMIT, acct=account.account_id, pk=order_id)
+                account.submission_index.add(uid)
+                # A sliced order is settled when its slicer finishes (slice_done)
+                account.status[order_id] = SLICING if sliced else SUBMITTED
+                print('Execute buy order [{}]: {} x {} shares @ {} (prType={}, id={}{})'.format(
+                    account.account_id, normalized_code, order_values, buy_price, BUY_PRICE_TYPE, uid,
+                    ', sliced' if sliced else ''))
                 executed_orders.append(order_id)
+                if fill_tracker is not None and not sliced:
+                    fill_tracker.register(order_id, normalized_code, buy_direction, order_values, buy_price, uid)
         
         elif ordertype == u'\u5356':  # Sell
             # Use normalized code to check position
             if normalized_code in position_volume and position_volume[normalized_code] > 0:
                 sell_amount = min(order_values, position_volume[normalized_code])
                 if sell_amount > 0:
-                    # Calculate sell price: DB_price * (1 - PRICE_OFFSET)
-                    sell_price = round(db_price * (1 - PRICE_OFFSET), 2)
-                    print('Sell order: DB_price={}, calculated sell_price={} (-{}%)'.format(
-                        db_price, sell_price, PRICE_OFFSET*100))
+                    # Calculate sell price: bid * (1 - PRICE_OFFSET), bounded by the DB price
+                    sell_price = order_price(normalized_code, sell_direction, db_price)
+                    print('Sell order: DB_price={}, quote={}, calculated sell_price={} (-{}%)'.format(
+                        db_price, quotes.get(normalized_code), sell_price, PRICE_OFFSET*100))
                     
-                    result = passorder(sell_direction, 1101, ContextInfo.accID, normalized_code, 
-                                     SELL_PRICE_TYPE, sell_price, sell_amount, '', QUICK_TRADE, '', ContextInfo)
-                    print('Execute sell order: {} x {} shares @ {} (prType={})'.format(
-                        normalized_code, sell_amount, sell_price, SELL_PRICE_TYPE))
+                    sliced = sliced_order(account, sell_amount)
+                    record(CLAIM, acct=account.account_id, pk=order_id, uid=uid, code=normalized_code,
+                           direction=sell_direction, volume=sell_amount, price=sell_price, base_price=db_price,
+                           sliced=sliced)
+                    send_order(ContextInfo, account, order_id, uid, normalized_code, sell_direction,
+                               sell_amount, sell_price, SELL_PRICE_TYPE, db_price)
+                    record(SUBMIT, acct=account.account_id, pk=order_id)
+                    account.submission_index.add(uid)
+                    account.status[order_id] = SLICING if sliced else SUBMITTED
+                    print('Execute sell order [{}]: {} x {} shares @ {} (prType={}, id={}{})'.format(
+                        account.account_id, normalized_code, sell_amount, sell_price, SELL_PRICE_TYPE, uid,
+                        ', sliced' if sliced else ''))
                     executed_orders.append(order_id)
                     position_volume[normalized_code] -= sell_amount
+                    if fill_tracker is not None and not sliced:
+                        fill_tracker.register(order_id, normalized_code, sell_direction, sell_amount, sell_price, uid)
             else:
-                print('Warning: Insufficient position for {} (normalized: {}) to sell {} shares'.format(code, normalized_code, order_values))
+                print('Warning: Insufficient position in account {} for {} (normalized: {}) to sell {} shares'.format(
+                    account.account_id, code, normalized_code, order_values))
+                # Nothing to sell: settle the order in this account so it is not picked up again
+                record(SKIP, acct=account.account_id, pk=order_id)
+                account.status[order_id] = SKIPPED
         
     except Exception as e:
-        print('Failed to execute order {} (normalized: {}): {}'.format(code, normalized_code, e))
-        # If order execution failed, try to revert the database status
-        revert_order_status(order_id)
+        print('Failed to execute order {} (normalized: {}) in account {}: {}'.format(
+            code, normalized_code, account.account_id, e))
+        # The order stays pending; the broker order list is checked before it is retried
+        record(ERROR, acct=account.account_id, pk=order_id, message=str(e))
+        account.submission_index.mark_uncertain(uid)
+        account.status[order_id] = ACCOUNT_ERROR
     
     return order_id
 
@@ -350,6 +644,23 @@ def start_continuous_monitoring(ContextInfo):
             if execute_trade_orders(ContextInfo):
                 print('Trade orders executed')
             
+            # Children are re-priced from live quotes: keep the codes being sliced fresh on every
+            # pass, not only when new orders arrive
+            if any(account.slicer is not None and len(account.slicer) for account in accounts):
+                watch_quotes(ContextInfo)
+            
+            # Callbacks can lag behind the blocking loop; poll and write back fills here
+            for account in accounts:
+                account.fill_tracker.tick(account.account_id, get_trade_detail_data)
+                # One scheduler step per account advances every sliced order at once
+                if account.slicer is not None:
+                    account.slicer.tick()
+            
+            # Pass boundary: what this pass journaled (slicer children, errors) reaches disk
+            # before the loop sleeps; append() itself does not fsync on a timer
+            if journal is not None:
+                journal.sync()
+            
             time.sleep(2)
             
         except KeyboardInterrupt:
@@ -359,6 +670,24 @@ def start_continuous_monitoring(ContextInfo):
             print('Error during monitoring: {}'.format(e))
             time.sleep(5)
 
+def order_callback(ContextInfo, orderInfo):
+    """Broker order status update"""
+    fill_tracker = fanout.account_for(orderInfo).fill_tracker
+    if fill_tracker is not None:
+        fill_tracker.on_order(orderInfo)
+
+def deal_callback(ContextInfo, dealInfo):
+    """Broker trade report"""
+    fill_tracker = fanout.account_for(dealInfo).fill_tracker
+    if fill_tracker is not None:
+        fill_tracker.on_deal(dealInfo)
+
+def orderError_callback(ContextInfo, orderArgs, errMsg):
+    """Order rejected before reaching the exchange"""
+    fill_tracker = fanout.account_for(orderArgs).fill_tracker
+    if fill_tracker is not None:
+        fill_tracker.on_error(orderArgs, errMsg)
+
 def handlebar(ContextInfo):
     pass
 
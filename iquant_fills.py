@@ -0,0 +1,281 @@
+"""
+Fill reconciliation for the iQuant executor
+
+Every order handed to passorder is registered with a FillTracker under its
+database pk. Broker updates arrive through iQuant's order_callback /
+deal_callback / orderError_callback; because the executor runs a blocking
+monitoring loop the callbacks may be delayed, so tick() also polls
+get_trade_detail_data(accID, 'stock', 'order' / 'deal') while orders are open.
+
+Each tracked order ends up as one of:
+    submitted -> partial -> filled / cancelled / rejected
+Changed orders are collected and written back in one batch (fill_qty,
+fill_price, fill_status, fill_time) through the writer callable, at most once
+per flush_interval seconds. Orders in a final state are dropped after they have
+been written.
+
+Broker orders are matched to pks by broker order id once known, then by the
+remark (userOrderId) when it carries the pk, and otherwise by the oldest
+unmatched submission with the same code, direction and volume.
+
+Orders are registered and polled on the strategy thread, but QMT may deliver
+callbacks from its own thread, so all state changes hold the tracker lock.
+"""
+import threading
+import time
+from datetime import datetime
+
+from code_table import shared_code_table
+
+CODE_TABLE = shared_code_table()
+
+SUBMITTED = 'submitted'
+PARTIAL = 'partial'
+FILLED = 'filled'
+CANCELLED = 'cancelled'
+REJECTED = 'rejected'
+FINAL_STATES = (FILLED, CANCELLED, REJECTED)
+
+# m_nOrderStatus values (EEntrustStatus)
+ORDER_STATUS = {
+    48: SUBMITTED,  # not reported
+    49: SUBMITTED,  # waiting to report
+    50: SUBMITTED,  # reported
+    51: SUBMITTED,  # reported, cancel pending
+    52: PARTIAL,    # partially filled, cancel pending
+    53: CANCELLED,  # partially filled then cancelled
+    54: CANCELLED,  # cancelled
+    55: PARTIAL,    # partially filled
+    56: FILLED,     # filled
+    57: REJECTED,   # rejected (junk order)
+}
+
+BUY_DIRECTION = 23
+SELL_DIRECTION = 24
+# m_nOffsetFlag for stock orders and deals
+OFFSET_DIRECTION = {48: BUY_DIRECTION, 49: SELL_DIRECTION}
+
+
+class TrackedOrder(object):
+    __slots__ = ('pk', 'code', 'direction', 'volume', 'price', 'submitted_at', 'remark', 'broker_id',
+                 'order_qty', 'order_amount', 'deal_qty', 'deal_amount', 'status', 'deal_ids',
+                 'updated_at', 'dirty')
+
+    def __init__(self, pk, code, direction, volume, price, submitted_at):
+        self.pk = pk
+        self.code = code
+        self.direction = direction
+        self.volume = volume
+        self.price = price
+        self.submitted_at = submitted_at
+        self.remark = None
+        self.broker_id = None
+        # cumulative fill as reported by the order itself and as summed from deals;
+        # the two sources overlap, the larger one is taken
+        self.order_qty = 0
+        self.order_amount = 0.0
+        self.deal_qty = 0
+        self.deal_amount = 0.0
+        self.status = SUBMITTED
+        self.deal_ids = set()
+        self.updated_at = submitted_at
+        self.dirty = True
+
+    @property
+    def filled(self):
+        return max(self.order_qty, self.deal_qty)
+
+    @property
+    def avg_price(self):
+        if self.deal_qty >= self.order_qty:
+            qty, amount = self.deal_qty, self.deal_amount
+        else:
+            qty, amount = self.order_qty, self.order_amount
+        return round(amount / qty, 4) if qty else None
+
+    @property
+    def final(self):
+        return self.status in FINAL_STATES
+
+    def row(self):
+        """Values for the batch UPDATE: (fill_qty, fill_price, fill_status, fill_time, pk)"""
+        return (self.filled, self.avg_price, self.status, self.updated_at, self.pk)
+
+
+def _attr(obj, name, default=None):
+    value = getattr(obj, name, default)
+    return default if value in (None, '') else value
+
+
+class FillTracker(object):
+    """
+    Follow submitted orders to their final state
+    writer: callable receiving a list of row() tuples; returns True when written
+    """
+
+    def __init__(self, writer, flush_interval=5.0, poll_interval=10.0, clock=time.time):
+        self.writer = writer
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.clock = clock
+        self.orders = {}        # pk -> TrackedOrder
+        self.by_broker_id = {}  # broker order id -> TrackedOrder
+        self.retired = set()    # broker ids of orders already written in a final state
+        self.by_remark = {}     # userOrderId -> TrackedOrder
+        self.lock = threading.RLock()
+        self.last_flush = 0.0
+        self.last_poll = 0.0
+
+    def register(self, pk, code, direction, volume, price, remark=None):
+        """remark: the userOrderId passed to passorder, echoed by the broker as m_strRemark"""
+        order = TrackedOrder(str(pk), CODE_TABLE.to_bare(code), direction, int(volume), price, datetime.now())
+        with self.lock:
+            self.orders[order.pk] = order
+            if remark:
+                order.remark = remark
+                self.by_remark[remark] = order
+        return order
+
+    def open_orders(self):
+        with self.lock:
+            return [o for o in self.orders.values() if not o.final]
+
+    # ---------- matching ----------
+
+    def _match(self, broker_obj):
+        broker_id = _attr(broker_obj, 'm_strOrderSysID')
+        if broker_id is not None:
+            if broker_id in self.by_broker_id:
+                return self.by_broker_id[broker_id]
+            if broker_id in self.retired:
+                return None
+        remark = str(_attr(broker_obj, 'm_strRemark', ''))
+        order = self.by_remark.get(remark) or self.orders.get(remark)
+        if order is None and not remark:
+            # Only an order without a remark is matched by code/direction/volume: a remark this
+            # tracker never registered (slicer child, another account, manual order) is not ours
+            code = CODE_TABLE.to_bare(str(_attr(broker_obj, 'm_strInstrumentID', '')))
+            direction = OFFSET_DIRECTION.get(_attr(broker_obj, 'm_nOffsetFlag'))
+            volume = _attr(broker_obj, 'm_nVolumeTotalOriginal')
+            candidates = [o for o in self.orders.values()
+                          if o.broker_id is None and o.code == code
+                          and (direction is None or o.direction == direction)
+                          and (volume is None or o.volume == volume)]
+            order = min(candidates, key=lambda o: o.submitted_at) if candidates else None
+        if order is not None and broker_id is not None and order.broker_id is None:
+            order.broker_id = broker_id
+            self.by_broker_id[broker_id] = order
+        return order
+
+    def _set_status(self, order, status):
+        if order.final or status == order.status:
+            return
+        order.status = status
+        order.updated_at = datetime.now()
+        order.dirty = True
+
+    # ---------- broker events ----------
+
+    def on_order(self, broker_order):
+        """order_callback / polled order: cumulative traded volume, average price and status"""
+        with self.lock:
+            return self._on_order(broker_order)
+
+    def _on_order(self, broker_order):
+        order = self._match(broker_order)
+        if order is None:
+            return None
+        traded = int(_attr(broker_order, 'm_nVolumeTraded', 0))
+        if traded > order.order_qty:
+            order.order_qty = traded
+            order.order_amount = traded * float(_attr(broker_order, 'm_dTradedPrice', order.price))
+            order.updated_at = datetime.now()
+            order.dirty = True
+        status = ORDER_STATUS.get(_attr(broker_order, 'm_nOrderStatus'))
+        if status is not None:
+            self._set_status(order, status)
+        return order
+
+    def on_deal(self, deal):
+        """deal_callback / polled deal: add the trade once per trade id"""
+        with self.lock:
+            return self._on_deal(deal)
+
+    def _on_deal(self, deal):
+        order = self._match(deal)
+        if order is None:
+            return None
+        trade_id = _attr(deal, 'm_strTradeID')
+        if trade_id is not None and trade_id in order.deal_ids:
+            return order
+        if trade_id is not None:
+            order.deal_ids.add(trade_id)
+        volume = int(_attr(deal, 'm_nVolume', 0))
+        order.deal_qty += volume
+        order.deal_amount += volume * float(_attr(deal, 'm_dPrice', order.price))
+        order.updated_at = datetime.now()
+        order.dirty = True
+        if not order.final:
+            order.status = FILLED if order.filled >= order.volume else PARTIAL
+        return order
+
+    def on_error(self, pk_or_args, message=''):
+        """
+        orderError_callback or a failed passorder: the order never reached the exchange
+        pk_or_args: the order pk, or the order arguments passed to orderError_callback
+        """
+        with self.lock:
+            if isinstance(pk_or_args, str):
+                order = self.orders.get(pk_or_args)
+            else:
+                order = self._match(pk_or_args)
+            if order is not None:
+                print('Order {} rejected: {}'.format(order.pk, message))
+                self._set_status(order, REJECTED)
+        return order
+
+    # ---------- polling and write-back ----------
+
+    def poll(self, account_id, get_trade_detail_data):
+        """Pull today's orders and deals of the account from the broker and apply them"""
+        self.last_poll = self.clock()
+        broker_orders = get_trade_detail_data(account_id, 'stock', 'order') or []
+        deals = get_trade_detail_data(account_id, 'stock', 'deal') or []
+        with self.lock:
+            for broker_order in broker_orders:
+                self.on_order(broker_order)
+            for deal in deals:
+                self.on_deal(deal)
+
+    def flush(self):
+        """Write every changed order in one batch; drop written orders in a final state"""
+        self.last_flush = self.clock()
+        with self.lock:
+            dirty = [o for o in self.orders.values() if o.dirty]
+            rows = [o.row() for o in dirty]
+        if not dirty:
+            return 0
+        if not self.writer(rows):
+            return 0
+        with self.lock:
+            for order, row in zip(dirty, rows):
+                if order.row() != row:
+                    # changed again while being written; keep it for the next flush
+                    continue
+                order.dirty = False
+                if order.final:
+                    del self.orders[order.pk]
+                    self.by_remark.pop(order.remark, None)
+                    if order.broker_id is not None:
+                        del self.by_broker_id[order.broker_id]
+                        self.retired.add(order.broker_id)
+        return len(dirty)
+
+    def tick(self, account_id, get_trade_detail_data):
+        """Call from the monitoring loop: poll while orders are open, flush when due"""
+        now = self.clock()
+        if self.open_orders() and now - self.last_poll >= self.poll_interval:
+            self.poll(account_id, get_trade_detail_data)
+        if now - self.last_flush >= self.flush_interval:
+            self.flush()
+
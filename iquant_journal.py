@@ -0,0 +1,167 @@
+"""
+Append-only write-ahead journal for the iQuant executor
+
+Every order transition is appended to a per-day journal file before the
+executor moves on:
+    claim   order picked up, about to be sent (pk, user order id, code, side, volume, price,
+            DB price, whether it is handed to the slicer)
+    submit  passorder returned
+    error   passorder raised; the broker may or may not have the order
+    skip    nothing to send in the account (below one lot, no position to sell)
+    mark    if_deal = 1 written to the database (a list of pks)
+    ack     broker outcome written back (fill status, quantity, average price)
+
+Writes are buffered under a lock (broker callbacks may append from another
+thread) and fsync'ed in groups: the executor calls sync() at pass boundaries
+(before the sell/buy wait, before writing if_deal marks, at the end of each
+monitoring loop pass), and append() syncs only when sync_every records have
+built up, never on a timer, so claims are not fsync'ed one by one ahead of their
+passorder calls.
+A crash can lose only the unsynced tail; since user order ids are derived from
+pks, the broker's order list recovers anything the tail would have said about
+submissions.
+
+Per-account records carry the account id (acct). replay() folds the journal
+into one OrderState per (account, pk); a mark applies to the order in every
+account. A truncated last line is ignored. Old journal files are removed when a new day's journal is opened.
+"""
+import json
+import os
+import threading
+from datetime import datetime
+
+CLAIM = 'claim'
+SUBMIT = 'submit'
+ERROR = 'error'
+SKIP = 'skip'
+MARK = 'mark'
+ACK = 'ack'
+
+
+class OrderState(object):
+    __slots__ = ('account', 'pk', 'uid', 'code', 'direction', 'volume', 'price', 'base_price',
+                 'submitted', 'errored', 'skipped', 'marked', 'status', 'fill_qty', 'fill_price', 'sliced')
+
+    def __init__(self, account, pk):
+        self.account = account
+        self.pk = pk
+        self.uid = None
+        self.code = None
+        self.direction = None
+        self.volume = None
+        self.price = None
+        self.base_price = None
+        self.submitted = False
+        self.errored = False
+        self.skipped = False
+        self.marked = False
+        self.status = None
+        self.fill_qty = None
+        self.fill_price = None
+        self.sliced = False
+
+
+class Journal(object):
+    """
+    directory: where journal_YYYYMMDD.log files are kept
+    sync_every: records buffered before append() syncs on its own
+    keep_days: number of daily files kept (today's included)
+    """
+
+    def __init__(self, directory, sync_every=32, keep_days=5):
+        self.directory = directory
+        self.sync_every = sync_every
+        self.keep_days = keep_days
+        self.unsynced = 0
+        self.lock = threading.Lock()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = os.path.join(directory, 'journal_{}.log'.format(datetime.now().strftime('%Y%m%d')))
+        self._prune()
+        self._file = open(self.path, 'a', encoding='utf-8')
+        if self._file.tell() > 0:
+            # terminate a line torn by a crash so the next record starts cleanly
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')
+
+    def _prune(self):
+        today = os.path.basename(self.path)
+        old = sorted(n for n in os.listdir(self.directory)
+                     if n.startswith('journal_') and n.endswith('.log') and n != today)
+        for name in old[:max(len(old) - (self.keep_days - 1), 0)]:
+            os.remove(os.path.join(self.directory, name))
+
+    # ---------- writing ----------
+
+    def append(self, event, **fields):
+        fields['ev'] = event
+        fields['ts'] = datetime.now().strftime('%H:%M:%S.%f')
+        line = json.dumps(fields, ensure_ascii=False, default=str) + '\n'
+        with self.lock:
+            self._file.write(line)
+            self.unsynced += 1
+            if self.unsynced >= self.sync_every:
+                self._sync()
+
+    def sync(self):
+        """Flush buffered records and fsync them to disk"""
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        if self.unsynced:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.unsynced = 0
+
+    def close(self):
+        with self.lock:
+            self._sync()
+            self._file.close()
+
+    # ---------- recovery ----------
+
+    def replay(self):
+        """Fold today's journal into {(account, pk): OrderState}"""
+        with self.lock:
+            self._file.flush()
+        states = {}
+        marked = set()
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # truncated by a crash mid-write
+                    continue
+                event = record.get('ev')
+                if event == MARK:
+                    marked.update(record.get('pks', []))
+                    continue
+                pk = record.get('pk')
+                if pk is None:
+                    continue
+                key = (record.get('acct'), pk)
+                state = states.get(key)
+                if state is None:
+                    state = states[key] = OrderState(*key)
+                if event == CLAIM:
+                    for name in ('uid', 'code', 'direction', 'volume', 'price', 'base_price'):
+                        setattr(state, name, record.get(name))
+                    state.sliced = bool(record.get('sliced'))
+                elif event == SUBMIT:
+                    state.submitted = True
+                elif event == ERROR:
+                    state.errored = True
+                elif event == SKIP:
+                    state.skipped = True
+                elif event == ACK:
+                    state.status = record.get('status')
+                    state.fill_qty = record.get('qty')
+                    state.fill_price = record.get('avg_price')
+        for state in states.values():
+            state.marked = state.pk in marked
+        return states
+
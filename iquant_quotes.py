@@ -0,0 +1,147 @@
+"""
+Live quote cache for the iQuant executor
+
+Limit prices used to come only from the DB price (JoinQuant's last_price at
+signal time), which can be seconds to minutes old when the executor acts. The
+QuoteCache keeps the latest bid1 / ask1 / last price of every watched code in
+numpy arrays (one row per code, looked up through a dict), fed by
+ContextInfo.subscribe_quote tick pushes and, for codes whose quote is missing or
+older than max_age, by one batched get_full_tick pull before pricing.
+
+watch() keeps subscriptions in step with the codes that matter (pending orders
+and positions): new codes are subscribed, codes no longer needed are
+unsubscribed.
+
+limit_price() prices an order from a fresh quote: the counter side (ask for
+buys, bid for sells; last price when that side is empty, e.g. at a price limit)
+plus or minus the offset. The DB price stays the sanity bound: the result is
+clamped to within max_deviation of it, and without a fresh quote the DB price
+itself is used, as before.
+"""
+import threading
+import time
+
+import numpy as np
+
+from code_table import shared_code_table
+from iquant_fills import BUY_DIRECTION
+
+CODE_TABLE = shared_code_table()
+
+
+def _first(value):
+    """bidPrice / askPrice come as five-level lists; level 1 is the first"""
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else 0.0
+    return value or 0.0
+
+
+class QuoteCache(object):
+    """
+    max_age: seconds after which a quote is considered stale
+    capacity: initial number of rows; the table doubles when full
+    """
+
+    def __init__(self, max_age=10, capacity=256, clock=time.time):
+        self.max_age = max_age
+        self.clock = clock
+        self.table = np.zeros((capacity, 4), dtype=np.float64)  # bid, ask, last, update time
+        self.rows = {}           # bare code -> row
+        self.subscriptions = {}  # bare code -> subscription id
+        self.stats = {'fresh': 0, 'stale': 0, 'clamped': 0, 'pulled': 0}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _row(self, code):
+        """Row of a code, added on first use; called with the lock held"""
+        row = self.rows.get(code)
+        if row is None:
+            row = len(self.rows)
+            if row >= len(self.table):
+                self.table = np.vstack([self.table, np.zeros_like(self.table)])
+            self.rows[code] = row
+        return row
+
+    # ---------- updates ----------
+
+    def update(self, code, bid, ask, last, ts=None):
+        values = (bid or 0.0, ask or 0.0, last or 0.0, self.clock() if ts is None else ts)
+        code = CODE_TABLE.to_bare(code)
+        # the row write must not land in a table being replaced by a concurrent vstack
+        with self.lock:
+            row = self._row(code)
+            self.table[row] = values
+
+    def on_tick(self, data):
+        """subscribe_quote callback / get_full_tick result: {code: tick dict}"""
+        for code, tick in (data or {}).items():
+            self.update(code, _first(tick.get('bidPrice')), _first(tick.get('askPrice')),
+                        tick.get('lastPrice'))
+
+    def refresh(self, get_full_tick, codes):
+        """Pull one snapshot for the codes whose quote is missing or stale"""
+        stale = [CODE_TABLE.to_qmt(c) for c in codes if self.get(c) is None]
+        if not stale:
+            return 0
+        try:
+            self.on_tick(get_full_tick(stale))
+        except Exception as e:
+            print('Failed to pull ticks for {} codes: {}'.format(len(stale), e))
+            return 0
+        self.stats['pulled'] += len(stale)
+        return len(stale)
+
+    def watch(self, subscribe, unsubscribe, codes):
+        """Subscribe the codes not yet watched, unsubscribe the ones no longer needed"""
+        wanted = set(CODE_TABLE.to_bare(c) for c in codes)
+        for code in wanted - set(self.subscriptions):
+            try:
+                self.subscriptions[code] = subscribe(CODE_TABLE.to_qmt(code), self.on_tick)
+            except Exception as e:
+                print('Failed to subscribe quotes of {}: {}'.format(code, e))
+        for code in set(self.subscriptions) - wanted:
+            sub_id = self.subscriptions.pop(code)
+            try:
+                unsubscribe(sub_id)
+            except Exception as e:
+                print('Failed to unsubscribe quotes of {}: {}'.format(code, e))
+
+    # ---------- reads ----------
+
+    def get(self, code):
+        """(bid, ask, last) if the quote is fresh, else None"""
+        with self.lock:
+            row = self.rows.get(CODE_TABLE.to_bare(code))
+            if row is None:
+                return None
+            bid, ask, last, ts = self.table[row]
+        if self.clock() - ts > self.max_age or (bid <= 0 and ask <= 0 and last <= 0):
+            return None
+        return float(bid), float(ask), float(last)
+
+    def limit_price(self, code, direction, reference, offset, max_deviation):
+        """
+        Limit price from the fresh quote's counter side +/- offset, clamped to
+        reference * (1 +/- max_deviation); reference +/- offset without a fresh quote
+        """
+        buy = direction == BUY_DIRECTION
+        base = reference
+        quote = self.get(code)
+        if quote is None:
+            self.stats['stale'] += 1
+        else:
+            self.stats['fresh'] += 1
+            bid, ask, last = quote
+            side = ask if buy else bid
+            base = side if side > 0 else (last if last > 0 else reference)
+        price = base * (1 + offset) if buy else base * (1 - offset)
+        low, high = reference * (1 - max_deviation), reference * (1 + max_deviation)
+        if not low <= price <= high:
+            self.stats['clamped'] += 1
+            print('Quote price {:.3f} of {} outside {:.0%} of DB price {}, bounded'.format(
+                price, code, max_deviation, reference))
+            price = min(max(price, low), high)
+        return round(float(price), 2)
+
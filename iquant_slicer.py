@@ -0,0 +1,340 @@
+"""
+Order slicing for the iQuant executor
+
+Large parent orders are split into child limit orders over a horizon instead of
+being sent as one order at the DB price, so micro/small-cap rebalances do not
+take out several price levels at once.
+
+Schedules:
+    twap            equal slices every `interval` seconds across `horizon`
+    participation   the TWAP schedule, but each child is capped at `participation`
+                    times the market volume of the last interval (recent_volume)
+
+A SliceScheduler holds every parent of one account and advances them together in
+tick(): one broker order query updates all children, then for each parent
+    - a child resting longer than reprice_after is cancelled; its unfilled
+      remainder returns to the parent and is re-sent one price step more
+      aggressive (at most max_steps steps from the base price)
+    - a child the broker has not listed by then (passorder failed or is slow to
+      show up) stays committed; only when it is still missing from the order list
+      reprice_after seconds later is its quantity given back. If it turns up
+      after that, it is cancelled at once
+    - the next slice is released when the parent is behind its schedule
+After horizon + grace seconds the remaining children are cancelled and the
+parent finishes with what has filled; on_done(parent) is then called, and only
+then is the order settled (if_deal = 1) by the executor.
+
+After a restart resume() rebuilds a parent from its children in the broker
+order list and re-queues the rest over a new horizon.
+
+Child user order ids are the parent id plus a sequence number (child_order_id),
+so SubmissionIndex recognises a parent from any of its children after a restart.
+Parent fills are reported through writer() as the rows FillTracker writes:
+(fill_qty, fill_price, fill_status, fill_time, pk).
+"""
+import math
+import threading
+import time
+from datetime import datetime
+
+from iquant_dedupe import child_order_id, CHILD_SEPARATOR
+from iquant_fills import (ORDER_STATUS, BUY_DIRECTION, SUBMITTED, PARTIAL, FILLED, CANCELLED, REJECTED,
+                          FINAL_STATES)
+
+TWAP = 'twap'
+PARTICIPATION = 'participation'
+
+LOT_SIZE = 100
+
+
+def lots(volume):
+    return int(volume) // LOT_SIZE * LOT_SIZE
+
+
+class Child(object):
+    __slots__ = ('uid', 'volume', 'price', 'sent_at', 'broker_id', 'filled', 'avg_price', 'status',
+                 'cancelling', 'missing_since', 'abandoned')
+
+    def __init__(self, uid, volume, price, sent_at):
+        self.uid = uid
+        self.volume = volume
+        self.price = price
+        self.sent_at = sent_at
+        self.broker_id = None
+        self.filled = 0
+        self.avg_price = 0.0
+        self.status = SUBMITTED
+        self.cancelling = False
+        self.missing_since = None
+        self.abandoned = False
+
+    @property
+    def live(self):
+        return self.status not in FINAL_STATES
+
+
+class Parent(object):
+    __slots__ = ('pk', 'uid', 'code', 'direction', 'volume', 'base_price', 'start', 'children', 'seq',
+                 'step', 'done', 'dirty', 'updated_at')
+
+    def __init__(self, pk, uid, code, direction, volume, base_price, start):
+        self.pk = pk
+        self.uid = uid
+        self.code = code
+        self.direction = direction
+        self.volume = int(volume)
+        self.base_price = base_price
+        self.start = start
+        self.children = []
+        self.seq = 0
+        self.step = 0
+        self.done = False
+        self.dirty = False
+        self.updated_at = datetime.now()
+
+    @property
+    def filled(self):
+        return sum(c.filled for c in self.children)
+
+    @property
+    def committed(self):
+        """Filled plus resting quantity: what the schedule has already used"""
+        return sum(c.volume if c.live else c.filled for c in self.children)
+
+    @property
+    def avg_price(self):
+        filled = self.filled
+        if not filled:
+            return None
+        return round(sum(c.filled * c.avg_price for c in self.children) / filled, 4)
+
+    @property
+    def status(self):
+        filled = self.filled
+        if filled >= self.volume:
+            return FILLED
+        if self.done:
+            if self.children and all(c.status == REJECTED for c in self.children):
+                return REJECTED
+            return CANCELLED
+        return PARTIAL if filled else SUBMITTED
+
+    def row(self):
+        return (self.filled, self.avg_price, self.status, self.updated_at.strftime('%Y-%m-%d %H:%M:%S'),
+                self.pk)
+
+
+class SliceScheduler(object):
+    """
+    place(parent, child): send a child order (passorder with child.uid as userOrderId)
+    cancel(child): cancel a child by child.broker_id
+    query(): today's broker orders of the account
+    writer(rows): write parent fill rows; returns True when written
+    recent_volume(code): market volume of the last interval, for the participation cap (None: no cap)
+    price(parent, step): limit price of a child; defaults to base price +/- offset + step * reprice_step
+    on_done(parent): called when a parent finishes
+    """
+
+    def __init__(self, place, cancel, query, writer=None, schedule=TWAP, horizon=600, interval=30,
+                 participation=0.1, recent_volume=None, reprice_after=20, reprice_step=0.001, max_steps=5,
+                 price_offset=0.002, grace=60, flush_interval=5, price=None, on_done=None, clock=time.time):
+        self.place = place
+        self.cancel = cancel
+        self.query = query
+        self.writer = writer
+        self.on_done = on_done
+        self.schedule = schedule
+        self.horizon = horizon
+        self.interval = interval
+        self.participation = participation
+        self.recent_volume = recent_volume
+        self.reprice_after = reprice_after
+        self.reprice_step = reprice_step
+        self.max_steps = max_steps
+        self.price_offset = price_offset
+        self.grace = grace
+        self.flush_interval = flush_interval
+        self.price = price or self.limit_price
+        self.clock = clock
+        self.parents = {}    # pk -> Parent
+        self.by_uid = {}     # child uid -> (Parent, Child)
+        self.last_flush = clock()
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.parents)
+
+    def add(self, pk, uid, code, direction, volume, base_price):
+        """Take over a parent order; its first slice goes out on the next tick"""
+        with self.lock:
+            parent = Parent(pk, uid, code, direction, volume, base_price, self.clock())
+            self.parents[pk] = parent
+            return parent
+
+    def resume(self, pk, uid, code, direction, volume, base_price, broker_orders):
+        """
+        Rebuild a parent after a restart: its children are taken from today's broker
+        orders (filled and resting quantity counts as sent), the rest is re-queued
+        """
+        prefix = uid + CHILD_SEPARATOR
+        found = []
+        for broker_order in broker_orders:
+            remark = str(getattr(broker_order, 'm_strRemark', '') or '')
+            if remark.startswith(prefix):
+                found.append((int(remark[len(prefix):]), remark, broker_order))
+        with self.lock:
+            parent = self.add(pk, uid, code, direction, volume, base_price)
+            for seq, remark, broker_order in sorted(found, key=lambda item: item[0]):
+                child = Child(remark, int(broker_order.m_nVolumeTotalOriginal),
+                              float(getattr(broker_order, 'm_dLimitPrice', base_price)), parent.start)
+                parent.children.append(child)
+                parent.seq = max(parent.seq, seq)
+                self.by_uid[remark] = (parent, child)
+            self.refresh([item[2] for item in found])
+            return parent
+
+    def active(self, pk):
+        """True while the parent is being worked"""
+        parent = self.parents.get(pk)
+        return parent is not None and not parent.done
+
+    def codes(self):
+        """Codes of the parents being worked"""
+        return set(p.code for p in list(self.parents.values()) if not p.done)
+
+    def limit_price(self, parent, step):
+        offset = self.price_offset + step * self.reprice_step
+        if parent.direction == BUY_DIRECTION:
+            return round(parent.base_price * (1 + offset), 2)
+        return round(parent.base_price * (1 - offset), 2)
+
+    def target(self, parent, elapsed):
+        """Cumulative quantity the schedule allows after elapsed seconds"""
+        slices = max(int(math.ceil(float(self.horizon) / self.interval)), 1)
+        released = min(int(elapsed // self.interval) + 1, slices)
+        if released >= slices:
+            return parent.volume
+        return lots(parent.volume * released / slices)
+
+    # ---------- scheduler loop ----------
+
+    def tick(self):
+        """Advance every parent: refresh children, re-price stale ones, release due slices"""
+        with self.lock:
+            now = self.clock()
+            if any(c.live or (c.abandoned and not c.cancelling)
+                   for p in self.parents.values() if not p.done for c in p.children):
+                self.refresh(self.query() or [])
+            for parent in list(self.parents.values()):
+                if not parent.done:
+                    self._advance(parent, now)
+            if now - self.last_flush >= self.flush_interval or any(p.done for p in self.parents.values()):
+                self.flush()
+
+    def refresh(self, broker_orders):
+        """Update children from the broker order list (matched by userOrderId)"""
+        for broker_order in broker_orders:
+            entry = self.by_uid.get(getattr(broker_order, 'm_strRemark', None))
+            if entry is None:
+                continue
+            parent, child = entry
+            child.broker_id = getattr(broker_order, 'm_strOrderSysID', child.broker_id)
+            child.missing_since = None
+            traded = int(getattr(broker_order, 'm_nVolumeTraded', 0))
+            status = ORDER_STATUS.get(getattr(broker_order, 'm_nOrderStatus', None), child.status)
+            if traded > child.filled:
+                child.filled = traded
+                child.avg_price = float(getattr(broker_order, 'm_dTradedPrice', child.price))
+                parent.dirty = True
+                parent.updated_at = datetime.now()
+            if status != child.status and child.live:
+                child.status = status
+                parent.dirty = True
+            if child.abandoned and not child.cancelling and status not in FINAL_STATES:
+                # given back as missing but reached the broker after all: its quantity was re-sent
+                print('Cancelling late child {} of order {}'.format(child.uid, parent.pk))
+                self.cancel(child)
+                child.cancelling = True
+
+    def _advance(self, parent, now):
+        for child in parent.children:
+            if not child.live or child.cancelling or now - child.sent_at < self.reprice_after:
+                continue
+            if child.broker_id is None:
+                # not in the broker's order list yet: keep it committed until a later poll
+                # reprice_after seconds on still does not show it, then give its quantity back
+                if child.missing_since is None:
+                    child.missing_since = now
+                    continue
+                if now - child.missing_since < self.reprice_after:
+                    continue
+                child.status = CANCELLED
+                child.abandoned = True
+            else:
+                self.cancel(child)
+                child.cancelling = True
+            parent.step = min(parent.step + 1, self.max_steps)
+
+        if parent.filled >= parent.volume:
+            self._finish(parent)
+            return
+        elapsed = now - parent.start
+        if elapsed >= self.horizon + self.grace:
+            live = [c for c in parent.children if c.live]
+            for child in live:
+                if not child.cancelling and child.broker_id is not None:
+                    self.cancel(child)
+                    child.cancelling = True
+            if not any(c.live and c.broker_id is not None for c in live):
+                self._finish(parent)
+            return
+        if elapsed >= self.horizon and any(c.live for c in parent.children):
+            # past the horizon only re-priced remainders are sent
+            return
+
+        quantity = self.target(parent, elapsed) - parent.committed
+        if self.schedule == PARTICIPATION and self.recent_volume is not None:
+            market = self.recent_volume(parent.code)
+            if market is not None:
+                quantity = min(quantity, lots(self.participation * market))
+        remaining = parent.volume - parent.committed
+        if quantity <= 0 or (quantity < LOT_SIZE and quantity != remaining):
+            return
+        self._send(parent, quantity, now)
+
+    def _send(self, parent, volume, now):
+        parent.seq += 1
+        child = Child(child_order_id(parent.uid, parent.seq), volume, self.price(parent, parent.step), now)
+        parent.children.append(child)
+        self.by_uid[child.uid] = (parent, child)
+        try:
+            self.place(parent, child)
+        except Exception as e:
+            # left live without a broker id: if it never appears it is given back after reprice_after
+            print('Failed to send child {} of order {}: {}'.format(child.uid, parent.pk, e))
+
+    def _finish(self, parent):
+        parent.done = True
+        parent.dirty = True
+        parent.updated_at = datetime.now()
+        print('Sliced order {} finished: {} / {} shares in {} children, avg price {}'.format(
+            parent.pk, parent.filled, parent.volume, len(parent.children), parent.avg_price))
+        if self.on_done is not None:
+            self.on_done(parent)
+
+    def flush(self):
+        """Write changed parents in one batch; drop finished parents once written"""
+        self.last_flush = self.clock()
+        dirty = [p for p in self.parents.values() if p.dirty]
+        if not dirty:
+            return 0
+        if self.writer is not None and not self.writer([p.row() for p in dirty]):
+            return 0
+        for parent in dirty:
+            parent.dirty = False
+            if parent.done:
+                del self.parents[parent.pk]
+                for child in parent.children:
+                    self.by_uid.pop(child.uid, None)
+        return len(dirty)
+
@@ -5,6 +5,13 @@ import numpy as np
 import pandas as pd
 import datetime
 import uuid
+from allocation import allocate_lots
+from jqprofile import install_profiler
+from jqcache import api_cache, get_all_securities, get_security_info, get_price, get_current_data
+from ringbuffer import BarRingBuffer
+from daily_bars import DAILY_FIELDS, update_daily_bars, get_limit_status
+from code_table import shared_code_table, STAR, BSE
+from price_limit import limit_table
 # 聚宽平台使用内置的sqlalchemy
 from sqlalchemy import create_engine, Column, String, Integer, DateTime, Boolean, Float
 from sqlalchemy.ext.declarative import declarative_base
@@ -24,6 +31,11 @@ class JoinQuantTable(Base):
     ordertype = Column(String(10)) # 下单方向，买 或 卖
     if_deal = Column(Boolean) # 是否已经成交
     insertdate = Column(DateTime) # 订单信息插入数据库的时间
+    # 以下由 iQuant 执行端按券商回报回写
+    fill_qty = Column(Integer)  # 已成交数量
+    fill_price = Column(Float)  # 成交均价
+    fill_status = Column(String(16))  # submitted / partial / filled / cancelled / rejected
+    fill_time = Column(DateTime)  # 最近一次成交状态变化的时间
 
 def initialize(context):
     set_benchmark('000001.XSHG')
@@ -37,12 +49,22 @@ def initialize(context):
     g.stock_num = 12
     g.hold_list = []
     g.high_limit_list = []
+    g.today_high_limit = {}
+    g.daily_bars = BarRingBuffer(DAILY_FIELDS, 1)  # 上一交易日持仓行情
+    g.watch_by_tick = False  # 实盘tick模式下改为逐笔监控涨停打开
+    g.profile = False  # 记录定时任务和数据接口耗时，收盘后写入日志
 
+    if g.profile:
+        install_profiler(globals())
     run_daily(prepare_stock_list, time='9:05')
     run_daily(check_limit_up, time='13:55')
     run_weekly(weekly_adjustment, weekday=1, time='14:00', reference_security='000001.XSHG')
 
 
+def process_initialize(context):
+    """启动（含平台重启）时绑定数据缓存，缓存按交易日自动失效"""
+    api_cache.bind(context)
+
 def get_dividend_ratio_filter_list(context, stock_list, sort, p1, p2):
     time1 = context.previous_date
     time0 = time1 - datetime.timedelta(days=365)
@@ -114,22 +136,33 @@ def get_stock_list(context):
 def prepare_stock_list(context):
     g.hold_list = [position.security for position in context.portfolio.positions.values()]
     
+    bars = update_daily_bars(g.daily_bars, context, g.hold_list, globals())
     if g.hold_list:
-        panel = get_price(g.hold_list, end_date=context.previous_date, 
-                         frequency='daily', fields=['close','high_limit'], 
-                         count=1, skip_paused=False)
-        df_close = panel['close']
-        df_high_limit = panel['high_limit']
+        df_close = bars.frame('close', 1, g.hold_list)
+        df_high_limit = bars.frame('high_limit', 1, g.hold_list)
         selected_stocks = df_close[df_close == df_high_limit].dropna(axis=1)
         g.high_limit_list = selected_stocks.columns.tolist()
     else:
         g.high_limit_list = []
+    
+    # 按昨日收盘价本地计算今日涨停价，盘中监控只需取最新价
+    if g.high_limit_list:
+        is_st = get_extras('is_st', g.high_limit_list, end_date=context.current_dt.date(), count=1).iloc[-1]
+        limits = limit_table(df_close[g.high_limit_list].iloc[-1], is_st, context.current_dt.date())
+        g.today_high_limit = limits['high_limit'].to_dict()
+    else:
+        g.today_high_limit = {}
+    if g.watch_by_tick:
+        unsubscribe_all()
+        if g.high_limit_list:
+            subscribe(g.high_limit_list, 'tick')
 
 def weekly_adjustment(context):
     target_list = get_stock_list(context)
     target_list = filter_paused_stock(target_list)
-    target_list = filter_limitup_stock(context, target_list)
-    target_list = filter_limitdown_stock(context, target_list)
+    limit_status_df = get_limit_status(g.daily_bars, context, target_list, globals()) if target_list else None
+    target_list = filter_limitup_stock(context, target_list, limit_status_df)
+    target_list = filter_limitdown_stock(context, target_list, limit_status_df)
     target_list = target_list[:min(g.stock_num, len(target_list))]
     
     order_list = []  # 用于存储交易记录
@@ -166,11 +199,17 @@ def weekly_adjustment(context):
         value = target_value / (target_num - position_count)
         # 获取当前行情数据
         current_data = get_current_data()
-        for stock in target_list:
-            if context.portfolio.positions[stock].total_amount == 0:
-                # 计算买入数量，向下取整到100的整数倍
-                buy_amount = int(value / current_data[stock].last_price)
-                buy_amount = (buy_amount // 100) * 100  # 向下取整到100的整数倍
+        candidates = [stock for stock in target_list if context.portfolio.positions[stock].total_amount == 0]
+        # 按排名逐批填满空位：每批按整手分配资金（剩余资金补给离目标最远的股票），
+        # 买不进的股票（停牌、涨跌停、不足一手）由后面的候选补上，空位填满即停止
+        while candidates and len(context.portfolio.positions) < target_num:
+            slots = target_num - len(context.portfolio.positions)
+            new_stocks, candidates = candidates[:slots], candidates[slots:]
+            prices = pd.Series([current_data[stock].last_price for stock in new_stocks], index=new_stocks)
+            buy_amounts = allocate_lots(pd.Series(value, index=new_stocks), prices, context.portfolio.cash,
+                                        commission=0.0003, slippage=0.001)
+            for stock in new_stocks:
+                buy_amount = int(buy_amounts[stock])
                 
                 if buy_amount > 0 and open_position(stock, buy_amount * current_data[stock].last_price):
                     # 记录买入订单
@@ -185,44 +224,67 @@ def weekly_adjustment(context):
                         'insertdate': current_time
                     }
                     order_list.append(order_dict)
-                    if len(context.portfolio.positions) == target_num:
-                        break
     
     # 推送交易记录到数据库
     if order_list:
         push_order_command(order_list)
 
 def check_limit_up(context):
-    if g.high_limit_list:
-        now_time = context.current_dt
-        order_list = []
-        
-        for stock in g.high_limit_list:
-            current_data = get_price(stock, end_date=now_time, frequency='1m', 
-                                   fields=['close','high_limit'], skip_paused=False, 
-                                   fq='pre', count=1)
-            if current_data.iloc[0,0] < current_data.iloc[0,1]:
-                # 检查股票是否在持仓中
-                if stock in context.portfolio.positions:
-                    # 获取实际持仓数量
-                    position_amount = context.portfolio.positions[stock].total_amount
-                    if position_amount > 0 and close_position(context.portfolio.positions[stock]):
-                        # 记录涨停板打开后的卖出订单，使用实际持仓数量
-                        order_dict = {
-                            'pk': str(uuid.uuid1()),
-                            'code': stock,
-                            'tradetime': now_time,
-                            'order_values': int(position_amount),  # 使用实际持仓数量，转为整数
-                            'price': current_data.iloc[0,0],
-                            'ordertype': '卖',
-                            'if_deal': False,  # 还未被iQuant执行
-                            'insertdate': now_time
-                        }
-                        order_list.append(order_dict)
-        
-        # 推送交易记录到数据库
-        if order_list:
-            push_order_command(order_list)
+    # 13:55 定时兜底检查，与分钟级监控共用同一逻辑
+    watch_limit_up(context)
+
+def handle_data(context, data):
+    # 每分钟监控昨日涨停持仓是否开板
+    watch_limit_up(context, data)
+
+def handle_tick(context, tick):
+    # 实盘tick模式下逐笔监控（需 g.watch_by_tick = True 订阅tick）
+    if tick.code in g.high_limit_list and tick.current < g.today_high_limit.get(tick.code, float('inf')):
+        sell_opened_limit_up(context, [tick.code], {tick.code: tick.current})
+
+def watch_limit_up(context, data=None):
+    # 09:30 时当日还没有走完的分钟线，最新收盘价是昨日收盘价（即今日昨收，必然低于涨停价），
+    # 此时判断会把所有涨停持仓都当作开板卖出，至少等第一根分钟线走完
+    if g.high_limit_list and context.current_dt.time() > datetime.time(9, 30):
+        if data is not None:
+            prices = {stock: data[stock].close for stock in g.high_limit_list}
+        else:
+            # 所有监控股票一次批量取最新分钟收盘价
+            prices = history(1, unit='1m', field='close', security_list=g.high_limit_list).iloc[-1]
+        opened = [stock for stock in g.high_limit_list 
+                  if prices[stock] < g.today_high_limit.get(stock, float('inf'))]
+        if opened:
+            sell_opened_limit_up(context, opened, prices)
+
+def sell_opened_limit_up(context, stocks, prices):
+    now_time = context.current_dt
+    order_list = []
+    
+    for stock in stocks:
+        # 检查股票是否在持仓中
+        if stock in context.portfolio.positions:
+            # 获取实际持仓数量
+            position_amount = context.portfolio.positions[stock].total_amount
+            if position_amount > 0 and close_position(context.portfolio.positions[stock]):
+                # 记录涨停板打开后的卖出订单，使用实际持仓数量
+                order_dict = {
+                    'pk': str(uuid.uuid1()),
+                    'code': stock,
+                    'tradetime': now_time,
+                    'order_values': int(position_amount),  # 使用实际持仓数量，转为整数
+                    'price': float(prices[stock]),
+                    'ordertype': '卖',
+                    'if_deal': False,  # 还未被iQuant执行
+                    'insertdate': now_time
+                }
+                order_list.append(order_dict)
+                # 已卖出的不再监控
+                g.high_limit_list.remove(stock)
+                log.info('涨停打开卖出: %s, 时间: %s' % (stock, now_time.strftime('%H:%M')))
+    
+    # 推送交易记录到数据库
+    if order_list:
+        push_order_command(order_list)
 
 def filter_paused_stock(stock_list):
     current_data = get_current_data()
@@ -237,8 +299,7 @@ def filter_st_stock(stock_list):
            and '退' not in current_data[s].name]
 
 def filter_kcbj_stock(stock_list):
-    return [s for s in stock_list 
-           if not (s.startswith('68') or s[0] in ['4', '8'])]
+    return shared_code_table().exclude_boards(stock_list, (STAR, BSE))
 
 def filter_new_stock(context, stock_list, d):
     yesterday = context.previous_date
@@ -247,9 +308,7 @@ def filter_new_stock(context, stock_list, d):
 
 # 格式化股票代码，将聚宽格式转换为QMT格式
 def format_code(code):
-    code = code.replace('.XSHE','.SZ')
-    code = code.replace('.XSHG','.SH')
-    return code
+    return shared_code_table().to_qmt(code)
 
 # 推送订单指令到数据库
 def push_order_command(order_dict_list):
@@ -329,23 +388,26 @@ def close_position(position):
 
 
 
-def filter_limitup_stock(context, stock_list):
-    last_prices = history(1, unit='1m', field='close', security_list=stock_list)
-    current_data = get_current_data()
+def filter_limitup_stock(context, stock_list, status=None):
+    if not stock_list:
+        return []
+    if status is None:
+        status = get_limit_status(g.daily_bars, context, stock_list, globals())
     return [stock for stock in stock_list 
             if stock in context.portfolio.positions.keys()
-            or last_prices[stock][-1] < current_data[stock].high_limit]
+            or not status.at[stock, 'limit_up']]
 
-def filter_limitdown_stock(context, stock_list):
-    last_prices = history(1, unit='1m', field='close', security_list=stock_list)
-    current_data = get_current_data()
+def filter_limitdown_stock(context, stock_list, status=None):
+    if not stock_list:
+        return []
+    if status is None:
+        status = get_limit_status(g.daily_bars, context, stock_list, globals())
     return [stock for stock in stock_list 
             if stock in context.portfolio.positions.keys()
-            or last_prices[stock][-1] > current_data[stock].low_limit]
+            or not status.at[stock, 'limit_down']]
 
 def filter_kcbj_stock(stock_list):
-    return [s for s in stock_list 
-           if not (s.startswith('68') or s[0] in ['4', '8'])]
+    return shared_code_table().exclude_boards(stock_list, (STAR, BSE))
 
 def filter_new_stock(context, stock_list, d):
     yesterday = context.previous_date
@@ -3,6 +3,13 @@ from jqdata import *
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from rolling_quantile import RollingQuantileIndex
+from ringbuffer import BarRingBuffer
+from allocation import allocate_lots
+from code_table import shared_code_table, STAR, BSE
+from jqprofile import install_profiler
+from price_limit import limit_table
+from jqcache import api_cache, get_all_securities, get_trade_days, get_extras, get_price, get_current_data
 
 def initialize(context):
     """初始化函数"""
@@ -22,27 +29,41 @@ def initialize(context):
     g.max_position_count = 5  # 最大持仓数量（分散风险）
     g.single_position_ratio = 0.2  # 单股仓位比例（20%）
     g.lookback_days = 30  # 历史低位回看天数（缩短周期，更敏感）
+    g.low_quantile = 0.5  # 历史低位分位数（0.5即中位数）
     g.low_open_min = -0.06  # 低开最小幅度 -6%
     g.low_open_max = -0.01   # 低开最大幅度 -1%（严格低开）
     g.stop_loss_ratio = -0.06  # 止损比例 -6%（放宽止损）
     g.take_profit_ratio = 0.08  # 止盈比例 +8%
     g.holding_days = 3  # 最大持有天数（缩短持有期）
     g.min_profit_hold_days = 1  # 盈利时最少持有天数
+    g.profit_lock_ratio = 0.03  # 盈利锁定比例 +3%（需满足最少持有天数）
     
     # 全局变量
-    g.candidate_stocks = []  # 候选股票池
     g.first_board_stocks = []  # 昨日首板股票
+    g.candidate_info = {}  # 昨日首板股票的收盘价
+    g.next_day_candidates = {}  # 收盘后预计算的下一交易日候选
+    g.staged_orders = []  # 集合竞价阶段预挂的买单
+    g.snapshot_ttl = 30  # 实时行情快照缓存有效期（秒）
+    g.risk_engine = RiskEngine()  # 分钟级止损止盈引擎
+    g.risk_dirty = True  # 持仓变化后需要重建风控引擎
     g.buy_records = {}  # 买入记录
     g.daily_buy_count = 0  # 当日已买入数量
+    g.low_index = RollingQuantileIndex(g.lookback_days, g.low_quantile)  # 全市场历史低位索引
+    g.daily_bars = BarRingBuffer(['close', 'high_limit', 'paused'], 2)  # 全市场最近两日行情
     
     # 状态标记
     g.morning_scan_done = False
     g.morning_buy_done = False
+    g.profile = False  # 记录定时任务和数据接口耗时，收盘后写入日志
     
     # 定时任务
+    if g.profile:
+        install_profiler(globals())
     run_daily(prepare_trading_day, time='09:00')  # 开盘前准备
     run_daily(scan_first_board_stocks, time='09:25')  # 扫描昨日首板股票
-    run_daily(morning_buy_check, time='09:31')  # 早盘买入检查
+    run_daily(stage_auction_orders, time='09:25')  # 集合竞价预挂单
+    run_daily(release_staged_orders, time='09:30')  # 开盘复核并发出预挂单
+    run_daily(morning_buy_check, time='09:31')  # 早盘买入检查（集合竞价数据缺失时兜底）
     run_daily(stop_loss_check, time='10:30')  # 止损检查1
     run_daily(stop_loss_check, time='11:00')  # 止损检查2
     run_daily(stop_loss_check, time='13:30')  # 止损检查3
@@ -52,17 +73,23 @@ def initialize(context):
     log.info("=== 优化版严格首板低开策略启动 ===")
     log.info(f"最大持仓: {g.max_position_count}只")
     log.info(f"单股仓位: {g.single_position_ratio*100}%")
-    log.info(f"历史低位回看: {g.lookback_days}天")
+    log.info(f"历史低位回看: {g.lookback_days}天 | 低位分位数: {g.low_quantile}")
     log.info(f"严格低开区间: {g.low_open_min*100}% ~ {g.low_open_max*100}%")
     log.info(f"止损线: {g.stop_loss_ratio*100}% | 止盈线: {g.take_profit_ratio*100}%")
     log.info(f"最大持有天数: {g.holding_days}天 | 盈利最少持有: {g.min_profit_hold_days}天")
     log.info("策略特点: 首板低开+动态止盈止损+灵活持仓管理")
 
+def process_initialize(context):
+    """启动（含平台重启）时绑定数据缓存，缓存按交易日自动失效"""
+    api_cache.bind(context, snapshot_ttl=g.snapshot_ttl)
+
 def prepare_trading_day(context):
     """准备交易日"""
     g.morning_scan_done = False
     g.morning_buy_done = False
     g.daily_buy_count = 0
+    g.staged_orders = []
+    g.risk_dirty = True  # 可卖数量每日变化
     
     # 先执行早盘卖出
     morning_sell(context)
@@ -70,66 +97,20 @@ def prepare_trading_day(context):
     log.info("=== 新交易日准备完成 ===")
 
 def scan_first_board_stocks(context):
-    """扫描昨日首板股票"""
+    """扫描昨日首板股票（读取收盘后预计算的候选列表）"""
     try:
         log.info("=== 扫描昨日首板股票 ===")
         
         # 获取昨日交易日
         yesterday = context.previous_date
         
-        # 获取所有A股
-        all_stocks = list(get_all_securities(types=['stock']).index)
-        
-        # 过滤条件
-        first_board_list = []
-        scan_count = 0
-        low_position_count = 0
-        
-        # 限制扫描数量，提高效率
-        sample_size = min(1000, len(all_stocks))
-        sampled_stocks = np.random.choice(all_stocks, sample_size, replace=False)
-        
-        for stock in sampled_stocks:
-            try:
-                # 过滤ST股票
-                if is_st_stock(stock):
-                    continue
-                # 过滤科创板和北交所
-                if stock.startswith('688') or stock.startswith('8') or stock.startswith('4'):
-                    continue
-                
-                scan_count += 1
-                
-                # 获取昨日数据
-                yesterday_data = get_price(stock, 
-                                         count=2, 
-                                         end_date=yesterday,
-                                         fields=['close', 'high_limit'],
-                                         skip_paused=True)
-                
-                if len(yesterday_data) < 2:
-                    continue
-                
-                # 检查是否涨停
-                yesterday_close = yesterday_data['close'].iloc[-1]
-                yesterday_limit = yesterday_data['high_limit'].iloc[-1]
-                
-                if abs(yesterday_close - yesterday_limit) < 0.01:
-                    # 检查是否为首板（前一天没有涨停）
-                    pre_day_close = yesterday_data['close'].iloc[-2]
-                    pre_day_limit = yesterday_data['high_limit'].iloc[-2]
-                    
-                    if abs(pre_day_close - pre_day_limit) >= 0.01:
-                        # 检查是否处于历史低位
-                        if is_at_historical_low(stock, yesterday, g.lookback_days):
-                            first_board_list.append(stock)
-                            low_position_count += 1
-                            
-            except Exception as e:
-                continue
+        # 正常情况下昨日收盘后已完成预计算，这里只做查表
+        if g.next_day_candidates.get('date') != yesterday:
+            log.info("未找到昨日收盘后的预计算结果，开盘前补算")
+            g.next_day_candidates = build_first_board_candidates(yesterday)
         
-        g.first_board_stocks = first_board_list
-        log.info(f"扫描了 {scan_count} 只股票")
+        g.candidate_info = g.next_day_candidates.get('stocks', {})
+        g.first_board_stocks = list(g.candidate_info.keys())
         log.info(f"发现 {len(g.first_board_stocks)} 只昨日首板且处于历史低位的股票")
         
         if len(g.first_board_stocks) > 0 and len(g.first_board_stocks) <= 10:
@@ -141,10 +122,95 @@ def scan_first_board_stocks(context):
         log.error(f"扫描首板股票时出错: {e}")
         g.first_board_stocks = []
 
+def build_first_board_candidates(date):
+    """
+    预计算下一交易日的首板低位候选：date 当日首次涨停且处于历史低位
+    返回 {'date': date, 'stocks': {stock: {'pre_close'}}}
+    """
+    result = {'date': date, 'stocks': {}}
+    
+    # 获取所有A股，过滤科创板和北交所
+    all_stocks = list(get_all_securities(types=['stock'], date=date).index)
+    all_stocks = shared_code_table().exclude_boards(all_stocks, (STAR, BSE))
+    
+    # 最近两日行情缓冲区每天只写入一天，历史低位索引复用同一份数据
+    bars = update_daily_bars(date, all_stocks)
+    update_low_index(date, all_stocks)
+    
+    # 当日涨停且未停牌，前一天没有涨停（首板）
+    close = bars.last('close', 2)
+    limit_up = np.abs(close - bars.last('high_limit', 2)) < 0.01
+    first_board = limit_up[-1] & ~limit_up[-2] & (bars.latest('paused') == 0)
+    stocks = [bars.securities[i] for i in np.flatnonzero(first_board)]
+    pre_close = pd.Series(bars.latest('close'), index=bars.securities)
+    
+    # 过滤ST股票
+    if stocks:
+        is_st = get_extras('is_st', stocks, end_date=date, count=1).iloc[-1]
+        stocks = [s for s in stocks if not is_st[s]]
+    
+    # 检查是否处于历史低位
+    if g.low_index.last_date == date:
+        low_mask = g.low_index.below(stocks)
+        stocks = [s for s in stocks if low_mask[s]]
+    else:
+        stocks = [s for s in stocks if is_at_historical_low(s, date, g.lookback_days)]
+    
+    for stock in stocks:
+        result['stocks'][stock] = {'pre_close': float(pre_close[stock])}
+    return result
+
+def update_daily_bars(date, all_stocks):
+    """把 date 当日的收盘价、涨停价、停牌状态写入行情缓冲区，缓冲区中断时整体预热"""
+    bars = g.daily_bars
+    if bars.last_time == date:
+        return bars
+    
+    # 缓冲区接续上一个交易日时只需取一天
+    prev_trade_day = get_trade_days(end_date=date, count=2)[0]
+    count = 1 if bars.last_time == prev_trade_day else bars.capacity
+    bars.set_securities(all_stocks)
+    panel = get_price(all_stocks, count=count, end_date=date,
+                      fields=bars.fields, skip_paused=False)
+    if count == 1:
+        bars.push({f: panel[f].iloc[-1] for f in bars.fields}, date)
+    else:
+        bars.warm({f: panel[f] for f in bars.fields},
+                  [d.date() for d in panel['close'].index])
+    return bars
+
+def update_low_index(date, all_stocks):
+    """用 date 当日收盘价更新历史低位索引，索引缺失或中断时整体重建"""
+    index = g.low_index
+    if index.last_date == date:
+        return
+    
+    try:
+        # 索引接续上一个交易日时直接取行情缓冲区中的当日收盘价
+        prev_trade_day = get_trade_days(end_date=date, count=2)[0]
+        bars = g.daily_bars
+        if index.last_date == prev_trade_day and bars.last_time == date:
+            # 停牌日不计入窗口（与 skip_paused=True 口径一致）
+            closes = np.where(bars.latest('paused') == 0, bars.latest('close'), np.nan)
+            index.update(pd.Series(closes, index=bars.securities), date=date)
+            return
+        
+        panel = get_price(all_stocks, count=g.lookback_days, end_date=date,
+                          fields=['close', 'paused'], skip_paused=False)
+        closes = panel['close'].where(panel['paused'] == 0)
+        index.warm(closes, date=date)
+        log.info(f"历史低位索引重建完成: {len(index.securities)}只股票")
+    except Exception as e:
+        log.error(f"更新历史低位索引时出错: {e}")
+
 def is_at_historical_low(stock, date, lookback_days):
-    """判断股票是否处于历史低位（中位数以下）"""
+    """判断股票是否处于历史低位（收盘价低于 lookback_days 日收盘价的 g.low_quantile 分位数）"""
+    index = g.low_index
+    if index.last_date == date and index.lookback == lookback_days:
+        return index.is_below(stock)
+    
     try:
-        # 获取历史数据
+        # 索引不可用时退回逐只查询
         hist_data = get_price(stock, 
                             count=lookback_days,
                             end_date=date,
@@ -154,19 +220,168 @@ def is_at_historical_low(stock, date, lookback_days):
         if len(hist_data) < lookback_days * 0.8:  # 数据不足
             return False
         
-        # 计算中位数
-        median_price = hist_data['close'].median()
+        # 计算分位数（g.low_quantile，与历史低位索引口径一致）
+        quantile_price = hist_data['close'].quantile(g.low_quantile)
         current_price = hist_data['close'].iloc[-1]
         
-        # 判断是否在中位数以下
-        return current_price < median_price
+        # 判断是否在分位数以下
+        return current_price < quantile_price
         
     except Exception as e:
         return False
 
+def get_buy_target_value(context, reserved_value=0):
+    """单只股票的买入金额（均仓），reserved_value 为已预留给其他买单的资金"""
+    target_value = context.portfolio.total_value * g.single_position_ratio
+    
+    # 检查可用资金
+    available_cash = context.portfolio.available_cash - reserved_value
+    if available_cash < target_value:
+        target_value = available_cash * 0.95
+    return target_value
+
+def stage_auction_orders(context):
+    """09:25 根据集合竞价价格批量筛选低开首板股票并预挂买单"""
+    try:
+        g.staged_orders = []
+        if not g.morning_scan_done or not g.first_board_stocks:
+            return
+        
+        log.info("=== 09:25 集合竞价预挂单 ===")
+        
+        today = context.current_dt.date()
+        held = set(stock for stock, pos in context.portfolio.positions.items() 
+                   if pos.total_amount > 0)
+        stocks = [s for s in g.first_board_stocks if s not in held]
+        if not stocks:
+            return
+        
+        # 所有候选一次取集合竞价成交价
+        auction = api_cache.daily(get_call_auction, stocks, start_date=today, 
+                                  end_date=today, fields=['time', 'current'])
+        if auction is None or len(auction) == 0:
+            log.info("无集合竞价数据，改由 09:31 早盘买入检查处理")
+            return
+        auction_price = auction.groupby('code')['current'].last()
+        
+        staged = []
+        for stock, price in auction_price.items():
+            yesterday_close = g.candidate_info[stock]['pre_close']
+            if price <= 0 or yesterday_close <= 0:
+                continue
+            open_change = (price - yesterday_close) / yesterday_close
+            if g.low_open_min <= open_change <= g.low_open_max:
+                staged.append({
+                    'stock': stock,
+                    'open_change': open_change,
+                    'auction_price': price,
+                    'yesterday_close': yesterday_close,
+                    'type': '首板低开'
+                })
+        
+        # 按低开幅度排序（绝对值从大到小），只保留空余仓位数量
+        staged.sort(key=lambda x: abs(x['open_change']), reverse=True)
+        staged = staged[:max(0, g.max_position_count - len(held))]
+        
+        # 按单股仓位比例预分配资金
+        reserved_value = 0
+        for candidate in staged:
+            target_value = get_buy_target_value(context, reserved_value)
+            if target_value < 1000:
+                log.info("资金不足，停止预挂单")
+                break
+            candidate['target_value'] = target_value
+            reserved_value += target_value
+            g.staged_orders.append(candidate)
+        
+        # 按竞价价格把金额换算为整手股数
+        if g.staged_orders:
+            stocks = [c['stock'] for c in g.staged_orders]
+            amounts = allocate_lots(pd.Series([c['target_value'] for c in g.staged_orders], index=stocks),
+                                    pd.Series([c['auction_price'] for c in g.staged_orders], index=stocks),
+                                    context.portfolio.available_cash, 
+                                    commission=0.0003, slippage=0.001, tolerance=0)
+            for candidate in g.staged_orders:
+                candidate['amount'] = int(amounts[candidate['stock']])
+            g.staged_orders = [c for c in g.staged_orders if c['amount'] > 0]
+            for candidate in g.staged_orders:
+                log.info(f"预挂单: {candidate['stock']}, 竞价低开 {candidate['open_change']*100:.2f}%, "
+                         f"金额: {candidate['target_value']:.0f}, 数量: {candidate['amount']}")
+        
+        log.info(f"集合竞价预挂单 {len(g.staged_orders)} 只")
+        if not g.staged_orders:
+            # 竞价已判定无符合条件的股票，09:31 无需再检查
+            g.morning_buy_done = True
+        
+    except Exception as e:
+        log.error(f"集合竞价预挂单时出错: {e}")
+        g.staged_orders = []
+
+def release_staged_orders(context):
+    """09:30 复核开盘价，发出仍在低开区间内的预挂单，其余撤销"""
+    try:
+        if not g.staged_orders:
+            return
+        
+        log.info("=== 09:30 开盘发出预挂单 ===")
+        
+        current_data = get_current_data()
+        buy_count = 0
+        
+        for candidate in g.staged_orders:
+            stock = candidate['stock']
+            
+            # 快速复核：停牌或开盘价偏离低开区间则撤单
+            if current_data[stock].paused:
+                log.info(f"撤销预挂单: {stock} 停牌")
+                continue
+            today_open = current_data[stock].day_open
+            open_change = (today_open - candidate['yesterday_close']) / candidate['yesterday_close']
+            if not (g.low_open_min <= open_change <= g.low_open_max):
+                log.info(f"撤销预挂单: {stock}, 开盘涨跌幅 {open_change*100:.2f}% 超出低开区间")
+                continue
+            
+            # 可用资金不足时按整手缩减
+            amount = candidate['amount']
+            if amount * today_open > context.portfolio.available_cash * 0.95:
+                amount = int(context.portfolio.available_cash * 0.95 / today_open / 100) * 100
+            target_value = amount * today_open
+            if target_value < 1000:
+                log.info("资金不足，停止买入")
+                break
+            
+            order_result = order(stock, amount)
+            if order_result:
+                log.info(f"买入成功: {stock} ({candidate['type']}), 低开 {open_change*100:.2f}%, 数量: {amount}, 金额: {target_value:.0f}")
+                buy_count += 1
+                g.risk_dirty = True
+                
+                # 记录买入信息
+                g.buy_records[stock] = {
+                    'buy_date': context.current_dt.date(),
+                    'buy_price': current_data[stock].last_price,
+                    'open_change': open_change,
+                    'type': candidate['type']
+                }
+            else:
+                log.error(f"买入失败: {stock}, 目标金额: {target_value:.0f}")
+        
+        g.daily_buy_count = buy_count
+        log.info(f"开盘共买入 {buy_count} 只严格首板低开股票")
+        g.morning_buy_done = True
+        
+    except Exception as e:
+        log.error(f"发出预挂单时出错: {e}")
+        g.morning_buy_done = True
+    finally:
+        g.staged_orders = []
+
 def morning_buy_check(context):
     """早盘买入检查"""
     try:
+        if g.morning_buy_done:
+            return
+        
         if not g.morning_scan_done or not g.first_board_stocks:
             log.info("无首板股票或扫描未完成，跳过买入")
             return
@@ -188,19 +403,9 @@ def morning_buy_check(context):
                 if context.portfolio.positions[stock].total_amount > 0:
                     continue
                 
-                # 获取今日开盘价和昨日收盘价
+                # 获取今日开盘价，昨日收盘价取自预计算结果
                 today_open = current_data[stock].day_open
-                
-                # 获取昨日收盘价
-                yesterday_data = get_price(stock,
-                                         count=1,
-                                         end_date=context.previous_date,
-                                         fields=['close'])
-                
-                if len(yesterday_data) == 0:
-                    continue
-                    
-                yesterday_close = yesterday_data['close'].iloc[-1]
+                yesterday_close = g.candidate_info[stock]['pre_close']
                 
                 if today_open <= 0 or yesterday_close <= 0:
                     continue
@@ -255,12 +460,7 @@ def morning_buy_check(context):
             stock = candidate['stock']
             
             # 计算买入金额（均仓）
-            total_value = context.portfolio.total_value
-            target_value = total_value * g.single_position_ratio
-            
-            # 检查可用资金
-            if context.portfolio.available_cash < target_value:
-                target_value = context.portfolio.available_cash * 0.95
+            target_value = get_buy_target_value(context)
             
             if target_value < 1000:
                 log.info(f"资金不足，停止买入")
@@ -272,6 +472,7 @@ def morning_buy_check(context):
                 log.info(f"买入成功: {stock} ({candidate.get('type', '未知')}), 低开 {candidate['open_change']*100:.2f}%, 金额: {target_value:.0f}")
                 log.info(f"订单ID: {order_result}")
                 buy_count += 1
+                g.risk_dirty = True
                 
                 # 记录买入信息
                 g.buy_records[stock] = {
@@ -292,68 +493,97 @@ def morning_buy_check(context):
         log.error(f"早盘买入检查时出错: {e}")
         g.morning_buy_done = True
 
+class RiskEngine(object):
+    """
+    持仓风控引擎
+    成本、可卖数量、买入日期和止损止盈阈值保存在并行数组中，
+    每次检查对全部持仓做一次向量化判断，只对触发的行下单
+    """
+    NONE, STOP_LOSS, TAKE_PROFIT, PROFIT_LOCK = 0, 1, 2, 3
+    REASONS = {STOP_LOSS: '止损', TAKE_PROFIT: '止盈', PROFIT_LOCK: '盈利锁定'}
+    
+    def __init__(self):
+        self.load([], [], [], [])
+    
+    def load(self, stocks, costs, closeable, buy_days):
+        """按持仓重建数组，buy_days 为买入日期的序数（无记录为 -1）"""
+        self.stocks = list(stocks)
+        self.cost = np.asarray(costs, dtype=float)
+        self.closeable = np.asarray(closeable, dtype=np.int64)
+        self.buy_day = np.asarray(buy_days, dtype=np.int64)
+        self.active = np.ones(len(self.stocks), dtype=bool)
+        self.stop_loss = np.full(len(self.stocks), g.stop_loss_ratio)
+        self.take_profit = np.full(len(self.stocks), g.take_profit_ratio)
+        self.lock_ratio = np.full(len(self.stocks), g.profit_lock_ratio)
+        self.min_hold = np.full(len(self.stocks), g.min_profit_hold_days)
+    
+    def evaluate(self, prices, today):
+        """
+        prices: 与 self.stocks 对齐的最新价数组，today: 当日日期序数
+        返回 (触发原因数组, 收益率数组, 持有天数数组)
+        """
+        prices = np.asarray(prices, dtype=float)
+        valid = self.active & (self.closeable > 0) & (prices > 0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return_rate = np.where(valid, prices / self.cost - 1, 0.0)
+        holding_days = np.where(self.buy_day >= 0, today - self.buy_day, 0)
+        
+        reasons = np.zeros(len(self.stocks), dtype=np.int8)
+        # 按优先级从低到高写入，高优先级覆盖低优先级
+        reasons[valid & (return_rate >= self.lock_ratio) & (holding_days >= self.min_hold)] = self.PROFIT_LOCK
+        reasons[valid & (return_rate >= self.take_profit)] = self.TAKE_PROFIT
+        reasons[valid & (return_rate <= self.stop_loss)] = self.STOP_LOSS
+        return reasons, return_rate, holding_days
+
+def sync_risk_engine(context):
+    """按当前持仓重建风控引擎的数组"""
+    stocks, costs, closeable, buy_days = [], [], [], []
+    for stock, position in context.portfolio.positions.items():
+        if position.total_amount <= 0:
+            continue
+        buy_date = g.buy_records.get(stock, {}).get('buy_date')
+        stocks.append(stock)
+        costs.append(position.avg_cost)
+        closeable.append(position.closeable_amount)
+        buy_days.append(buy_date.toordinal() if buy_date else -1)
+    g.risk_engine.load(stocks, costs, closeable, buy_days)
+    g.risk_dirty = False
+
+def run_risk_check(context, prices):
+    """对风控引擎做一次向量化判断，卖出触发止损止盈的持仓，返回卖出数量"""
+    engine = g.risk_engine
+    reasons, return_rate, holding_days = engine.evaluate(prices, context.current_dt.date().toordinal())
+    sell_count = 0
+    
+    for i in np.flatnonzero(reasons):
+        stock = engine.stocks[i]
+        sell_reason = engine.REASONS[reasons[i]]
+        # 无论成败都不再重复处理该行，持仓变化后由 sync_risk_engine 重建
+        engine.active[i] = False
+        
+        order_result = order_target(stock, 0)
+        if order_result:
+            log.info(f"{sell_reason}卖出: {stock}, 成本: {engine.cost[i]:.2f}, "
+                   f"现价: {prices[i]:.2f}, 收益率: {return_rate[i]*100:.2f}%, 持有{holding_days[i]}天")
+            sell_count += 1
+            
+            # 清除买入记录
+            if stock in g.buy_records:
+                del g.buy_records[stock]
+        else:
+            log.error(f"{sell_reason}卖出失败: {stock}")
+    return sell_count
+
 def stop_loss_check(context):
-    """止损止盈检查"""
+    """止损止盈检查（定时全量检查，与 handle_data 的分钟级检查共用风控引擎）"""
     try:
         current_time = context.current_dt
         log.info(f"=== {current_time.strftime('%H:%M')} 止损止盈检查 ===")
         
+        sync_risk_engine(context)
         current_data = get_current_data()
-        sell_count = 0
-        
-        for stock in list(context.portfolio.positions.keys()):
-            position = context.portfolio.positions[stock]
-            if position.total_amount <= 0:
-                continue
-            
-            # 检查是否有可卖数量
-            if position.closeable_amount <= 0:
-                continue
-            
-            try:
-                current_price = current_data[stock].last_price
-                if current_price <= 0:
-                    continue
-                
-                # 计算收益率
-                cost_price = position.avg_cost
-                return_rate = (current_price - cost_price) / cost_price
-                
-                # 获取持有天数
-                buy_info = g.buy_records.get(stock, {})
-                buy_date = buy_info.get('buy_date')
-                holding_days = (context.current_dt.date() - buy_date).days if buy_date else 0
-                
-                sell_reason = None
-                
-                # 止损检查
-                if return_rate <= g.stop_loss_ratio:
-                    sell_reason = f"止损"
-                # 止盈检查
-                elif return_rate >= g.take_profit_ratio:
-                    sell_reason = f"止盈"
-                # 盈利但未达到止盈线，检查是否满足最少持有天数
-                elif return_rate > 0 and holding_days >= g.min_profit_hold_days:
-                    # 如果盈利超过3%且持有超过1天，也可以考虑卖出
-                    if return_rate >= 0.03:
-                        sell_reason = f"盈利锁定"
-                
-                if sell_reason:
-                    order_result = order_target(stock, 0)
-                    if order_result:
-                        log.info(f"{sell_reason}卖出: {stock}, 成本: {cost_price:.2f}, "
-                               f"现价: {current_price:.2f}, 收益率: {return_rate*100:.2f}%, 持有{holding_days}天")
-                        sell_count += 1
-                        
-                        # 清除买入记录
-                        if stock in g.buy_records:
-                            del g.buy_records[stock]
-                    else:
-                        log.error(f"{sell_reason}卖出失败: {stock}")
-                        
-            except Exception as e:
-                log.error(f"处理股票 {stock} 止损止盈时出错: {e}")
-                continue
+        prices = [current_data[stock].last_price for stock in g.risk_engine.stocks]
+        sell_count = run_risk_check(context, prices)
         
         if sell_count > 0:
             log.info(f"止损止盈卖出 {sell_count} 只股票")
@@ -419,6 +649,7 @@ def end_day_sell_check(context):
                         log.info(f"尾盘卖出: {stock}, {sell_reason}, "
                                f"成本: {cost_price:.2f}, 现价: {current_price:.2f}")
                         sell_count += 1
+                        g.risk_dirty = True
                         
                         # 清除买入记录
                         if stock in g.buy_records:
@@ -438,17 +669,19 @@ def end_day_sell_check(context):
     except Exception as e:
         log.error(f"尾盘卖出检查时出错: {e}")
 
-def is_st_stock(stock):
-    """判断是否为ST股票"""
-    try:
-        current_data = get_current_data()
-        return current_data[stock].is_st
-    except:
-        return False
-
 def handle_data(context, data):
-    """分钟级运行函数 - 本策略主要使用定时任务，此函数留空"""
-    pass
+    """分钟级运行函数 - 每分钟对全部持仓做一次向量化止损止盈检查"""
+    try:
+        if g.risk_dirty:
+            sync_risk_engine(context)
+        if not g.risk_engine.active.any():
+            return
+        
+        # 持仓上一分钟的收盘价直接取自 data，不再每分钟调用 history
+        prices = pd.Series([data[stock].close for stock in g.risk_engine.stocks], dtype=float).fillna(0).values
+        run_risk_check(context, prices)
+    except Exception as e:
+        log.error(f"分钟级止损止盈检查时出错: {e}")
 
 def before_trading_start(context):
     """开盘前运行"""
@@ -456,6 +689,14 @@ def before_trading_start(context):
 
 def after_trading_end(context):
     """收盘后运行"""
+    # 预计算下一交易日的首板低位候选，开盘前只需查表
+    try:
+        g.next_day_candidates = build_first_board_candidates(context.current_dt.date())
+        log.info(f"下一交易日候选预计算完成: {len(g.next_day_candidates['stocks'])}只")
+    except Exception as e:
+        log.error(f"预计算下一交易日候选时出错: {e}")
+        g.next_day_candidates = {}
+    
     # 统计当日交易
     positions = [stock for stock, pos in context.portfolio.positions.items() 
                 if pos.total_amount > 0]
@@ -482,6 +723,11 @@ def after_trading_end(context):
         log.info(f"持仓总市值: {total_value:.0f}")
     else:
         log.info("当前空仓")
+    
+    # 当日数据缓存统计
+    for line in api_cache.report_lines():
+        log.info(line)
+    api_cache.reset_stats()
 
 def morning_sell(context):
     """早盘卖出（T+1）"""
@@ -491,6 +737,18 @@ def morning_sell(context):
         current_data = get_current_data()
         sell_count = 0
         
+        # 按昨日收盘价本地计算持仓股今日涨停价
+        held = [stock for stock, pos in context.portfolio.positions.items() if pos.total_amount > 0]
+        if held:
+            bars = g.daily_bars
+            if bars.last_time == context.previous_date and bars.covers(held):
+                pre_close = pd.Series(bars.get('close', 1, held)[-1], index=held)
+            else:
+                pre_close = get_price(held, end_date=context.previous_date, frequency='daily',
+                                      fields=['close'], count=1, skip_paused=False)['close'].iloc[-1]
+            is_st = get_extras('is_st', held, end_date=context.current_dt.date(), count=1).iloc[-1]
+            high_limits = limit_table(pre_close, is_st, context.current_dt.date())['high_limit']
+        
         for stock in list(context.portfolio.positions.keys()):
             position = context.portfolio.positions[stock]
             if position.total_amount <= 0:
@@ -507,7 +765,7 @@ def morning_sell(context):
                     continue
                 
                 # 检查是否涨停，涨停不卖
-                high_limit = current_data[stock].high_limit
+                high_limit = high_limits[stock]
                 if abs(current_price - high_limit) < 0.01:
                     log.info(f"涨停持有: {stock}")
                     continue
@@ -524,6 +782,7 @@ def morning_sell(context):
                         return_rate = (current_price - cost_price) / cost_price * 100
                         log.info(f"T+1卖出: {stock}, 成本: {cost_price:.2f}, 现价: {current_price:.2f}, 收益率: {return_rate:.2f}%")
                         sell_count += 1
+                        g.risk_dirty = True
                         
                         # 清除买入记录
                         if stock in g.buy_records:
@@ -4,6 +4,12 @@ from jqlib.technical_analysis import *
 import numpy as np
 import pandas as pd
 import datetime
+from code_table import shared_code_table, STAR, BSE
+from jqprofile import install_profiler
+from jqcache import api_cache, get_all_securities, get_security_info, get_price, get_current_data
+from price_limit import limit_table
+from ringbuffer import BarRingBuffer
+from daily_bars import DAILY_FIELDS, update_daily_bars, get_pre_close, get_limit_status
 
 def initialize(context):
     set_benchmark('000001.XSHG')
@@ -21,7 +27,11 @@ def initialize(context):
     g.history_hold_list = []
     g.not_buy_again_list = []
     g.high_limit_list = []
+    g.daily_bars = BarRingBuffer(DAILY_FIELDS, 1)  # 上一交易日持仓行情
+    g.profile = False  # 记录定时任务和数据接口耗时，收盘后写入日志
 
+    if g.profile:
+        install_profiler(globals())
     run_daily(prepare_stock_list, time='9:05')
     run_weekly(weekly_adjustment, weekday=1, time='14:00')
     run_daily(check_limit_up, time='13:55')
@@ -29,6 +39,10 @@ def initialize(context):
 
 
 
+def process_initialize(context):
+    """启动（含平台重启）时绑定数据缓存，缓存按交易日自动失效"""
+    api_cache.bind(context)
+
 def get_dividend_ratio_filter_list(context, stock_list, sort, p1, p2):
     time1 = context.previous_date
     time0 = time1 - datetime.timedelta(days=365)
@@ -109,12 +123,10 @@ def prepare_stock_list(context):
         temp_set.update(hold_list)
     g.not_buy_again_list = list(temp_set)
     
+    bars = update_daily_bars(g.daily_bars, context, g.hold_list, globals())
     if g.hold_list:
-        panel = get_price(g.hold_list, end_date=context.previous_date, 
-                         frequency='daily', fields=['close','high_limit'], 
-                         count=1, skip_paused=False)
-        df_close = panel['close']
-        df_high_limit = panel['high_limit']
+        df_close = bars.frame('close', 1, g.hold_list)
+        df_high_limit = bars.frame('high_limit', 1, g.hold_list)
         selected_stocks = df_close[df_close == df_high_limit].dropna(axis=1)
         g.high_limit_list = selected_stocks.columns.tolist()
     else:
@@ -123,8 +135,9 @@ def prepare_stock_list(context):
 def weekly_adjustment(context):
     target_list = get_stock_list(context)
     target_list = filter_paused_stock(target_list)
-    target_list = filter_limitup_stock(context, target_list)
-    target_list = filter_limitdown_stock(context, target_list)
+    limit_status_df = get_limit_status(g.daily_bars, context, target_list, globals()) if target_list else None
+    target_list = filter_limitup_stock(context, target_list, limit_status_df)
+    target_list = filter_limitdown_stock(context, target_list, limit_status_df)
     target_list = target_list[:min(g.stock_num, len(target_list))]
     
     for stock in g.hold_list:
@@ -145,12 +158,13 @@ def weekly_adjustment(context):
 
 def check_limit_up(context):
     if g.high_limit_list:
-        now_time = context.current_dt
+        # 所有监控股票一次批量取最新分钟收盘价，今日涨停价按前收盘价本地计算
+        prices = history(1, unit='1m', field='close', security_list=g.high_limit_list).iloc[-1]
+        is_st = get_extras('is_st', g.high_limit_list, end_date=context.current_dt.date(), count=1).iloc[-1]
+        high_limits = limit_table(get_pre_close(g.daily_bars, context, g.high_limit_list, globals()), is_st, 
+                                  context.current_dt.date())['high_limit']
         for stock in g.high_limit_list:
-            current_data = get_price(stock, end_date=now_time, frequency='1m', 
-                                   fields=['close','high_limit'], skip_paused=False, 
-                                   fq='pre', count=1)
-            if current_data.iloc[0,0] < current_data.iloc[0,1]:
+            if prices[stock] < high_limits[stock]:
                 close_position(context.portfolio.positions[stock])
 
 def filter_paused_stock(stock_list):
@@ -166,8 +180,7 @@ def filter_st_stock(stock_list):
            and '退' not in current_data[s].name]
 
 def filter_kcbj_stock(stock_list):
-    return [s for s in stock_list 
-           if not (s.startswith('68') or s[0] in ['4', '8'])]
+    return shared_code_table().exclude_boards(stock_list, (STAR, BSE))
 
 def filter_new_stock(context, stock_list, d):
     yesterday = context.previous_date
@@ -213,23 +226,26 @@ def filter_st_stock(stock_list):
            and '*' not in current_data[s].name 
            and '退' not in current_data[s].name]
 
-def filter_limitup_stock(context, stock_list):
-    last_prices = history(1, unit='1m', field='close', security_list=stock_list)
-    current_data = get_current_data()
+def filter_limitup_stock(context, stock_list, status=None):
+    if not stock_list:
+        return []
+    if status is None:
+        status = get_limit_status(g.daily_bars, context, stock_list, globals())
     return [stock for stock in stock_list 
             if stock in context.portfolio.positions.keys()
-            or last_prices[stock][-1] < current_data[stock].high_limit]
+            or not status.at[stock, 'limit_up']]
 
-def filter_limitdown_stock(context, stock_list):
-    last_prices = history(1, unit='1m', field='close', security_list=stock_list)
-    current_data = get_current_data()
+def filter_limitdown_stock(context, stock_list, status=None):
+    if not stock_list:
+        return []
+    if status is None:
+        status = get_limit_status(g.daily_bars, context, stock_list, globals())
     return [stock for stock in stock_list 
             if stock in context.portfolio.positions.keys()
-            or last_prices[stock][-1] > current_data[stock].low_limit]
+            or not status.at[stock, 'limit_down']]
 
 def filter_kcbj_stock(stock_list):
-    return [s for s in stock_list 
-           if not (s.startswith('68') or s[0] in ['4', '8'])]
+    return shared_code_table().exclude_boards(stock_list, (STAR, BSE))
 
 def filter_new_stock(context, stock_list, d):
     yesterday = context.previous_date
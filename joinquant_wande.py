@@ -4,6 +4,12 @@ from jqlib.technical_analysis import *
 import numpy as np
 import pandas as pd
 import datetime
+from rebalance import plan_rebalance, positions_frame, EXIT, ENTRY, TOP_UP
+from allocation import allocate_lots
+from code_table import shared_code_table, STAR, BSE
+from jqprofile import install_profiler
+from jqcache import api_cache, get_all_securities, get_security_info, get_extras, get_price, get_current_data
+from price_limit import limit_table
 
 def initialize(context):
     """初始化函数"""
@@ -23,57 +29,151 @@ def initialize(context):
     # 策略参数 - 完全按照万得微盘股指数
     g.micro_cap_num = 100  # 持仓股票数量：市值最小的400只
     g.hold_list = []  # 当前持仓列表
+    g.micro_cap_index = MicroCapIndex(g.micro_cap_num)  # 微盘股成分股增量维护
+    g.profile = False  # 记录定时任务和数据接口耗时，收盘后写入日志
+    
+    if g.profile:
+        install_profiler(globals())
     
     # 每日调仓 - 万得微盘股指数是每日更新成分股
     run_daily(daily_adjustment, time='14:00')
 
+def process_initialize(context):
+    """启动（含平台重启）时绑定数据缓存，缓存按交易日自动失效"""
+    api_cache.bind(context)
+
+class MicroCapIndex(object):
+    """
+    万得微盘股成分股的增量维护
+    证券列表、上市日期、ST状态和市值以数组形式跨日保存，每天只应用新上市、
+    ST变化、退市等变动，再用 np.argpartition 选出市值最小的N只
+    ST状态只用当日的 is_st（证券列表的 display_name 是最新名称，用它会引入未来信息），
+    退市整理等按当日名称的判断留给 select 的 skip，只作用于边界内的少量候选
+    """
+    def __init__(self, num, min_listed_days=20, buffer=50):
+        self.num = num
+        self.min_listed_days = min_listed_days
+        self.buffer = buffer  # 多选的边界候选数量，用于替补停牌股票
+        self.securities = []
+        self._col = {}
+        self.start_day = np.zeros(0, dtype=np.int64)  # 上市日期序数
+        self.board_ok = np.zeros(0, dtype=bool)       # 非科创板、北交所
+        self.listed = np.zeros(0, dtype=bool)         # 仍在上市
+        self.st = np.zeros(0, dtype=bool)             # 当日 is_st
+        self.market_cap = np.zeros(0)
+        self.members = []
+    
+    def _add(self, codes, start_dates):
+        """追加新证券"""
+        for i, code in enumerate(codes):
+            self._col[code] = len(self.securities) + i
+        self.securities.extend(codes)
+        self.start_day = np.concatenate([self.start_day, [d.toordinal() for d in start_dates]]).astype(np.int64)
+        self.board_ok = np.concatenate([self.board_ok, 
+                                        ~shared_code_table().ensure(codes).board_mask(codes, (STAR, BSE))]).astype(bool)
+        n = len(codes)
+        self.listed = np.concatenate([self.listed, np.zeros(n, dtype=bool)])
+        self.st = np.concatenate([self.st, np.zeros(n, dtype=bool)])
+        self.market_cap = np.concatenate([self.market_cap, np.full(n, np.nan)])
+    
+    def update_universe(self, securities, is_st):
+        """
+        应用当日的证券列表变化
+        securities: get_all_securities 的结果；is_st: 以证券代码为索引的当日ST标记
+        返回 (新上市数量, 退市数量, ST状态变化数量)
+        """
+        known = len(self.securities)
+        new_codes = [s for s in securities.index if s not in self._col]
+        if new_codes:
+            self._add(new_codes, list(securities.loc[new_codes, 'start_date']))
+        cols = np.array([self._col[s] for s in securities.index], dtype=np.int64)
+        
+        listed = np.zeros(len(self.securities), dtype=bool)
+        listed[cols] = True
+        delisted = int((self.listed & ~listed).sum())
+        self.listed = listed
+        
+        st_now = self.st.copy()
+        st_now[cols] = is_st.reindex(securities.index).fillna(False).values.astype(bool)
+        st_changes = int((st_now != self.st)[:known].sum())
+        self.st = st_now
+        return len(new_codes), delisted, st_changes
+    
+    def candidates(self, yesterday):
+        """上市满 min_listed_days 天、非ST、非科创北交所的证券"""
+        eligible = (self.listed & ~self.st & self.board_ok 
+                    & (yesterday.toordinal() - self.start_day >= self.min_listed_days))
+        return [self.securities[i] for i in np.flatnonzero(eligible)]
+    
+    def update_market_cap(self, market_cap):
+        """写入市值（以证券代码为索引的 pd.Series），缺失的记为 NaN"""
+        self.market_cap[:] = np.nan
+        cols = np.array([self._col[s] for s in market_cap.index if s in self._col], dtype=np.int64)
+        values = market_cap[[s for s in market_cap.index if s in self._col]].values
+        self.market_cap[cols] = values
+    
+    def select(self, yesterday, skip):
+        """
+        选出市值最小的 num 只（跳过 skip(stock) 为真的股票，如停牌、当日名称含ST/退）
+        返回 (成分股列表, 新增列表, 剔除列表)
+        """
+        cols = np.array([self._col[s] for s in self.candidates(yesterday)], dtype=np.int64)
+        cols = cols[np.isfinite(self.market_cap[cols])]
+        caps = self.market_cap[cols]
+        
+        members = []
+        k = min(self.num + self.buffer, len(cols))
+        while k > 0:
+            # 只对市值最小的 k 只排序
+            part = np.argpartition(caps, k - 1)[:k] if k < len(cols) else np.arange(len(cols))
+            part = part[np.argsort(caps[part], kind='stable')]
+            members = [s for s in (self.securities[c] for c in cols[part]) if not skip(s)]
+            if len(members) >= self.num or k == len(cols):
+                break
+            # 跳过的股票过多，扩大边界重新选择
+            k = min(k * 2, len(cols))
+        members = members[:self.num]
+        
+        previous = set(self.members)
+        current = set(members)
+        added = [s for s in members if s not in previous]
+        removed = [s for s in self.members if s not in current]
+        self.members = members
+        return members, added, removed
+
 def get_micro_cap_stocks(context):
     """
     获取万得微盘股成分股：市值最小的400只股票
     剔除ST、*ST、退市整理股、首发连板未打开的标的
     """
-    # 获取所有股票
-    all_stocks = get_all_securities(['stock']).index.tolist()
-    
-    # 获取当前数据
-    current_data = get_current_data()
+    index = g.micro_cap_index
+    today = context.current_dt.date()
     yesterday = context.previous_date
     
-    # 过滤ST、*ST、退市股票
-    filtered_stocks = []
-    for stock in all_stocks:
-        if (not current_data[stock].is_st and 
-            'ST' not in current_data[stock].name and 
-            '*' not in current_data[stock].name and 
-            '退' not in current_data[stock].name):
-            filtered_stocks.append(stock)
-    
-    # 过滤停牌股票
-    filtered_stocks = [s for s in filtered_stocks if not current_data[s].paused]
-    
-    # 过滤科创板和北交所股票
-    filtered_stocks = [s for s in filtered_stocks 
-                      if not (s.startswith('68') or s.startswith('8') or s.startswith('4'))]
-    
-    # 过滤新股（首发连板未打开）- 简化处理：过滤上市不足20天的股票
-    final_stocks = []
-    for stock in filtered_stocks:
-        start_date = get_security_info(stock).start_date
-        if (yesterday - start_date) >= datetime.timedelta(days=20):
-            final_stocks.append(stock)
-    
-    # 获取市值数据并排序
-    if len(final_stocks) > 0:
-        q = query(valuation.code, valuation.market_cap
-                ).filter(valuation.code.in_(final_stocks)
-                ).order_by(valuation.market_cap.asc())
-        
-        df = get_fundamentals(q, date=yesterday)
-        
-        # 返回市值最小的400只股票
-        return list(df['code'])[:min(g.micro_cap_num, len(df))]
-    else:
+    # 应用证券列表、ST状态的当日变化（首发连板未打开简化为上市不足20天）
+    securities = get_all_securities(['stock'], date=today)
+    is_st = get_extras('is_st', list(securities.index), end_date=today, count=1).iloc[-1]
+    new_count, delisted_count, st_count = index.update_universe(securities, is_st)
+    log.info(f'成分股变动: 新上市{new_count}只, 退市{delisted_count}只, ST变化{st_count}只')
+    
+    # 获取市值数据
+    candidates = index.candidates(yesterday)
+    if len(candidates) == 0:
         return []
+    q = query(valuation.code, valuation.market_cap).filter(valuation.code.in_(candidates))
+    df = get_fundamentals(q, date=yesterday)
+    index.update_market_cap(df.set_index('code')['market_cap'])
+    
+    # 选出市值最小的N只，停牌及当日名称为ST、退市整理的股票由边界候选替补
+    current_data = get_current_data()
+    
+    def skip(stock):
+        data = current_data[stock]
+        return data.paused or 'ST' in data.name or '*' in data.name or '退' in data.name
+    
+    members, added, removed = index.select(yesterday, skip)
+    log.info(f'微盘股新增: {len(added)}只, 剔除: {len(removed)}只')
+    return members
 
 def daily_adjustment(context):
     """每日调仓函数 - 完全按照万得微盘股指数逻辑"""
@@ -85,45 +185,61 @@ def daily_adjustment(context):
     
     # 获取当前持仓
     g.hold_list = [position.security for position in context.portfolio.positions.values()]
+    holdings, hold_prices = positions_frame(context.portfolio.positions)
     
-    # 找出需要卖出的股票（不在新的400只名单中）
-    sell_list = [stock for stock in g.hold_list if stock not in target_list]
+    # 目标权重（等权重）和最新价，行情只取一次
+    weights = pd.Series(1.0 / len(target_list), index=target_list) if target_list else pd.Series(dtype=float)
+    current_data = get_current_data()
+    new_stocks = [s for s in target_list if s not in holdings.index]
+    last_price = pd.Series([current_data[s].last_price for s in new_stocks], index=new_stocks, dtype=float)
+    prices = pd.concat([hold_prices, last_price])
     
-    # 找出需要买入的股票（在新的400只名单中但未持有）
-    buy_list = [stock for stock in target_list if stock not in g.hold_list]
+    # 按前收盘价和ST状态本地计算涨停价
+    if new_stocks:
+        pre_close = get_price(new_stocks, end_date=context.previous_date, frequency='daily', 
+                              fields=['close'], count=1, skip_paused=False)['close'].iloc[-1]
+        is_st = get_extras('is_st', new_stocks, end_date=context.current_dt.date(), count=1).iloc[-1]
+        high_limit = limit_table(pre_close, is_st, context.current_dt.date())['high_limit']
+    else:
+        high_limit = pd.Series(dtype=float)
     
-    log.info(f'需要卖出: {len(sell_list)}只, 需要买入: {len(buy_list)}只')
+    # 检查是否涨停（避免买不进）
+    buyable = (last_price < high_limit * 0.995).reindex(prices.index, fill_value=True)
     
-    # 先卖出
-    for stock in sell_list:
-        order_target_value(stock, 0)
-        log.info(f'卖出: {stock}')
+    # 如果偏离目标价值超过20%，则调整（先卖后买）
+    orders = plan_rebalance(weights, holdings, prices, context.portfolio.total_value, 
+                            band=0.2, buyable=buyable)
+    sell_count = len([o for o in orders if o['reason'] == EXIT])
+    buy_count = len([o for o in orders if o['reason'] == ENTRY])
+    log.info(f'需要卖出: {sell_count}只, 需要买入: {buy_count}只')
     
-    # 计算每只股票的目标价值（等权重）
-    if len(target_list) > 0:
-        total_value = context.portfolio.total_value
-        target_value = total_value / len(target_list)
-        
-        # 买入新股票
-        for stock in buy_list:
-            # 检查是否涨停（避免买不进）
-            current_data = get_current_data()
-            last_price = current_data[stock].last_price
-            high_limit = current_data[stock].high_limit
-            
-            if last_price < high_limit * 0.995:  # 非涨停
-                order_target_value(stock, target_value)
-                log.info(f'买入: {stock}, 目标价值: {target_value:.2f}')
-        
-        # 调整已持有股票的仓位（保持等权重）
-        for stock in target_list:
-            if stock in g.hold_list and stock not in sell_list:
-                current_value = context.portfolio.positions[stock].total_amount * \
-                              context.portfolio.positions[stock].price
-                # 如果偏离目标价值超过20%，则调整
-                if abs(current_value - target_value) / target_value > 0.2:
-                    order_target_value(stock, target_value)
-                    log.info(f'调整仓位: {stock}, 目标价值: {target_value:.2f}')
+    # 先卖出（含减仓）
+    buy_orders = []
+    for o in orders:
+        if o['reason'] in (ENTRY, TOP_UP):
+            buy_orders.append(o)
+            continue
+        order_target_value(o['security'], o['target_value'])
+        if o['reason'] == EXIT:
+            log.info(f"卖出: {o['security']}")
+        else:
+            log.info(f"调整仓位: {o['security']}, 目标价值: {o['target_value']:.2f}")
+    
+    # 再按整手分配可用资金买入
+    if buy_orders:
+        stocks = [o['security'] for o in buy_orders]
+        gaps = pd.Series([o['target_value'] - o['current_value'] for o in buy_orders], index=stocks)
+        amounts = allocate_lots(gaps, prices, context.portfolio.available_cash,
+                                commission=0.0003, slippage=0.001)
+        for o in buy_orders:
+            amount = int(amounts[o['security']])
+            if amount <= 0:
+                continue
+            order(o['security'], amount)
+            if o['reason'] == ENTRY:
+                log.info(f"买入: {o['security']}, 目标价值: {o['target_value']:.2f}, 数量: {amount}")
+            else:
+                log.info(f"调整仓位: {o['security']}, 目标价值: {o['target_value']:.2f}, 加仓: {amount}")
 
 def handle_data(context, data):
     """主函数（每分钟调用）"""
@@ -146,8 +262,7 @@ def filter_st_stock(stock_list):
 
 def filter_kcbj_stock(stock_list):
     """过滤科创板、北交所股票"""
-    return [s for s in stock_list 
-           if not (s.startswith('68') or s.startswith('8') or s.startswith('4'))]
+    return shared_code_table().exclude_boards(stock_list, (STAR, BSE))
 
 def filter_new_stock(context, stock_list, days=60):
     """过滤新股"""
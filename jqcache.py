@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+jqdata 接口的交易日内缓存代理
+
+策略在 from jqdata import * 之后导入同名函数即可替换原接口：
+    from jqcache import api_cache, get_all_securities, get_security_info, get_price, get_current_data
+
+    def process_initialize(context):
+        api_cache.bind(context)
+
+相同参数（规范化后）的调用按策略分为三类：
+- 证券列表、证券信息、交易日、ST等当日不变的数据：缓存到交易日结束
+- 日线 get_price：end_date 早于当日或已收盘时缓存到交易日结束，否则直接调用
+- get_current_data：按行情时间缓存 snapshot_ttl 秒
+进入新交易日时整体失效；条目总数超过 maxsize 时淘汰最久未使用的条目。
+
+返回的是缓存中的对象本身，调用方不要原地修改。
+未绑定 context 时（如平台重启后 process_initialize 之前）所有调用直接透传。
+"""
+import datetime
+from collections import OrderedDict, defaultdict
+
+import numpy as np
+import pandas as pd
+
+DAILY, BARS, SNAPSHOT = 'daily', 'bars', 'snapshot'
+MARKET_CLOSE = datetime.time(15, 0)
+# get_price 的位置参数顺序
+PRICE_ARGS = ('security', 'start_date', 'end_date', 'frequency')
+
+
+def freeze_args(value):
+    """把调用参数转换为可哈希的缓存键"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze_args(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index)):
+        return tuple(freeze_args(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(freeze_args(v) for v in value))
+    return value
+
+
+def _platform_api():
+    try:
+        import kuanke.user_space_api as api
+    except ImportError:
+        import jqdata as api
+    return api
+
+
+class ApiCache(object):
+    """
+    交易日内的数据接口缓存
+    maxsize: 缓存条目上限（LRU 淘汰）；snapshot_ttl: 实时行情快照有效期（秒，按行情时间）
+    """
+
+    def __init__(self, maxsize=20000, snapshot_ttl=30):
+        self.maxsize = maxsize
+        self.snapshot_ttl = snapshot_ttl
+        self.context = None
+        self.date = None
+        self._entries = OrderedDict()  # 键 -> (写入时的行情时间, 结果)
+        self._raw = {}
+        self.reset_stats()
+
+    def bind(self, context, snapshot_ttl=None, maxsize=None):
+        """绑定策略 context（读取行情时间），清空缓存"""
+        self.context = context
+        if snapshot_ttl is not None:
+            self.snapshot_ttl = snapshot_ttl
+        if maxsize is not None:
+            self.maxsize = maxsize
+        self.clear()
+        self._raw = {}
+
+    def clear(self):
+        self._entries.clear()
+        self.date = None
+
+    def reset_stats(self):
+        self.stats = defaultdict(lambda: [0, 0, 0])  # 接口 -> [命中, 未命中, 透传]
+        self.evictions = 0
+
+    @property
+    def hits(self):
+        return sum(s[0] for s in self.stats.values())
+
+    @property
+    def misses(self):
+        return sum(s[1] for s in self.stats.values())
+
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.0
+
+    def raw(self, name):
+        """平台原始接口"""
+        func = self._raw.get(name)
+        if func is None:
+            func = getattr(_platform_api(), name)
+            self._raw[name] = func
+        return func
+
+    def _now(self):
+        if self.context is None:
+            return None
+        now = self.context.current_dt
+        if now.date() != self.date:
+            # 新交易日，前一日的缓存全部失效
+            self._entries.clear()
+            self.date = now.date()
+        return now
+
+    def _bars_settled(self, now, args, kwargs):
+        """日线 get_price 的结果当日不再变化：end_date 早于当日，或当日已收盘"""
+        params = dict(zip(PRICE_ARGS, args))
+        params.update(kwargs)
+        if params.get('frequency', 'daily') not in ('daily', '1d'):
+            return False
+        end_date = params.get('end_date')
+        if end_date is None:
+            return False
+        return pd.Timestamp(end_date).date() < now.date() or now.time() >= MARKET_CLOSE
+
+    def call(self, name, func, policy, args, kwargs):
+        stats = self.stats[name]
+        now = self._now()
+        if now is None or (policy == BARS and not self._bars_settled(now, args, kwargs)):
+            stats[2] += 1
+            return func(*args, **kwargs)
+        key = (name, freeze_args(args), freeze_args(kwargs))
+        try:
+            entry = self._entries.get(key)
+        except TypeError:
+            # 参数不可哈希（如查询对象），不缓存
+            stats[2] += 1
+            return func(*args, **kwargs)
+        if entry is not None and (policy != SNAPSHOT
+                                  or (now - entry[0]).total_seconds() < self.snapshot_ttl):
+            self._entries.move_to_end(key)
+            stats[0] += 1
+            return entry[1]
+        stats[1] += 1
+        result = func(*args, **kwargs)
+        self._entries[key] = (now, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def daily(self, func, *args, **kwargs):
+        """当日内相同参数的 func 调用只执行一次（用于本模块没有代理的接口）"""
+        return self.call(func.__name__, func, DAILY, args, kwargs)
+
+    def snapshot(self, func, *args, **kwargs):
+        """snapshot_ttl 秒内相同参数的 func 调用只执行一次"""
+        return self.call(func.__name__, func, SNAPSHOT, args, kwargs)
+
+    def report_lines(self):
+        lines = ['数据缓存: 命中率 %.1f%%, 条目 %d, 淘汰 %d' % (
+            self.hit_rate() * 100, len(self._entries), self.evictions)]
+        for name, (hits, misses, bypass) in sorted(self.stats.items()):
+            lines.append('  %s: 命中 %d 次, 未命中 %d 次, 透传 %d 次' % (name, hits, misses, bypass))
+        return lines
+
+
+api_cache = ApiCache()
+
+
+def _proxy(name, policy):
+    def proxy(*args, **kwargs):
+        return api_cache.call(name, api_cache.raw(name), policy, args, kwargs)
+    proxy.__name__ = name
+    proxy.__doc__ = '%s 的缓存代理（%s）' % (name, policy)
+    return proxy
+
+
+get_all_securities = _proxy('get_all_securities', DAILY)
+get_security_info = _proxy('get_security_info', DAILY)
+get_trade_days = _proxy('get_trade_days', DAILY)
+get_extras = _proxy('get_extras', DAILY)
+get_price = _proxy('get_price', BARS)
+get_current_data = _proxy('get_current_data', SNAPSHOT)
+
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+聚宽策略本地运行环境
+
+    from jqlocal.runner import run_backtest
+    result, backtest = run_backtest('joinquant_wande.py', './data', '2023-01-01', '2023-12-31')
+"""
+from jqlocal.data import LocalData, read_table, write_table
+from jqlocal.api import Runtime
+from jqlocal.broker import Broker, OrderCost, PriceRelatedSlippage, FixedSlippage
@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+"""
+聚宽策略 API 的本地实现
+
+Runtime 持有当前模拟时间、本地数据和账户，api_namespace() 返回注入到
+jqdata / kuanke.user_space_api 模块中的函数和对象。
+
+盘中价格：有 minute/<日期> 分钟数据时取分钟收盘价；没有时以当日开盘价到
+收盘价按交易分钟线性插值（09:25 前为昨收，09:25~09:30 为开盘价）。
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from jqlocal.broker import (Broker, OrderCost, PriceRelatedSlippage, FixedSlippage,
+                            OrderStatus)
+from jqlocal.data import to_date
+from jqlocal.query import query, Table, FinanceNamespace
+
+PRICE_FIELDS = ('open', 'close', 'high', 'low', 'high_limit', 'low_limit', 'avg', 'pre_close')
+DEFAULT_FIELDS = ['open', 'close', 'high', 'low', 'volume', 'money']
+FUNDAMENTAL_TABLES = ('valuation', 'balance', 'income', 'cash_flow', 'indicator')
+
+
+def session_minute(dt):
+    """交易分钟序号：09:30 为 0，11:30/13:00 为 120，15:00 为 240；开盘前为负"""
+    minutes = dt.hour * 60 + dt.minute
+    if minutes < 9 * 60 + 30:
+        return minutes - (9 * 60 + 30)
+    if minutes <= 11 * 60 + 30:
+        return minutes - (9 * 60 + 30)
+    if minutes < 13 * 60:
+        return 120
+    return min(120 + minutes - 13 * 60, 240)
+
+
+def minute_time(date, index):
+    """交易分钟序号对应的时间（1~240，表示该分钟结束时刻）"""
+    if index <= 120:
+        base = datetime.datetime.combine(date, datetime.time(9, 30))
+        return base + datetime.timedelta(minutes=index)
+    base = datetime.datetime.combine(date, datetime.time(13, 0))
+    return base + datetime.timedelta(minutes=index - 120)
+
+
+class G(object):
+    """
+    全局变量对象 g
+    pin() 固定的参数不会被策略 initialize 中的赋值覆盖，用于参数扫描
+    """
+
+    def __init__(self):
+        object.__setattr__(self, '_pinned', {})
+
+    def pin(self, params):
+        self._pinned.update(params)
+        for name, value in params.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        if name in self._pinned:
+            return
+        object.__setattr__(self, name, value)
+
+
+class Log(object):
+    LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'warn': 30, 'error': 40}
+
+    def __init__(self, runtime, level='info'):
+        self._runtime = runtime
+        self.level = self.LEVELS[level]
+        self.lines = []
+
+    def set_level(self, *args):
+        # 聚宽的 log.set_level('order', 'error') 只影响系统日志，这里忽略
+        pass
+
+    def _emit(self, level, msg, *args):
+        if self.LEVELS[level] < self.level:
+            return
+        if args:
+            msg = msg % args
+        line = '%s - %s - %s' % (self._runtime.current_dt, level.upper(), msg)
+        self.lines.append(line)
+        print(line)
+
+    def debug(self, msg, *args):
+        self._emit('debug', msg, *args)
+
+    def info(self, msg, *args):
+        self._emit('info', msg, *args)
+
+    def warning(self, msg, *args):
+        self._emit('warning', msg, *args)
+
+    warn = warning
+
+    def error(self, msg, *args):
+        self._emit('error', msg, *args)
+
+
+class SecurityInfo(object):
+    def __init__(self, code, row):
+        self.code = code
+        self.display_name = row['display_name']
+        self.name = row['name']
+        self.start_date = row['start_date']
+        self.end_date = row['end_date']
+        self.type = row['type']
+        self.parent = None
+
+
+class SecurityUnitData(object):
+    """get_current_data()[code] 的行情快照，属性在访问时按当前时间计算"""
+
+    def __init__(self, runtime, code):
+        self._runtime = runtime
+        self.code = code
+
+    @property
+    def last_price(self):
+        return self._runtime.price_now(self.code)
+
+    @property
+    def high_limit(self):
+        return self._runtime.day_value('high_limit', self.code)
+
+    @property
+    def low_limit(self):
+        return self._runtime.day_value('low_limit', self.code)
+
+    @property
+    def day_open(self):
+        if session_minute(self._runtime.current_dt) < -5:
+            return np.nan
+        return self._runtime.day_value('open', self.code)
+
+    @property
+    def paused(self):
+        return bool(self._runtime.day_value('paused', self.code) or 0)
+
+    @property
+    def is_st(self):
+        return self._runtime.is_st(self.code, self._runtime.today)
+
+    @property
+    def name(self):
+        return self._runtime.display_name(self.code)
+
+    # handle_data(context, data) 中的 data[code] 字段
+    close = last_price
+    price = last_price
+
+
+class CurrentData(dict):
+    def __init__(self, runtime):
+        dict.__init__(self)
+        self._runtime = runtime
+
+    def __missing__(self, code):
+        unit = SecurityUnitData(self._runtime, code)
+        self[code] = unit
+        return unit
+
+
+class PricePanel(dict):
+    """多证券 get_price 的返回值：panel['close'] 为 日期 × 证券 的 DataFrame"""
+
+    @property
+    def items(self):
+        return list(self.keys())
+
+    def __reduce__(self):
+        # items 被改成属性后 dict 默认的 pickle 方式不可用
+        return PricePanel, (dict(self),)
+
+
+class Runtime(object):
+    def __init__(self, data, starting_cash=1000000, log_level='info'):
+        self.data = data
+        self.current_dt = None
+        self.g = G()
+        self.log = Log(self, log_level)
+        self.broker = Broker(self.quote, lambda: self.current_dt, starting_cash, self.log)
+        self.options = {}
+        self.benchmark = None
+        self.finance = FinanceNamespace()
+        self.finance.run_query = self.run_query
+        self.scheduler = None  # 由 runner 设置
+
+    # ---------- 时间与行情 ----------
+
+    @property
+    def today(self):
+        return self.current_dt.date()
+
+    def day_index(self, date):
+        """date 在交易日数组中的位置（date 不是交易日时返回其之前最近交易日的位置）"""
+        return int(np.searchsorted(self.data.trade_days, to_date(date), side='right')) - 1
+
+    @property
+    def previous_date(self):
+        index = self.day_index(self.today)
+        if self.data.trade_days[index] == self.today:
+            index -= 1
+        return self.data.trade_days[index] if index >= 0 else None
+
+    def last_visible_day(self):
+        """当前可见的最后一根日线：收盘后为今日，否则为前一交易日"""
+        if self.current_dt.time() >= datetime.time(15, 0):
+            return self.today
+        return self.previous_date
+
+    def day_value(self, field, code, date=None):
+        df = self.data.daily(field)
+        if df is None or code not in df.columns:
+            return np.nan
+        index = self.day_index(date or self.today)
+        return float(df[code].iat[index]) if index >= 0 else np.nan
+
+    def price_now(self, code):
+        """当前时间的最新价"""
+        minute = session_minute(self.current_dt)
+        if minute < -5:
+            return self.day_value('close', code, self.previous_date)
+        minute_df = self.data.minute_close(self.today)
+        if minute_df is not None and code in minute_df.columns and minute > 0:
+            return float(minute_df[code].iat[min(minute, len(minute_df)) - 1])
+        day_open = self.day_value('open', code)
+        day_close = self.day_value('close', code)
+        return round(day_open + (day_close - day_open) * max(minute, 0) / 240.0, 2)
+
+    def minute_prices(self, codes, count):
+        """最近 count 个已完成分钟的收盘价，DataFrame（时间 × 证券）"""
+        end = session_minute(self.current_dt)
+        indexes = [i for i in range(max(end - count + 1, 1), end + 1)] or [max(end, 0)]
+        minute_df = self.data.minute_close(self.today)
+        times = [minute_time(self.today, i) for i in indexes]
+        if minute_df is not None:
+            frame = minute_df.reindex(columns=codes).iloc[[i - 1 for i in indexes if i > 0]]
+            frame.index = times[-len(frame):]
+            return frame
+        day_open = np.array([self.day_value('open', c) for c in codes])
+        day_close = np.array([self.day_value('close', c) for c in codes])
+        values = [np.round(day_open + (day_close - day_open) * i / 240.0, 2) for i in indexes]
+        return pd.DataFrame(values, index=times, columns=codes)
+
+    def quote(self, code):
+        return (self.price_now(code), self.day_value('high_limit', code),
+                self.day_value('low_limit', code), bool(self.day_value('paused', code) or 0))
+
+    def display_name(self, code):
+        securities = self.data.securities
+        return securities.at[code, 'display_name'] if code in securities.index else code
+
+    def is_st(self, code, date):
+        extras = self.data.extras('is_st')
+        if extras is not None and code in extras.columns:
+            index = self.day_index(date)
+            return bool(extras[code].iat[index]) if index >= 0 else False
+        name = self.display_name(code)
+        return 'ST' in name or '*' in name or '退' in name
+
+    def _adjust(self, field, frame, fq):
+        """fq='pre' 且有复权因子时前复权到当前日期"""
+        if fq != 'pre' or field not in PRICE_FIELDS:
+            return frame
+        factor = self.data.daily('factor')
+        if factor is None:
+            return frame
+        factor = factor.reindex(columns=frame.columns)
+        current = factor.iloc[self.day_index(self.today)]
+        return frame * factor.loc[frame.index] / current
+
+    # ---------- 行情 API ----------
+
+    def get_price(self, security, start_date=None, end_date=None, frequency='daily',
+                  fields=None, skip_paused=False, fq='pre', count=None, panel=True,
+                  fill_paused=True):
+        single = isinstance(security, str)
+        codes = [security] if single else list(security)
+        if fields is None:
+            fields = list(DEFAULT_FIELDS)
+        elif isinstance(fields, str):
+            fields = [fields]
+
+        if frequency in ('1m', 'minute'):
+            frame = self.minute_prices(codes, count or 1)
+            frames = {}
+            for field in fields:
+                if field in ('high_limit', 'low_limit', 'paused', 'pre_close'):
+                    # 当日不变的字段取日线值
+                    row = [self.day_value(field, c) for c in codes]
+                    frames[field] = pd.DataFrame([row] * len(frame), index=frame.index, columns=codes)
+                else:
+                    frames[field] = frame
+        else:
+            visible = self.last_visible_day()
+            end = min(to_date(end_date), visible) if end_date is not None else visible
+            stop = self.day_index(end) + 1
+            if count is not None:
+                begin = 0 if (single and skip_paused) else max(stop - count, 0)
+            else:
+                begin = int(np.searchsorted(self.data.trade_days, to_date(start_date)))
+            frames = {}
+            for field in fields:
+                source = self.data.daily('close' if field == 'avg' and self.data.daily('avg') is None else field)
+                if source is None:
+                    source = pd.DataFrame(np.nan, index=self.data.daily('close').index, columns=codes)
+                frames[field] = self._adjust(field, source.iloc[begin:stop].reindex(columns=codes), fq)
+
+        if single:
+            df = pd.DataFrame({f: frames[f][security] for f in fields})
+            if skip_paused and frequency not in ('1m', 'minute'):
+                paused = self.data.daily('paused')
+                if paused is not None and security in paused.columns:
+                    df = df[paused[security].reindex(df.index).fillna(0).values == 0]
+                if count is not None:
+                    df = df.iloc[-count:]
+            return df
+        if panel:
+            return PricePanel(frames)
+        long_frames = []
+        for field in fields:
+            stacked = frames[field].stack(future_stack=True).rename(field)
+            long_frames.append(stacked)
+        df = pd.concat(long_frames, axis=1).reset_index()
+        df.columns = ['time', 'code'] + fields
+        return df
+
+    def history(self, count, unit='1d', field='avg', security_list=None, df=True,
+                skip_paused=False, fq='pre'):
+        codes = security_list if security_list is not None else []
+        codes = [codes] if isinstance(codes, str) else list(codes)
+        if unit in ('1m', 'minute'):
+            frame = self.minute_prices(codes, count)
+        else:
+            # history 不包含当天
+            stop = self.day_index(self.previous_date) + 1
+            source = self.data.daily(field) if field != 'avg' or self.data.daily('avg') is not None \
+                else self.data.daily('close')
+            frame = self._adjust(field, source.iloc[max(stop - count, 0):stop].reindex(columns=codes), fq)
+        if df:
+            return frame
+        return {c: frame[c].values for c in codes}
+
+    def attribute_history(self, security, count, unit='1d', fields=None, skip_paused=True,
+                          df=True, fq='pre'):
+        fields = fields or DEFAULT_FIELDS
+        if unit in ('1m', 'minute'):
+            frame = self.minute_prices([security], count)[security]
+            result = pd.DataFrame({f: frame for f in fields})
+        else:
+            result = self.get_price(security, end_date=self.previous_date, fields=list(fields),
+                                    count=count, skip_paused=skip_paused, fq=fq)
+        return result if df else {f: result[f].values for f in fields}
+
+    def get_current_data(self):
+        return CurrentData(self)
+
+    def get_call_auction(self, security, start_date=None, end_date=None, fields=None):
+        """集合竞价：以当日开盘价作为 09:25 成交价"""
+        codes = [security] if isinstance(security, str) else list(security)
+        if session_minute(self.current_dt) < -5:
+            return pd.DataFrame(columns=['code', 'time', 'current'])
+        time = datetime.datetime.combine(self.today, datetime.time(9, 25))
+        df = pd.DataFrame({'code': codes, 'time': time,
+                           'current': [self.day_value('open', c) for c in codes],
+                           'volume': [0] * len(codes), 'money': [0] * len(codes)})
+        return df if fields is None else df[['code'] + [f for f in fields if f != 'code']]
+
+    # ---------- 证券信息 ----------
+
+    def get_all_securities(self, types=None, date=None):
+        securities = self.data.securities
+        if types:
+            types = [types] if isinstance(types, str) else types
+            securities = securities[securities['type'].isin(types)]
+        date = to_date(date) if date is not None else self.today
+        mask = (securities['start_date'] <= date) & (securities['end_date'] >= date)
+        return securities[mask][['display_name', 'name', 'start_date', 'end_date', 'type']]
+
+    def get_security_info(self, code, date=None):
+        securities = self.data.securities
+        if code not in securities.index:
+            return None
+        return SecurityInfo(code, securities.loc[code])
+
+    def get_trade_days(self, start_date=None, end_date=None, count=None):
+        days = self.data.trade_days
+        stop = self.day_index(end_date) + 1 if end_date is not None else len(days)
+        if count is not None:
+            return days[max(stop - count, 0):stop]
+        begin = int(np.searchsorted(days, to_date(start_date))) if start_date is not None else 0
+        return days[begin:stop]
+
+    def get_all_trade_days(self):
+        return self.data.trade_days
+
+    def get_extras(self, info, security_list, start_date=None, end_date=None, df=True, count=None):
+        codes = [security_list] if isinstance(security_list, str) else list(security_list)
+        days = self.get_trade_days(start_date, end_date or self.previous_date, count)
+        index = pd.to_datetime(days)
+        extras = self.data.extras(info)
+        if extras is not None:
+            frame = extras.reindex(index=index, columns=codes)
+        elif info == 'is_st':
+            frame = pd.DataFrame({c: [self.is_st(c, d) for d in days] for c in codes}, index=index)
+        else:
+            frame = pd.DataFrame(np.nan, index=index, columns=codes)
+        if info == 'is_st':
+            frame = frame.fillna(False).astype(bool)
+        return frame if df else {c: frame[c].values for c in codes}
+
+    # ---------- 财务数据 ----------
+
+    def _snapshot(self, table, date):
+        """财务表在 date 当日可见的最新一行（按证券）"""
+        df = self.data.table('fundamentals', table.name)
+        if df is None:
+            raise IOError('缺少财务数据表: fundamentals/%s' % table.name)
+        if 'day' in df.columns:
+            df = df[df['day'] <= date]
+            df = df.sort_values('day').groupby('code', sort=False).tail(1)
+        return df.add_prefix(table.name + '.')
+
+    def get_fundamentals(self, query_object, date=None, statDate=None):
+        date = to_date(date) if date is not None else self.previous_date
+        frame = None
+        for table in query_object.tables():
+            snapshot = self._snapshot(table, date)
+            key = table.name + '.code'
+            if frame is None:
+                frame = snapshot
+                frame_key = key
+            else:
+                frame = frame.merge(snapshot, left_on=frame_key, right_on=key, how='inner')
+        if frame is None:
+            return pd.DataFrame()
+        return query_object.execute(frame.reset_index(drop=True))
+
+    def run_query(self, query_object):
+        frame = None
+        for table in query_object.tables():
+            df = self.data.table(table.kind, table.name)
+            if df is None:
+                raise IOError('缺少数据表: %s/%s' % (table.kind, table.name))
+            frame = df.add_prefix(table.name + '.')
+        return query_object.execute(frame.reset_index(drop=True))
+
+    def hsl(self, security_list, check_date=None, N=5, unit='1d', include_now=True):
+        """换手率及其N日均值，取自 fundamentals/valuation 的 turnover_ratio"""
+        df = self.data.table('fundamentals', 'valuation')
+        date = to_date(check_date) if check_date is not None else self.previous_date
+        days = set(self.get_trade_days(end_date=date, count=N))
+        df = df[df['code'].isin(list(security_list)) & df['day'].isin(days)]
+        pivot = df.pivot_table(index='day', columns='code', values='turnover_ratio')
+        latest = pivot.iloc[-1].to_dict() if len(pivot) else {}
+        mean = pivot.mean().to_dict()
+        return latest, mean
+
+    # ---------- 设置与下单 ----------
+
+    def set_benchmark(self, security):
+        self.benchmark = security
+
+    def set_option(self, key, value):
+        self.options[key] = value
+
+    def set_slippage(self, slippage, type=None):
+        self.broker.slippage = slippage
+
+    def set_order_cost(self, cost, type=None, ref=None):
+        self.broker.order_cost = cost
+
+    def api_namespace(self):
+        """注入到 jqdata 模块的名字"""
+        broker = self.broker
+        namespace = {
+            'g': self.g,
+            'log': self.log,
+            'query': query,
+            'finance': self.finance,
+            'get_price': self.get_price,
+            'history': self.history,
+            'attribute_history': self.attribute_history,
+            'get_current_data': self.get_current_data,
+            'get_call_auction': self.get_call_auction,
+            'get_all_securities': self.get_all_securities,
+            'get_security_info': self.get_security_info,
+            'get_trade_days': self.get_trade_days,
+            'get_all_trade_days': self.get_all_trade_days,
+            'get_extras': self.get_extras,
+            'get_fundamentals': self.get_fundamentals,
+            'set_benchmark': self.set_benchmark,
+            'set_option': self.set_option,
+            'set_slippage': self.set_slippage,
+            'set_order_cost': self.set_order_cost,
+            'OrderCost': OrderCost,
+            'PriceRelatedSlippage': PriceRelatedSlippage,
+            'FixedSlippage': FixedSlippage,
+            'OrderStatus': OrderStatus,
+            'order': broker.order,
+            'order_target': broker.order_target,
+            'order_value': broker.order_value,
+            'order_target_value': broker.order_target_value,
+            'subscribe': lambda *args, **kwargs: None,
+            'unsubscribe': lambda *args, **kwargs: None,
+            'unsubscribe_all': lambda *args, **kwargs: None,
+        }
+        for name in FUNDAMENTAL_TABLES:
+            namespace[name] = Table(name)
+        if self.scheduler is not None:
+            namespace.update({
+                'run_daily': self.scheduler.run_daily,
+                'run_weekly': self.scheduler.run_weekly,
+                'run_monthly': self.scheduler.run_monthly,
+                'unschedule_all': self.scheduler.unschedule_all,
+            })
+        return namespace
@@ -0,0 +1,436 @@
+# -*- coding: utf-8 -*-
+"""
+策略与下单执行器热点函数的性能基准
+
+在合成的 5000 只股票市场上，用本地 jqdata、内存 sqlite 订单库（替代 MySQL）和
+记录型 passorder 调用真实的策略/执行器函数，统计：
+    wall_ms     每次调用的耗时（多次重复取中位数，另记最小值）
+    api_calls   每次调用中各数据接口/数据库/下单函数的调用次数
+    peak_kb     tracemalloc 统计的峰值内存（单独一轮，不计入耗时）
+结果写入 JSON；给出基线文件时逐项比较，耗时或峰值内存超过阈值、接口调用次数
+增加都记为退化，有退化时以非零状态退出。
+
+用法：
+    python -m jqlocal.bench --data ./bench_data --out bench.json --baseline bench_baseline.json
+    首次运行会在 --data 目录生成合成数据；--save-baseline 把本次结果保存为基线。
+"""
+import argparse
+import collections
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+
+import numpy as np
+import pandas as pd
+
+from jqlocal.data import LocalData
+from jqlocal.runner import Backtest
+from jqlocal.synthetic import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_THRESHOLD = 0.2
+
+
+class CallCounter(object):
+    """统计 API 调用次数：wrap() 用于 Backtest(wrap_api=...)"""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def reset(self):
+        self.counts.clear()
+
+    def wrap_function(self, name, func):
+        counts = self.counts
+
+        def wrapper(*args, **kwargs):
+            counts[name] += 1
+            return func(*args, **kwargs)
+        wrapper.__name__ = name
+        return wrapper
+
+    def wrap(self, namespace):
+        wrapped = dict(namespace)
+        for name, value in namespace.items():
+            if isinstance(value, (types.FunctionType, types.MethodType)):
+                wrapped[name] = self.wrap_function(name, value)
+        finance = namespace.get('finance')
+        if finance is not None and finance.run_query is not None:
+            finance.run_query = self.wrap_function('finance.run_query', finance.run_query)
+        return wrapped
+
+
+# ---------- 订单库与 passorder 替身 ----------
+
+class _Cursor(object):
+    """把执行器中的 MySQL 语句转换为 sqlite 语句执行"""
+
+    def __init__(self, db):
+        self._db = db
+        self._cursor = db.sqlite.cursor()
+
+    def execute(self, sql, params=()):
+        self._db.counter['db.execute'] += 1
+        sql = (sql.replace('`order`.', '').replace('%s', '?')
+               .replace('CURDATE()', "date('now')").replace('DATE(tradetime)', 'date(tradetime)'))
+        self._cursor.execute(sql, params)
+
+    def executemany(self, sql, seq):
+        self._db.counter['db.execute'] += 1
+        self._cursor.executemany(sql.replace('`order`.', '').replace('%s', '?'), seq)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+
+class _Connection(object):
+    def __init__(self, db):
+        self._db = db
+
+    def cursor(self):
+        return _Cursor(self._db)
+
+    def commit(self):
+        self._db.counter['db.commit'] += 1
+        self._db.sqlite.commit()
+
+    def rollback(self):
+        self._db.sqlite.rollback()
+
+    def close(self):
+        pass
+
+
+class OrderDB(object):
+    """
+    内存 sqlite 订单库，表结构与 joinquant_stock 一致
+    module() 返回可替换 pymysql 的模块对象
+    """
+
+    def __init__(self, counter):
+        self.counter = counter
+        self.sqlite = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+        self.sqlite.execute("""CREATE TABLE joinquant_stock (
+            pk TEXT PRIMARY KEY, code TEXT, tradetime TIMESTAMP, order_values INTEGER,
+            price REAL, ordertype TEXT, if_deal INTEGER, insertdate TIMESTAMP,
+            fill_qty INTEGER, fill_price REAL, fill_status TEXT, fill_time TIMESTAMP)""")
+
+    def connect(self, *args, **kwargs):
+        self.counter['db.connect'] += 1
+        return _Connection(self)
+
+    def module(self):
+        module = types.ModuleType('pymysql')
+        module.connect = self.connect
+        module.Error = sqlite3.Error
+        return module
+
+    def insert_orders(self, orders):
+        self.sqlite.execute('DELETE FROM joinquant_stock')
+        self.sqlite.executemany(
+            'INSERT INTO joinquant_stock (pk, code, tradetime, order_values, price, ordertype, if_deal, '
+            'insertdate) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(o['pk'], o['code'], o['tradetime'], o['order_values'], o['price'], o['ordertype'],
+              0, o['tradetime']) for o in orders])
+        self.sqlite.commit()
+
+
+class PositionStub(object):
+    def __init__(self, code, volume):
+        self.m_strInstrumentID = code
+        self.m_strInstrumentName = code
+        self.m_nVolume = volume
+        self.m_nCanUseVolume = volume
+
+
+class ContextInfoStub(object):
+    def __init__(self):
+        self.accID = 'BENCH'
+
+    def set_account(self, account):
+        self.accID = account
+
+    def subscribe_quote(self, stock_code, period='tick', dividend_type='none', result_type='', callback=None):
+        return 0
+
+    def unsubscribe_quote(self, sub_id):
+        pass
+
+    def get_full_tick(self, stock_codes):
+        # 无实时行情：执行器按数据库价格定价
+        return {}
+
+
+def fixed_datetime(now):
+    """替换执行器模块中的 datetime，使交易时段判断固定在 now"""
+
+    class FixedDatetime(datetime.datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+
+        @classmethod
+        def today(cls):
+            return now
+    return FixedDatetime
+
+
+def load_executor(counter, db, positions, now):
+    """加载 iquant_executor，把数据库、passorder、持仓查询和 sleep 换成本地替身"""
+    saved = sys.modules.get('pymysql')
+    sys.modules['pymysql'] = db.module()
+    try:
+        module = types.ModuleType('iquant_executor_bench')
+        path = os.path.join(REPO_DIR, 'iquant_executor.py')
+        module.__file__ = path
+        with open(path, 'rb') as f:
+            exec(compile(f.read(), path, 'exec'), module.__dict__)
+    finally:
+        if saved is None:
+            del sys.modules['pymysql']
+        else:
+            sys.modules['pymysql'] = saved
+
+    def passorder(*args, **kwargs):
+        counter['passorder'] += 1
+        return 0
+
+    def get_trade_detail_data(account, market, kind, *args):
+        counter['get_trade_detail_data'] += 1
+        return list(positions) if kind == 'position' else []
+
+    module.passorder = passorder
+    module.get_trade_detail_data = get_trade_detail_data
+    module.datetime = fixed_datetime(now)
+    module.time = types.SimpleNamespace(sleep=lambda seconds: counter.update(['time.sleep']),
+                                        time=time.time)
+    module.print = lambda *args, **kwargs: None
+    return module
+
+
+def make_orders(codes, now, n_sell, n_buy):
+    orders = []
+    for i, code in enumerate(codes[:n_sell + n_buy]):
+        orders.append({'pk': 'bench-%04d' % i, 'code': code.replace('.XSHG', '.SH').replace('.XSHE', '.SZ'),
+                       'tradetime': now, 'order_values': 1000, 'price': 10.0,
+                       'ordertype': u'卖' if i < n_sell else u'买'})
+    return orders
+
+
+# ---------- 基准用例 ----------
+
+class BenchmarkSuite(object):
+    """
+    基准用例集合
+    每个用例的 setup() 在计时之外准备好状态，返回无参数的被测函数
+    """
+
+    def __init__(self, data, repeats=5):
+        self.data = data
+        self.repeats = repeats
+        self.counter = CallCounter()
+        days = data.trade_days
+        # 留出足够的历史（新股过滤、历史低位回看）
+        self.day = days[-1]
+        self.start = days[min(40, len(days) - 1)]
+        self.cases = collections.OrderedDict()
+        self._register()
+
+    # ----- 策略 -----
+
+    def _strategy(self, filename, prepare=(), when='14:00'):
+        backtest = Backtest(os.path.join(REPO_DIR, filename), self.data, self.start, self.day,
+                            log_level='error', wrap_api=self.counter.wrap)
+        context = backtest.initialize()
+        backtest.start_day(self.day)
+        for time_str, name in prepare:
+            backtest.set_time(self.day, time_str)
+            getattr(backtest.strategy, name)(context)
+        backtest.set_time(self.day, when)
+        return backtest, context
+
+    def _strategy_case(self, filename, func, prepare=(), when='14:00', args=None):
+        def setup():
+            backtest, context = self._strategy(filename, prepare, when)
+            target = getattr(backtest.strategy, func)
+            call_args = args(backtest, context) if args else (context,)
+            return lambda: target(*call_args)
+        return setup
+
+    def _dividend_args(self, backtest, context):
+        module = backtest.strategy
+        stocks = module.get_all_securities().index.tolist()
+        stocks = module.filter_kcbj_stock(stocks)
+        return (context, stocks, False, 0, 0.5)
+
+    def _push_args(self, backtest, context):
+        module = backtest.strategy
+        real_create_engine = module.create_engine
+        # 把 MySQL 换成内存 sqlite
+        module.create_engine = lambda url, **kwargs: real_create_engine('sqlite://')
+        now = context.current_dt
+        orders = [{'pk': 'bench-%04d' % i, 'code': code, 'tradetime': now, 'order_values': 1000,
+                   'price': 10.0, 'ordertype': u'买', 'if_deal': False, 'insertdate': now}
+                  for i, code in enumerate(self.data.securities.index[:12])]
+        return (orders,)
+
+    # ----- 执行器 -----
+
+    def _executor_case(self, func, n_sell=3, n_buy=5):
+        def setup():
+            counter = self.counter.counts
+            db = OrderDB(counter)
+            now = datetime.datetime.combine(datetime.date.today(), datetime.time(10, 0))
+            orders = make_orders(list(self.data.securities.index), now, n_sell, n_buy)
+            positions = [PositionStub(o['code'].split('.')[0], 5000) for o in orders[:n_sell]]
+            db.insert_orders(orders)
+            module = load_executor(counter, db, positions, now)
+            context = ContextInfoStub()
+            if func == 'execute_trade_orders':
+                return lambda: module.execute_trade_orders(context)
+            rows = module.get_data('SELECT * FROM `order`.joinquant_stock WHERE if_deal = 0')
+            account = module.Account(context.accID, 1.0)
+            account.positions = {module.normalize_stock_code(p.m_strInstrumentID): p.m_nVolume for p in positions}
+            row = rows.iloc[0]
+            return lambda: module.process_single_order(row, context, account, [], 24, 23)
+        return setup
+
+    def _register(self):
+        jq_prepare = [('9:05', 'prepare_stock_list')]
+        self.cases['joinquant.get_stock_list'] = self._strategy_case('joinquant.py', 'get_stock_list')
+        self.cases['joinquant.get_dividend_ratio_filter_list'] = self._strategy_case(
+            'joinquant.py', 'get_dividend_ratio_filter_list', args=self._dividend_args)
+        self.cases['joinquant.weekly_adjustment'] = self._strategy_case(
+            'joinquant.py', 'weekly_adjustment', prepare=jq_prepare)
+        self.cases['joinquant.push_order_command'] = self._strategy_case(
+            'joinquant.py', 'push_order_command', args=self._push_args)
+        self.cases['joinquant_nodb.get_stock_list'] = self._strategy_case('joinquant_nodb.py', 'get_stock_list')
+        self.cases['joinquant_nodb.weekly_adjustment'] = self._strategy_case(
+            'joinquant_nodb.py', 'weekly_adjustment', prepare=jq_prepare)
+        self.cases['joinquant_daban.scan_first_board_stocks'] = self._strategy_case(
+            'joinquant_daban.py', 'scan_first_board_stocks', prepare=[('09:00', 'prepare_trading_day')],
+            when='09:25')
+        self.cases['joinquant_wande.get_micro_cap_stocks'] = self._strategy_case(
+            'joinquant_wande.py', 'get_micro_cap_stocks')
+        self.cases['iquant_executor.execute_trade_orders'] = self._executor_case('execute_trade_orders')
+        self.cases['iquant_executor.process_single_order'] = self._executor_case('process_single_order')
+
+    # ----- 运行 -----
+
+    def measure(self, name):
+        setup = self.cases[name]
+        times = []
+        calls = None
+        for _ in range(self.repeats):
+            func = setup()
+            self.counter.reset()
+            start = time.perf_counter()
+            func()
+            times.append((time.perf_counter() - start) * 1000)
+            calls = dict(self.counter.counts)
+
+        func = setup()
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return {'status': 'ok', 'wall_ms': statistics.median(times), 'wall_ms_min': min(times),
+                'repeats': self.repeats, 'api_calls': calls, 'peak_kb': peak / 1024.0}
+
+    def run(self, names=None):
+        results = collections.OrderedDict()
+        for name in names or self.cases:
+            try:
+                results[name] = self.measure(name)
+            except ImportError as e:
+                results[name] = {'status': 'skipped', 'reason': str(e)}
+            except Exception as e:
+                results[name] = {'status': 'error', 'reason': '%s: %s' % (type(e).__name__, e)}
+            line = results[name]
+            print('%-48s %s' % (name, '%.1f ms, %.0f KB' % (line['wall_ms'], line['peak_kb'])
+                                if line['status'] == 'ok' else '%s (%s)' % (line['status'], line['reason'])))
+        return results
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """与基线比较，返回退化描述列表"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base or current.get('status') != 'ok' or base.get('status') != 'ok':
+            continue
+        if current['wall_ms'] > base['wall_ms'] * (1 + threshold):
+            regressions.append('%s: 耗时 %.1f ms -> %.1f ms' % (name, base['wall_ms'], current['wall_ms']))
+        if current['peak_kb'] > base['peak_kb'] * (1 + threshold):
+            regressions.append('%s: 峰值内存 %.0f KB -> %.0f KB' % (name, base['peak_kb'], current['peak_kb']))
+        for api, count in current['api_calls'].items():
+            if count > base['api_calls'].get(api, 0):
+                regressions.append('%s: %s 调用 %d -> %d 次' % (name, api, base['api_calls'].get(api, 0), count))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='策略与执行器性能基准')
+    parser.add_argument('--data', default='bench_data', help='合成数据目录，不存在时自动生成')
+    parser.add_argument('--stocks', type=int, default=5000)
+    parser.add_argument('--days', type=int, default=60)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--only', nargs='*', help='只运行指定用例')
+    parser.add_argument('--out', default='bench.json')
+    parser.add_argument('--baseline', help='基线 JSON 文件')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果写入 --baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(os.path.join(args.data, 'securities.csv')) and \
+            not os.path.exists(os.path.join(args.data, 'securities.parquet')):
+        print('生成合成数据: %d 只股票, %d 个交易日' % (args.stocks, args.days))
+        generate(args.data, args.stocks, days=args.days)
+    suite = BenchmarkSuite(LocalData(args.data), args.repeats)
+    results = suite.run(args.only)
+
+    report = {
+        'meta': {'time': datetime.datetime.now().isoformat(timespec='seconds'),
+                 'python': platform.python_version(), 'numpy': np.__version__,
+                 'pandas': pd.__version__, 'stocks': len(suite.data.securities),
+                 'days': len(suite.data.trade_days), 'repeats': args.repeats},
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print('基线已保存: %s' % args.baseline)
+    elif args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.threshold)
+        for line in regressions:
+            print('退化 ' + line)
+        if regressions:
+            sys.exit(1)
+        print('与基线相比没有退化')
+
+
+if __name__ == '__main__':
+    main()
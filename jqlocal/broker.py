@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+本地撮合与账户
+
+下单按当前价格立即成交：买入整手向下取整、不能买涨停、不能卖跌停、停牌不成交，
+T+1 可卖数量、滑点（PriceRelatedSlippage/FixedSlippage）和交易费用（OrderCost）
+与聚宽回测的口径一致。
+"""
+import itertools
+
+import numpy as np
+
+
+class OrderCost(object):
+    def __init__(self, open_tax=0, close_tax=0.001, open_commission=0.0003,
+                 close_commission=0.0003, close_today_commission=0, min_commission=5):
+        self.open_tax = open_tax
+        self.close_tax = close_tax
+        self.open_commission = open_commission
+        self.close_commission = close_commission
+        self.close_today_commission = close_today_commission
+        self.min_commission = min_commission
+
+    def fee(self, value, is_buy):
+        if value <= 0:
+            return 0.0
+        if is_buy:
+            return max(value * self.open_commission, self.min_commission) + value * self.open_tax
+        return max(value * self.close_commission, self.min_commission) + value * self.close_tax
+
+
+class PriceRelatedSlippage(object):
+    """按价格比例的双边滑点，买卖各承担一半"""
+
+    def __init__(self, ratio=0.00246):
+        self.ratio = ratio
+
+    def apply(self, price, is_buy):
+        return price * (1 + self.ratio / 2.0) if is_buy else price * (1 - self.ratio / 2.0)
+
+
+class FixedSlippage(object):
+    """固定价差的双边滑点"""
+
+    def __init__(self, spread=0.02):
+        self.spread = spread
+
+    def apply(self, price, is_buy):
+        return price + self.spread / 2.0 if is_buy else price - self.spread / 2.0
+
+
+class OrderStatus(object):
+    open = 'open'
+    filled = 'filled'
+    canceled = 'canceled'
+    rejected = 'rejected'
+    held = 'held'
+    new = 'new'
+
+
+class Order(object):
+    _ids = itertools.count(1)
+
+    def __init__(self, security, amount, price, is_buy, add_time, commission):
+        self.order_id = next(Order._ids)
+        self.security = security
+        self.amount = amount
+        self.filled = amount
+        self.price = price
+        self.avg_cost = price
+        self.is_buy = is_buy
+        self.add_time = add_time
+        self.commission = commission
+        self.status = OrderStatus.held
+        self.side = 'long'
+
+    def __repr__(self):
+        return 'Order(%s %s %d @ %.2f)' % (self.security, 'buy' if self.is_buy else 'sell',
+                                           self.amount, self.price)
+
+
+class Position(object):
+    def __init__(self, security, broker):
+        self.security = security
+        self._broker = broker
+        self.total_amount = 0
+        self.today_amount = 0
+        self.avg_cost = 0.0
+        self.acc_avg_cost = 0.0
+        self.init_time = None
+        self.transact_time = None
+
+    @property
+    def closeable_amount(self):
+        return self.total_amount - self.today_amount
+
+    @property
+    def price(self):
+        return self._broker.price(self.security)
+
+    @property
+    def value(self):
+        return self.total_amount * self.price
+
+    def __repr__(self):
+        return 'Position(%s, %d)' % (self.security, self.total_amount)
+
+
+class Positions(dict):
+    """只包含有持仓的证券；访问未持有的证券返回空持仓而不插入"""
+
+    def __init__(self, broker):
+        dict.__init__(self)
+        self._broker = broker
+
+    def __missing__(self, security):
+        return Position(security, self._broker)
+
+
+class Portfolio(object):
+    def __init__(self, broker, starting_cash):
+        self._broker = broker
+        self.starting_cash = starting_cash
+        self.cash = float(starting_cash)
+        self.positions = Positions(broker)
+        self.long_positions = self.positions
+        self.short_positions = {}
+
+    @property
+    def available_cash(self):
+        return self.cash
+
+    @property
+    def transferable_cash(self):
+        return self.cash
+
+    @property
+    def positions_value(self):
+        return sum(p.value for p in self.positions.values())
+
+    @property
+    def total_value(self):
+        return self.cash + self.positions_value
+
+    @property
+    def returns(self):
+        return self.total_value / self.starting_cash - 1
+
+
+class Broker(object):
+    """
+    本地撮合
+    quote(security) 返回 (当前价, 涨停价, 跌停价, 是否停牌)，由运行时提供
+    """
+
+    def __init__(self, quote, now, starting_cash, log):
+        self._quote = quote
+        self._now = now
+        self.log = log
+        self.order_cost = OrderCost(0, 0.001, 0.0003, 0.0003, 0, 5)
+        self.slippage = PriceRelatedSlippage(0.00246)
+        self.portfolio = Portfolio(self, starting_cash)
+        self.orders = []
+        self.traded_value = 0.0
+
+    def price(self, security):
+        return self._quote(security)[0]
+
+    def start_day(self):
+        """新交易日：昨日买入的股票变为可卖，清空当日委托"""
+        for position in self.portfolio.positions.values():
+            position.today_amount = 0
+        self.orders = []
+
+    def order(self, security, amount):
+        """按股数下单，amount 为正买入、为负卖出，返回 Order 或 None"""
+        amount = int(amount)
+        if amount == 0:
+            return None
+        price, high_limit, low_limit, paused = self._quote(security)
+        if paused or not price or not np.isfinite(price) or price <= 0:
+            self.log.warning('%s 停牌或无价格，下单失败' % security)
+            return None
+        is_buy = amount > 0
+        positions = self.portfolio.positions
+
+        if is_buy:
+            if high_limit and price >= high_limit - 0.005:
+                self.log.warning('%s 涨停，买入失败' % security)
+                return None
+            deal_price = self.slippage.apply(price, True)
+            amount = amount // 100 * 100
+            # 资金不足时按可用资金缩减到整手
+            while amount > 0:
+                value = amount * deal_price
+                if value + self.order_cost.fee(value, True) <= self.portfolio.cash:
+                    break
+                amount = int(self.portfolio.cash / deal_price / (1 + self.order_cost.open_commission)) // 100 * 100
+                if amount * deal_price + self.order_cost.fee(amount * deal_price, True) > self.portfolio.cash:
+                    amount -= 100
+            if amount <= 0:
+                self.log.warning('%s 可用资金不足，买入失败' % security)
+                return None
+            value = amount * deal_price
+            fee = self.order_cost.fee(value, True)
+            position = positions.get(security)
+            if position is None:
+                position = Position(security, self)
+                position.init_time = self._now()
+                positions[security] = position
+            cost = position.avg_cost * position.total_amount + value + fee
+            position.total_amount += amount
+            position.today_amount += amount
+            position.avg_cost = cost / position.total_amount
+            position.acc_avg_cost = position.avg_cost
+            position.transact_time = self._now()
+            self.portfolio.cash -= value + fee
+        else:
+            position = positions.get(security)
+            if position is None or position.closeable_amount <= 0:
+                self.log.warning('%s 无可卖持仓，卖出失败' % security)
+                return None
+            if low_limit and price <= low_limit + 0.005:
+                self.log.warning('%s 跌停，卖出失败' % security)
+                return None
+            amount = min(-amount, position.closeable_amount)
+            # 不是全部卖出时按整手卖出
+            if amount < position.total_amount:
+                amount = amount // 100 * 100
+            if amount <= 0:
+                return None
+            deal_price = self.slippage.apply(price, False)
+            value = amount * deal_price
+            fee = self.order_cost.fee(value, False)
+            position.total_amount -= amount
+            position.transact_time = self._now()
+            self.portfolio.cash += value - fee
+            if position.total_amount <= 0:
+                del positions[security]
+
+        self.traded_value += value
+        order = Order(security, amount, deal_price, is_buy, self._now(), fee)
+        self.orders.append(order)
+        return order
+
+    def order_target(self, security, amount):
+        current = self.portfolio.positions[security].total_amount
+        return self.order(security, int(amount) - current)
+
+    def order_value(self, security, value):
+        price = self.price(security)
+        if not price or not np.isfinite(price) or price <= 0:
+            return None
+        return self.order(security, int(value / price))
+
+    def order_target_value(self, security, value):
+        price = self.price(security)
+        if not price or not np.isfinite(price) or price <= 0:
+            return None
+        current = self.portfolio.positions[security].total_amount
+        target = int(value / price)
+        if value <= 0:
+            target = 0
+        elif target > current:
+            # 加仓部分按整手
+            target = current + (target - current) // 100 * 100
+        return self.order(security, target - current)
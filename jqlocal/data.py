@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+本地数据层
+
+数据目录结构（每个文件可以是 .parquet 或 .csv，优先读取 parquet）：
+
+    securities            证券列表：code, display_name, name, start_date, end_date, type
+    daily/<field>         日线宽表：行为交易日，列为证券代码
+                          常用字段 open/close/high/low/volume/money/high_limit/low_limit/paused，
+                          可选 factor（复权因子，存在时 fq='pre' 按当前日期前复权）
+    minute/<YYYYMMDD>     可选，分钟收盘价宽表：行为分钟时间，列为证券代码
+    extras/<name>         get_extras 数据宽表，如 extras/is_st
+    fundamentals/<table>  财务长表：code, day + 各字段，如 fundamentals/valuation
+    finance/<table>       finance 长表，如 finance/STK_XR_XD
+    benchmark             可选，基准收盘价：day, close
+    store/                可选，store.MatrixStore 行情矩阵；存在时日线字段优先从这里读取
+"""
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def to_date(value):
+    """把字符串、datetime、Timestamp 统一转换为 datetime.date"""
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return pd.Timestamp(value).date()
+
+
+def read_table(path):
+    """读取 path.parquet 或 path.csv，文件不存在返回 None"""
+    if os.path.exists(path + '.parquet'):
+        return pd.read_parquet(path + '.parquet')
+    if os.path.exists(path + '.csv'):
+        return pd.read_csv(path + '.csv')
+    return None
+
+
+def wide_index(df):
+    """宽表的第一列（csv）或索引（parquet）作为 DatetimeIndex"""
+    if not isinstance(df.index, pd.DatetimeIndex):
+        df = df.set_index(df.columns[0])
+        df.index = pd.to_datetime(df.index)
+    df.index.name = None
+    return df
+
+
+def write_table(df, path, fmt='parquet'):
+    """写出 path.parquet 或 path.csv"""
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    if fmt == 'parquet':
+        df.to_parquet(path + '.parquet')
+    else:
+        df.to_csv(path + '.csv')
+
+
+class LocalData(object):
+    """按需加载并缓存本地数据文件"""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self._daily = {}
+        self._extras = {}
+        self._tables = {}
+        self._minute = {}
+        self._securities = None
+        self._trade_days = None
+        self.store = None
+        if os.path.exists(self._path('store', 'meta.json')):
+            from jqlocal.store import MatrixStore
+            self.store = MatrixStore(self._path('store'))
+
+    def _path(self, *parts):
+        return os.path.join(self.data_dir, *parts)
+
+    @property
+    def securities(self):
+        if self._securities is None:
+            df = read_table(self._path('securities'))
+            if df is None:
+                raise IOError('缺少证券列表: %s' % self._path('securities'))
+            df = df.set_index('code')
+            for col in ('start_date', 'end_date'):
+                df[col] = pd.to_datetime(df[col]).dt.date
+            if 'name' not in df.columns:
+                df['name'] = df.index
+            if 'type' not in df.columns:
+                df['type'] = 'stock'
+            self._securities = df
+        return self._securities
+
+    def daily(self, field):
+        """日线宽表（DatetimeIndex × 证券代码），字段不存在返回 None"""
+        if field not in self._daily:
+            if self.store is not None and field in self.store.fields:
+                # 直接包装内存映射，不复制
+                self._daily[field] = self.store.frame(field).astype(float, copy=False)
+                return self._daily[field]
+            df = read_table(self._path('daily', field))
+            if df is not None:
+                df = wide_index(df)
+                df = df.astype(float)
+            self._daily[field] = df
+        return self._daily[field]
+
+    @property
+    def trade_days(self):
+        """交易日数组（datetime.date）"""
+        if self._trade_days is None:
+            close = self.daily('close')
+            if close is None:
+                raise IOError('缺少日线收盘价: %s' % self._path('daily', 'close'))
+            self._trade_days = np.array([d.date() for d in close.index])
+        return self._trade_days
+
+    def extras(self, name):
+        if name not in self._extras:
+            df = read_table(self._path('extras', name))
+            if df is not None:
+                df = wide_index(df)
+            self._extras[name] = df
+        return self._extras[name]
+
+    def table(self, kind, name):
+        """财务长表，kind 为 fundamentals 或 finance"""
+        key = (kind, name)
+        if key not in self._tables:
+            df = read_table(self._path(kind, name))
+            if df is not None:
+                for col in df.columns:
+                    if col == 'day' or col.endswith('_date') or col == 'pub_date':
+                        df[col] = pd.to_datetime(df[col]).dt.date
+            self._tables[key] = df
+        return self._tables[key]
+
+    def minute_close(self, date):
+        """某日的分钟收盘价宽表，不存在返回 None"""
+        date = to_date(date)
+        if date not in self._minute:
+            df = read_table(self._path('minute', date.strftime('%Y%m%d')))
+            if df is not None:
+                df = wide_index(df)
+                df = df.astype(float)
+            self._minute[date] = df
+        return self._minute[date]
+
+    def benchmark(self):
+        df = read_table(self._path('benchmark'))
+        if df is None:
+            return None
+        df['day'] = pd.to_datetime(df['day'])
+        return df.set_index('day')['close']
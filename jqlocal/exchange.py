@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+"""
+模拟交易所（iQuant 执行器测试用）
+
+按预先给定的行情路径逐步推进，撮合执行器通过 passorder 下的限价单，并以 iQuant 的
+对象格式（m_strRemark、m_nVolumeTraded、m_nOrderStatus 等）提供委托、成交和持仓，
+同时按同一路径回放 tick（subscribe_quote 推送、get_full_tick 快照），用于在没有
+QMT 客户端时验证拆单、撤单改价、行情缓存和成交回写：
+    exchange = SimulatedExchange({'600000': [(9.99, 10.00, 20000), ...]}, step_seconds=3)
+    exchange.install(module, ContextInfo)   # 替换下单/查询函数和 ContextInfo 的行情接口
+    exchange.advance()                      # 推进一步：推送订阅的 tick，撮合挂单
+每一步的行情为 (买一价, 卖一价, 该步市场成交量)，路径走完后停在最后一步。买单限价
+不低于卖一价、卖单限价不高于买一价时成交，每步每只股票可成交量为市场成交量乘以
+fill_ratio，多笔委托按下单先后分配。
+"""
+import itertools
+
+BUY = 23
+SELL = 24
+LOT_SIZE = 100
+
+# m_nOrderStatus
+REPORTED = 50
+PART_CANCELLED = 53
+CANCELLED = 54
+PART_FILLED = 55
+FILLED = 56
+OPEN_STATUS = (REPORTED, PART_FILLED)
+
+
+def bare_code(code):
+    return str(code).split('.')[0]
+
+
+class SimOrder(object):
+    """委托，属性名与 iQuant 的委托对象一致"""
+
+    def __init__(self, sys_id, account_id, code, direction, price, volume, remark):
+        self.m_strOrderSysID = sys_id
+        self.m_strAccountID = account_id
+        self.m_strInstrumentID = code
+        self.m_nOffsetFlag = 48 if direction == BUY else 49
+        self.m_dLimitPrice = price
+        self.m_nVolumeTotalOriginal = volume
+        self.m_nVolumeTraded = 0
+        self.m_dTradedPrice = 0.0
+        self.m_nOrderStatus = REPORTED
+        self.m_strRemark = remark
+        self.direction = direction
+
+    @property
+    def is_open(self):
+        return self.m_nOrderStatus in OPEN_STATUS
+
+    @property
+    def remaining(self):
+        return self.m_nVolumeTotalOriginal - self.m_nVolumeTraded
+
+
+class SimDeal(object):
+    """成交，属性名与 iQuant 的成交对象一致"""
+
+    def __init__(self, trade_id, order, volume, price):
+        self.m_strTradeID = trade_id
+        self.m_strOrderSysID = order.m_strOrderSysID
+        self.m_strAccountID = order.m_strAccountID
+        self.m_strInstrumentID = order.m_strInstrumentID
+        self.m_nOffsetFlag = order.m_nOffsetFlag
+        self.m_strRemark = order.m_strRemark
+        self.m_nVolume = volume
+        self.m_dPrice = price
+
+
+class SimPosition(object):
+    def __init__(self, code, volume):
+        self.m_strInstrumentID = code
+        self.m_strInstrumentName = code
+        self.m_nVolume = volume
+        self.m_nCanUseVolume = volume
+
+
+class SimulatedExchange(object):
+    """
+    path: {代码: [(买一价, 卖一价, 成交量), ...]}，代码可带或不带市场后缀
+    positions: 初始持仓 {代码: 数量}
+    fill_ratio: 每步可成交量占市场成交量的比例
+    step_seconds: 每步行情对应的秒数，clock() 按步数返回模拟时间
+    """
+
+    def __init__(self, path, positions=None, fill_ratio=0.5, step_seconds=3, start=0.0, account_id='SIM'):
+        self.path = dict((bare_code(code), list(rows)) for code, rows in path.items())
+        self.positions = dict((bare_code(code), volume) for code, volume in (positions or {}).items())
+        self.fill_ratio = fill_ratio
+        self.step_seconds = step_seconds
+        self.start = start
+        self.account_id = account_id
+        self.step = 0
+        self.orders = []
+        self.deals = []
+        self.cancels = 0
+        self._available = {}
+        self._ids = itertools.count(1)
+        self.subscribers = {}  # 订阅号 -> (代码, 回调)
+        self._sub_ids = itertools.count(1)
+
+    # ---------- 行情与时间 ----------
+
+    def clock(self):
+        return self.start + self.step * self.step_seconds
+
+    def quote(self, code):
+        """当前一步的 (买一价, 卖一价, 成交量)"""
+        rows = self.path[bare_code(code)]
+        return rows[min(self.step, len(rows) - 1)]
+
+    def tick(self, code):
+        """当前一步的 tick，字段与 get_full_tick 一致（最新价取买卖中间价）"""
+        bid, ask, volume = self.quote(code)
+        return {'timetag': self.clock(), 'lastPrice': round((bid + ask) / 2.0, 3),
+                'bidPrice': [bid], 'askPrice': [ask], 'volume': volume}
+
+    def advance(self, steps=1):
+        for _ in range(steps):
+            self.step += 1
+            self._available = {}
+            for code, callback in list(self.subscribers.values()):
+                callback({code: self.tick(code)})
+            for order in self.orders:
+                if order.is_open:
+                    self._match(order)
+
+    # ---------- ContextInfo 行情接口替身 ----------
+
+    def subscribe_quote(self, stock_code, period='tick', dividend_type='none', result_type='', callback=None):
+        sub_id = next(self._sub_ids)
+        self.subscribers[sub_id] = (stock_code, callback)
+        return sub_id
+
+    def unsubscribe_quote(self, sub_id):
+        self.subscribers.pop(sub_id, None)
+
+    def get_full_tick(self, stock_codes):
+        return dict((code, self.tick(code)) for code in stock_codes if bare_code(code) in self.path)
+
+    # ---------- iQuant 接口替身 ----------
+
+    def passorder(self, opType, orderType, accID, code, prType, price, volume, strategyName, quickTrade,
+                  userOrderId, ContextInfo=None):
+        order = SimOrder(str(next(self._ids)), str(accID), code, opType, price, int(volume), userOrderId)
+        self.orders.append(order)
+        self._match(order)
+        return 0
+
+    def cancel(self, orderId, accountId=None, accountType='stock', ContextInfo=None):
+        for order in self.orders:
+            if order.m_strOrderSysID == str(orderId) and order.is_open:
+                order.m_nOrderStatus = PART_CANCELLED if order.m_nVolumeTraded else CANCELLED
+                self.cancels += 1
+                return True
+        return False
+
+    def get_trade_detail_data(self, accID, market, kind, *args):
+        if kind == 'order':
+            return list(self.orders)
+        if kind == 'deal':
+            return list(self.deals)
+        if kind == 'position':
+            return [SimPosition(code, volume) for code, volume in self.positions.items() if volume > 0]
+        return []
+
+    def install(self, module, ContextInfo=None):
+        """把 passorder / cancel / get_trade_detail_data 装到执行器模块上，行情接口装到 ContextInfo 上"""
+        module.passorder = self.passorder
+        module.cancel = self.cancel
+        module.get_trade_detail_data = self.get_trade_detail_data
+        if ContextInfo is not None:
+            ContextInfo.subscribe_quote = self.subscribe_quote
+            ContextInfo.unsubscribe_quote = self.unsubscribe_quote
+            ContextInfo.get_full_tick = self.get_full_tick
+        return module
+
+    # ---------- 撮合 ----------
+
+    def _match(self, order):
+        code = bare_code(order.m_strInstrumentID)
+        if code not in self.path:
+            return
+        bid, ask, volume = self.quote(code)
+        if order.direction == BUY:
+            if order.m_dLimitPrice < ask:
+                return
+            price = ask
+        else:
+            if order.m_dLimitPrice > bid:
+                return
+            price = bid
+        available = self._available.get(code, int(volume * self.fill_ratio))
+        qty = min(order.remaining, available)
+        if qty < order.remaining:
+            qty = qty // LOT_SIZE * LOT_SIZE
+        if qty <= 0:
+            return
+        self._available[code] = available - qty
+        amount = order.m_dTradedPrice * order.m_nVolumeTraded + price * qty
+        order.m_nVolumeTraded += qty
+        order.m_dTradedPrice = amount / order.m_nVolumeTraded
+        order.m_nOrderStatus = FILLED if order.remaining == 0 else PART_FILLED
+        self.deals.append(SimDeal(str(len(self.deals) + 1), order, qty, price))
+        sign = 1 if order.direction == BUY else -1
+        self.positions[code] = self.positions.get(code, 0) + sign * qty
+
+    def filled(self, code=None):
+        """已成交数量（按方向带符号）"""
+        total = 0
+        for deal in self.deals:
+            if code is None or bare_code(deal.m_strInstrumentID) == bare_code(code):
+                total += deal.m_nVolume if deal.m_nOffsetFlag == 48 else -deal.m_nVolume
+        return total
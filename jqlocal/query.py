@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+"""
+query() 查询的本地实现
+
+支持策略中用到的写法：
+    query(valuation.code, valuation.market_cap)
+        .filter(valuation.code.in_(codes), finance.STK_XR_XD.a_registration_date >= d)
+        .order_by((balance.x / (valuation.market_cap + balance.x)).asc())
+        .limit(n)
+表达式在合并后的 DataFrame 上求值，列名为 "表名.字段名"。
+"""
+import operator
+
+import numpy as np
+import pandas as pd
+
+
+class Expr(object):
+    """查询表达式"""
+
+    def evaluate(self, df):
+        raise NotImplementedError
+
+    def tables(self):
+        return set()
+
+    def _binary(self, other, op):
+        return BinaryExpr(self, other, op)
+
+    def __add__(self, other):
+        return self._binary(other, operator.add)
+
+    def __radd__(self, other):
+        return BinaryExpr(other, self, operator.add)
+
+    def __sub__(self, other):
+        return self._binary(other, operator.sub)
+
+    def __rsub__(self, other):
+        return BinaryExpr(other, self, operator.sub)
+
+    def __mul__(self, other):
+        return self._binary(other, operator.mul)
+
+    def __rmul__(self, other):
+        return BinaryExpr(other, self, operator.mul)
+
+    def __truediv__(self, other):
+        return self._binary(other, operator.truediv)
+
+    def __rtruediv__(self, other):
+        return BinaryExpr(other, self, operator.truediv)
+
+    __div__ = __truediv__
+
+    def __ge__(self, other):
+        return self._binary(other, operator.ge)
+
+    def __gt__(self, other):
+        return self._binary(other, operator.gt)
+
+    def __le__(self, other):
+        return self._binary(other, operator.le)
+
+    def __lt__(self, other):
+        return self._binary(other, operator.lt)
+
+    def __eq__(self, other):
+        return self._binary(other, operator.eq)
+
+    def __ne__(self, other):
+        return self._binary(other, operator.ne)
+
+    def __and__(self, other):
+        return self._binary(other, operator.and_)
+
+    def __or__(self, other):
+        return self._binary(other, operator.or_)
+
+    def __invert__(self):
+        return FuncExpr(self, operator.inv, 'not_')
+
+    __hash__ = object.__hash__
+
+    def in_(self, values):
+        values = list(values)
+        return FuncExpr(self, lambda s: s.isin(values), 'in_', values)
+
+    def notin_(self, values):
+        values = list(values)
+        return FuncExpr(self, lambda s: ~s.isin(values), 'notin_', values)
+
+    def like(self, pattern):
+        regex = '^' + pattern.replace('%', '.*').replace('_', '.') + '$'
+        return FuncExpr(self, lambda s: s.astype(str).str.match(regex), 'like', pattern)
+
+    def asc(self):
+        return Ordering(self, True)
+
+    def desc(self):
+        return Ordering(self, False)
+
+    def label(self, name):
+        return Labeled(self, name)
+
+
+def _evaluate(value, df):
+    return value.evaluate(df) if isinstance(value, Expr) else value
+
+
+def _tables(value):
+    return value.tables() if isinstance(value, Expr) else set()
+
+
+class Column(Expr):
+    def __init__(self, table, name):
+        self.table = table
+        self.name = name
+
+    @property
+    def key(self):
+        return '%s.%s' % (self.table.name, self.name)
+
+    def evaluate(self, df):
+        return df[self.key]
+
+    def tables(self):
+        return {self.table}
+
+    def __repr__(self):
+        return self.key
+
+
+class BinaryExpr(Expr):
+    def __init__(self, left, right, op):
+        self.left, self.right, self.op = left, right, op
+        self.name = getattr(left, 'name', None)
+
+    def evaluate(self, df):
+        return self.op(_evaluate(self.left, df), _evaluate(self.right, df))
+
+    def tables(self):
+        return _tables(self.left) | _tables(self.right)
+
+    def __repr__(self):
+        return '(%r %s %r)' % (self.left, self.op.__name__, self.right)
+
+
+class FuncExpr(Expr):
+    def __init__(self, operand, func, label='func', args=None):
+        self.operand, self.func = operand, func
+        self.label, self.args = label, args
+        self.name = getattr(operand, 'name', None)
+
+    def evaluate(self, df):
+        return self.func(_evaluate(self.operand, df))
+
+    def tables(self):
+        return _tables(self.operand)
+
+    def __repr__(self):
+        return '%s(%r, %r)' % (self.label, self.operand, self.args)
+
+
+class Labeled(Expr):
+    def __init__(self, expr, name):
+        self.expr, self.name = expr, name
+
+    def evaluate(self, df):
+        return _evaluate(self.expr, df)
+
+    def tables(self):
+        return _tables(self.expr)
+
+    def __repr__(self):
+        return '%r AS %s' % (self.expr, self.name)
+
+
+class Ordering(object):
+    def __init__(self, expr, ascending):
+        self.expr, self.ascending = expr, ascending
+
+    def __repr__(self):
+        return '%r %s' % (self.expr, 'ASC' if self.ascending else 'DESC')
+
+
+class Table(object):
+    """数据表，属性访问返回字段"""
+
+    def __init__(self, name, kind='fundamentals'):
+        self.name = name
+        self.kind = kind
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return Column(self, name)
+
+    def __repr__(self):
+        return '<Table %s.%s>' % (self.kind, self.name)
+
+
+class FinanceNamespace(object):
+    """finance.STK_XR_XD 等表，run_query 由运行时注入"""
+
+    def __init__(self):
+        self._tables = {}
+        self.run_query = None
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self._tables:
+            self._tables[name] = Table(name, 'finance')
+        return self._tables[name]
+
+
+class Query(object):
+    def __init__(self, entities):
+        self.entities = list(entities)
+        self.filters = []
+        self.orders = []
+        self.limit_n = None
+        self.offset_n = 0
+
+    def filter(self, *conditions):
+        q = self._copy()
+        q.filters.extend(conditions)
+        return q
+
+    def order_by(self, *orders):
+        q = self._copy()
+        q.orders.extend(o if isinstance(o, Ordering) else Ordering(o, True) for o in orders)
+        return q
+
+    def limit(self, n):
+        q = self._copy()
+        q.limit_n = n
+        return q
+
+    def offset(self, n):
+        q = self._copy()
+        q.offset_n = n
+        return q
+
+    def _copy(self):
+        q = Query(self.entities)
+        q.filters = list(self.filters)
+        q.orders = list(self.orders)
+        q.limit_n = self.limit_n
+        q.offset_n = self.offset_n
+        return q
+
+    def __repr__(self):
+        """查询的确定性文本表示，可作为缓存/录制的键"""
+        return 'query(%s).filter(%s).order_by(%s).offset(%r).limit(%r)' % (
+            ', '.join(repr(e) for e in self.entities), ', '.join(repr(f) for f in self.filters),
+            ', '.join(repr(o) for o in self.orders), self.offset_n, self.limit_n)
+
+    def tables(self):
+        tables = set()
+        for item in self.entities + self.filters + [o.expr for o in self.orders]:
+            tables |= item.tables() if isinstance(item, Expr) else ({item} if isinstance(item, Table) else set())
+        return tables
+
+    def execute(self, frame):
+        """
+        在合并后的 DataFrame（列名为 "表名.字段名"）上执行查询
+        返回以字段名为列名的 DataFrame
+        """
+        mask = np.ones(len(frame), dtype=bool)
+        for condition in self.filters:
+            mask &= np.asarray(_evaluate(condition, frame), dtype=bool)
+        frame = frame[mask]
+
+        if self.orders:
+            keys = ['__order_%d' % i for i in range(len(self.orders))]
+            frame = frame.assign(**{k: _evaluate(o.expr, frame) for k, o in zip(keys, self.orders)})
+            frame = frame.sort_values(keys, ascending=[o.ascending for o in self.orders],
+                                      kind='mergesort', na_position='last')
+        if self.offset_n:
+            frame = frame.iloc[self.offset_n:]
+        if self.limit_n is not None:
+            frame = frame.iloc[:self.limit_n]
+
+        result = {}
+        for entity in self.entities:
+            if isinstance(entity, Table):
+                prefix = entity.name + '.'
+                for col in frame.columns:
+                    if col.startswith(prefix):
+                        result[col[len(prefix):]] = frame[col].values
+            else:
+                result[entity.name] = np.asarray(_evaluate(entity, frame))
+        return pd.DataFrame(result)
+
+
+def query(*entities):
+    return Query(entities)
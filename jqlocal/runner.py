@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+"""
+本地回测运行器
+
+把 jqdata / jqlib.technical_analysis / kuanke.user_space_api 替换为本地实现，
+原样执行策略文件，按交易日驱动 initialize / 定时任务 / handle_data / 盘后函数。
+
+用法：
+    python -m jqlocal.runner joinquant_wande.py --data ./data --start 2023-01-01 --end 2023-12-31
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import types
+
+import numpy as np
+
+from jqlocal.api import Runtime, minute_time
+from jqlocal.data import LocalData, to_date
+
+BEFORE_OPEN = datetime.time(9, 0)
+AFTER_CLOSE = datetime.time(15, 30)
+HANDLE_DATA_TIME = datetime.time(9, 30)
+
+
+def parse_time(value):
+    """'9:05' / '09:25' / 'open' / 'close' 转换为 datetime.time"""
+    aliases = {'open': '09:30', 'close': '15:00', 'before_open': '09:00', 'after_close': '15:30'}
+    value = aliases.get(value, value)
+    hour, minute = value.split(':')[:2]
+    return datetime.time(int(hour), int(minute))
+
+
+class Scheduler(object):
+    """run_daily / run_weekly / run_monthly 的定时任务表"""
+
+    def __init__(self):
+        self.jobs = []
+
+    def run_daily(self, func, time='9:30', reference_security=None):
+        self.jobs.append(('daily', None, parse_time(time), func))
+
+    def run_weekly(self, func, weekday, time='9:30', reference_security=None, force=True):
+        self.jobs.append(('weekly', weekday, parse_time(time), func))
+
+    def run_monthly(self, func, monthday, time='9:30', reference_security=None, force=True):
+        self.jobs.append(('monthly', monthday, parse_time(time), func))
+
+    def unschedule_all(self):
+        self.jobs = []
+
+    def jobs_for(self, day_of_week, day_of_month):
+        """
+        当日需要执行的任务，按时间排序（同一时间按注册顺序）
+        day_of_week/day_of_month：当日是本周/本月的第几个交易日（从1开始）
+        """
+        selected = []
+        for order, (kind, day, time, func) in enumerate(self.jobs):
+            if kind == 'weekly' and day != day_of_week:
+                continue
+            if kind == 'monthly' and day != day_of_month:
+                continue
+            selected.append((time, order, func))
+        selected.sort(key=lambda job: (job[0], job[1]))
+        return [(time, func) for time, _, func in selected]
+
+
+class Context(object):
+    def __init__(self, runtime, run_params):
+        self._runtime = runtime
+        self.run_params = run_params
+
+    @property
+    def current_dt(self):
+        return self._runtime.current_dt
+
+    @property
+    def previous_date(self):
+        return self._runtime.previous_date
+
+    @property
+    def portfolio(self):
+        return self._runtime.broker.portfolio
+
+    @property
+    def subportfolios(self):
+        return [self.portfolio]
+
+
+def nth_day_counters(trade_days):
+    """每个交易日是本周/本月的第几个交易日"""
+    week, month = [], []
+    for i, day in enumerate(trade_days):
+        prev = trade_days[i - 1] if i else None
+        same_week = prev is not None and day.isocalendar()[:2] == prev.isocalendar()[:2]
+        same_month = prev is not None and (day.year, day.month) == (prev.year, prev.month)
+        week.append(week[-1] + 1 if same_week else 1)
+        month.append(month[-1] + 1 if same_month else 1)
+    return week, month
+
+
+class Backtest(object):
+    """
+    本地回测
+    strategy_path: 策略文件；data_dir: 本地数据目录
+    frequency: 'day' 时 handle_data 每天 09:30 调用一次，'minute' 时每分钟调用
+    allow_db: False 时把 push_order_command 替换为记录器，不连接数据库
+    params: 固定的 g 参数，如 {'stock_num': 10}，策略 initialize 中的赋值不会覆盖
+    wrap_api: 可选，接收 API 名字表并返回替换后的名字表，用于统计调用次数
+    data_dir 也可以直接传入 LocalData，多次回测共享已加载的数据
+    """
+
+    def __init__(self, strategy_path, data_dir, start_date, end_date, starting_cash=1000000,
+                 frequency='day', allow_db=False, log_level='info', params=None, wrap_api=None):
+        self.strategy_path = os.path.abspath(strategy_path)
+        self.data = data_dir if isinstance(data_dir, LocalData) else LocalData(data_dir)
+        self.start_date = to_date(start_date)
+        self.end_date = to_date(end_date)
+        self.frequency = frequency
+        self.allow_db = allow_db
+        self.params = dict(params or {})
+        self.wrap_api = wrap_api
+        self.runtime = Runtime(self.data, starting_cash, log_level)
+        self.scheduler = Scheduler()
+        self.runtime.scheduler = self.scheduler
+        self.pushed_orders = []
+        self.daily_values = []
+        self.strategy = None
+
+    def _install_modules(self):
+        namespace = self.runtime.api_namespace()
+        if self.wrap_api is not None:
+            namespace = self.wrap_api(namespace)
+        jqdata = types.ModuleType('jqdata')
+        jqdata.__dict__.update(namespace)
+        jqdata.__all__ = list(namespace)
+
+        jqlib = types.ModuleType('jqlib')
+        technical = types.ModuleType('jqlib.technical_analysis')
+        indicators = {'HSL': self.runtime.hsl}
+        if self.wrap_api is not None:
+            indicators = self.wrap_api(indicators)
+        technical.__dict__.update(indicators)
+        technical.__all__ = list(indicators)
+        jqlib.technical_analysis = technical
+
+        kuanke = types.ModuleType('kuanke')
+        user_space_api = types.ModuleType('kuanke.user_space_api')
+        user_space_api.__dict__.update(namespace)
+        user_space_api.__all__ = list(namespace)
+        kuanke.user_space_api = user_space_api
+
+        sys.modules.update({'jqdata': jqdata, 'jqlib': jqlib,
+                            'jqlib.technical_analysis': technical,
+                            'kuanke': kuanke, 'kuanke.user_space_api': user_space_api})
+
+    def _record_push(self, order_dict_list):
+        for item in order_dict_list:
+            record = dict(item)
+            record['time'] = str(self.runtime.current_dt)
+            self.pushed_orders.append(record)
+        self.runtime.log.info('[离线] 记录下单指令 %d 条' % len(order_dict_list))
+
+    def load_strategy(self):
+        self._install_modules()
+        strategy_dir = os.path.dirname(self.strategy_path)
+        if strategy_dir not in sys.path:
+            sys.path.insert(0, strategy_dir)
+        module = types.ModuleType('strategy')
+        module.__file__ = self.strategy_path
+        with open(self.strategy_path, 'rb') as f:
+            code = compile(f.read(), self.strategy_path, 'exec')
+        exec(code, module.__dict__)
+        if not self.allow_db and 'push_order_command' in module.__dict__:
+            module.push_order_command = self._record_push
+        self.strategy = module
+        return module
+
+    def _call(self, name, *args):
+        func = getattr(self.strategy, name, None)
+        if func is not None:
+            func(*args)
+
+    def _set_time(self, date, time):
+        self.runtime.current_dt = datetime.datetime.combine(date, time)
+
+    def _days(self):
+        trade_days = self.data.trade_days
+        days = [i for i, d in enumerate(trade_days) if self.start_date <= d <= self.end_date]
+        if not days:
+            raise ValueError('回测区间内没有交易日: %s ~ %s' % (self.start_date, self.end_date))
+        return days
+
+    def initialize(self):
+        """加载策略并在第一个交易日开盘前调用 initialize，返回 context"""
+        if self.strategy is None:
+            self.load_strategy()
+        context = Context(self.runtime, {'start_date': self.start_date, 'end_date': self.end_date,
+                                         'type': 'simple_backtest', 'frequency': self.frequency})
+        self._set_time(self.data.trade_days[self._days()[0]], BEFORE_OPEN)
+        self.runtime.g.pin(self.params)
+        self._call('initialize', context)
+        self._call('process_initialize', context)
+        return context
+
+    def start_day(self, date):
+        """进入新交易日开盘前（不执行定时任务），用于单独调用策略函数"""
+        self.runtime.broker.start_day()
+        self._set_time(to_date(date), BEFORE_OPEN)
+
+    def set_time(self, date, time):
+        self._set_time(to_date(date), parse_time(time))
+
+    def run(self):
+        runtime = self.runtime
+        trade_days = self.data.trade_days
+        week_counter, month_counter = nth_day_counters(trade_days)
+        context = self.initialize()
+
+        for i in self._days():
+            date = trade_days[i]
+            self.start_day(date)
+            self._call('before_trading_start', context)
+
+            jobs = self.scheduler.jobs_for(week_counter[i], month_counter[i])
+            handle_times = self._handle_data_times(date)
+            events = [(t, 0, func) for t, func in jobs] + [(t, 1, None) for t in handle_times]
+            events.sort(key=lambda e: (e[0], e[1]))
+            data = runtime.get_current_data()
+            for time, _, func in events:
+                self._set_time(date, time)
+                if func is None:
+                    self._call('handle_data', context, data)
+                else:
+                    func(context)
+
+            self._set_time(date, AFTER_CLOSE)
+            self._call('after_trading_end', context)
+            self.daily_values.append((date, runtime.broker.portfolio.total_value))
+        return self.summary()
+
+    def _handle_data_times(self, date):
+        if not hasattr(self.strategy, 'handle_data'):
+            return []
+        if self.frequency == 'minute':
+            return [minute_time(date, i).time() for i in range(1, 241)]
+        return [HANDLE_DATA_TIME]
+
+    def summary(self):
+        values = np.array([v for _, v in self.daily_values], dtype=float)
+        starting_cash = self.runtime.broker.portfolio.starting_cash
+        total_return = values[-1] / starting_cash - 1
+        years = len(values) / 250.0
+        peak = np.maximum.accumulate(np.concatenate([[starting_cash], values]))
+        drawdown = 1 - np.concatenate([[starting_cash], values]) / peak
+        return {
+            'start_date': str(self.daily_values[0][0]),
+            'end_date': str(self.daily_values[-1][0]),
+            'days': len(values),
+            'final_value': float(values[-1]),
+            'total_return': float(total_return),
+            'annual_return': float((1 + total_return) ** (1 / years) - 1) if years > 0 else 0.0,
+            'max_drawdown': float(drawdown.max()),
+            'turnover': float(self.runtime.broker.traded_value / starting_cash),
+            'pushed_orders': len(self.pushed_orders),
+        }
+
+
+def run_backtest(strategy_path, data_dir, start_date, end_date, **kwargs):
+    """执行一次本地回测，返回 (汇总指标, Backtest 对象)"""
+    backtest = Backtest(strategy_path, data_dir, start_date, end_date, **kwargs)
+    return backtest.run(), backtest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='本地运行聚宽策略')
+    parser.add_argument('strategy')
+    parser.add_argument('--data', required=True, help='本地数据目录')
+    parser.add_argument('--start', required=True)
+    parser.add_argument('--end', required=True)
+    parser.add_argument('--cash', type=float, default=1000000)
+    parser.add_argument('--frequency', choices=['day', 'minute'], default='day')
+    parser.add_argument('--allow-db', action='store_true', help='保留策略中的数据库推送')
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+    result, _ = run_backtest(args.strategy, args.data, args.start, args.end,
+                             starting_cash=args.cash, frequency=args.frequency,
+                             allow_db=args.allow_db, log_level=args.log_level)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
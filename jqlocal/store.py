@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+内存映射的 日期 × 证券 行情矩阵
+
+每个字段一个 .npy 文件（np.lib.format.open_memmap），形状为
+(日期容量, 证券容量)，按行连续存放；另有交易日索引 days.npy 和证券索引
+securities.txt。行列都预留容量，追加一个交易日只写一行，容量用完时按倍数扩容，
+均摊 O(1)。读取 N 个交易日是对内存映射的切片，不复制数据；多年全市场的数据
+只有实际访问到的页会进入内存。
+
+目录结构：
+    meta.json          已用行数/列数、容量和字段类型
+    days.npy           交易日（datetime64[D]）
+    securities.txt     证券代码，每行一个，按列顺序
+    <field>.npy        字段矩阵
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# 字段 -> 数据类型；浮点字段缺失值为 NaN，停牌字段缺失值为 0
+DEFAULT_FIELDS = {
+    'open': 'float64',
+    'close': 'float64',
+    'high_limit': 'float64',
+    'low_limit': 'float64',
+    'volume': 'float64',
+    'market_cap': 'float64',
+    'paused': 'int8',
+}
+
+
+def _fill_value(dtype):
+    return np.nan if np.dtype(dtype).kind == 'f' else 0
+
+
+class MatrixStore(object):
+    """
+    行情矩阵存储
+    store = MatrixStore.create('store', day_capacity=1024, security_capacity=6000)
+    store.append_day('2024-01-02', {'close': close_series, 'paused': paused_series})
+    store.window('close', end_date='2024-01-02', count=30)   # 视图，不复制
+    """
+
+    def __init__(self, root, mode='r'):
+        self.root = root
+        self.mode = mode
+        with open(self._path('meta.json')) as f:
+            meta = json.load(f)
+        self.fields = meta['fields']
+        self.n_days = meta['n_days']
+        self.n_securities = meta['n_securities']
+        self.day_capacity = meta['day_capacity']
+        self.security_capacity = meta['security_capacity']
+        with open(self._path('securities.txt')) as f:
+            self.securities = [line.rstrip('\n') for line in f][:self.n_securities]
+        self.security_index = {code: i for i, code in enumerate(self.securities)}
+        self._open_arrays()
+
+    # ---------- 创建与扩容 ----------
+
+    @classmethod
+    def create(cls, root, fields=None, day_capacity=256, security_capacity=4096):
+        fields = dict(fields or DEFAULT_FIELDS)
+        if not os.path.exists(root):
+            os.makedirs(root)
+        np.lib.format.open_memmap(os.path.join(root, 'days.npy'), mode='w+',
+                                  dtype='datetime64[D]', shape=(day_capacity,))
+        for field, dtype in fields.items():
+            matrix = np.lib.format.open_memmap(os.path.join(root, field + '.npy'), mode='w+',
+                                               dtype=dtype, shape=(day_capacity, security_capacity))
+            matrix[:] = _fill_value(dtype)
+            matrix.flush()
+            del matrix
+        open(os.path.join(root, 'securities.txt'), 'w').close()
+        meta = {'fields': fields, 'n_days': 0, 'n_securities': 0,
+                'day_capacity': day_capacity, 'security_capacity': security_capacity}
+        with open(os.path.join(root, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return cls(root, 'r+')
+
+    @classmethod
+    def from_frames(cls, root, frames, fields=None):
+        """
+        由宽表批量建库
+        frames: 字段 -> DataFrame（DatetimeIndex × 证券代码）
+        """
+        fields = dict(fields or {f: DEFAULT_FIELDS.get(f, 'float64') for f in frames})
+        index = None
+        columns = None
+        for df in frames.values():
+            index = df.index if index is None else index.union(df.index)
+            columns = df.columns if columns is None else columns.union(df.columns, sort=False)
+        store = cls.create(root, fields, day_capacity=max(len(index), 1),
+                           security_capacity=max(len(columns), 1))
+        store._add_securities(list(columns))
+        store.days[:len(index)] = index.values.astype('datetime64[D]')
+        store.n_days = len(index)
+        for field, df in frames.items():
+            values = df.reindex(index=index, columns=columns)
+            if np.dtype(fields[field]).kind != 'f':
+                values = values.fillna(0)
+            store.arrays[field][:len(index), :len(columns)] = values.values
+        store.flush()
+        return store
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    def _open_arrays(self):
+        self.days = np.load(self._path('days.npy'), mmap_mode=self.mode)
+        self.arrays = {field: np.load(self._path(field + '.npy'), mmap_mode=self.mode)
+                       for field in self.fields}
+
+    def _grow(self, day_capacity, security_capacity):
+        """扩容：按新形状重写文件并拷贝已有数据"""
+        self.flush()
+        old_days = np.array(self.days[:self.n_days])
+        days = np.lib.format.open_memmap(self._path('days.npy.tmp'), mode='w+',
+                                         dtype='datetime64[D]', shape=(day_capacity,))
+        days[:self.n_days] = old_days
+        days.flush()
+        del days
+        for field, dtype in self.fields.items():
+            old = self.arrays[field]
+            matrix = np.lib.format.open_memmap(self._path(field + '.npy.tmp'), mode='w+',
+                                               dtype=dtype, shape=(day_capacity, security_capacity))
+            matrix[:] = _fill_value(dtype)
+            matrix[:self.n_days, :self.n_securities] = old[:self.n_days, :self.n_securities]
+            matrix.flush()
+            del matrix
+        self.arrays = {}
+        self.days = None
+        for name in ['days'] + list(self.fields):
+            os.replace(self._path(name + '.npy.tmp'), self._path(name + '.npy'))
+        self.day_capacity = day_capacity
+        self.security_capacity = security_capacity
+        self._open_arrays()
+        self._write_meta()
+
+    def _write_meta(self):
+        meta = {'fields': self.fields, 'n_days': self.n_days, 'n_securities': self.n_securities,
+                'day_capacity': self.day_capacity, 'security_capacity': self.security_capacity}
+        with open(self._path('meta.json.tmp'), 'w') as f:
+            json.dump(meta, f)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+
+    def _add_securities(self, codes):
+        new = [c for c in codes if c not in self.security_index]
+        if not new:
+            return
+        if self.n_securities + len(new) > self.security_capacity:
+            capacity = self.security_capacity
+            while self.n_securities + len(new) > capacity:
+                capacity *= 2
+            self._grow(self.day_capacity, capacity)
+        with open(self._path('securities.txt'), 'a') as f:
+            for code in new:
+                self.security_index[code] = len(self.securities)
+                self.securities.append(code)
+                f.write(code + '\n')
+        self.n_securities = len(self.securities)
+
+    # ---------- 写入 ----------
+
+    def append_day(self, date, values):
+        """
+        追加一个交易日
+        values: 字段 -> pd.Series（证券 -> 数值），未给出的字段或证券保持缺失值
+        """
+        date = np.datetime64(pd.Timestamp(date).date(), 'D')
+        if self.n_days and date <= self.days[self.n_days - 1]:
+            raise ValueError('交易日必须递增: %s' % date)
+        for series in values.values():
+            self._add_securities(list(series.index))
+        if self.n_days >= self.day_capacity:
+            self._grow(self.day_capacity * 2, self.security_capacity)
+        row = self.n_days
+        self.days[row] = date
+        for field, series in values.items():
+            columns = self.columns(series.index)
+            data = series.values
+            if np.dtype(self.fields[field]).kind != 'f':
+                data = np.nan_to_num(data.astype(float)).astype(self.fields[field])
+            self.arrays[field][row, columns] = data
+        self.n_days += 1
+        self._write_meta()
+
+    def flush(self):
+        if self.mode == 'r':
+            return
+        if self.days is not None:
+            self.days.flush()
+        for matrix in self.arrays.values():
+            matrix.flush()
+        self._write_meta()
+
+    # ---------- 读取 ----------
+
+    @property
+    def trade_days(self):
+        """已写入的交易日（datetime64[D] 视图）"""
+        return self.days[:self.n_days]
+
+    def columns(self, securities):
+        """证券代码 -> 列位置数组，未收录的证券为 -1"""
+        return np.array([self.security_index.get(c, -1) for c in securities], dtype=np.int64)
+
+    def day_position(self, date):
+        """date 及之前最近交易日的行位置，早于第一天返回 -1"""
+        date = np.datetime64(pd.Timestamp(date).date(), 'D')
+        return int(np.searchsorted(self.trade_days, date, side='right')) - 1
+
+    def matrix(self, field):
+        """字段的全部已写入数据（视图）"""
+        return self.arrays[field][:self.n_days, :self.n_securities]
+
+    def row_range(self, end_date=None, count=None, start_date=None):
+        stop = self.n_days if end_date is None else self.day_position(end_date) + 1
+        if count is not None:
+            return max(stop - count, 0), stop
+        start = 0 if start_date is None else int(np.searchsorted(
+            self.trade_days, np.datetime64(pd.Timestamp(start_date).date(), 'D')))
+        return start, stop
+
+    def window(self, field, end_date=None, count=None, start_date=None):
+        """连续交易日区间、全部证券的数据（视图，不复制）"""
+        start, stop = self.row_range(end_date, count, start_date)
+        return self.arrays[field][start:stop, :self.n_securities]
+
+    def get(self, field, securities, end_date=None, count=None, start_date=None):
+        """
+        指定证券的区间数据，形状 (天数, 证券数)
+        只拷贝请求的小块；未收录的证券为缺失值
+        """
+        block = self.window(field, end_date, count, start_date)
+        columns = self.columns(securities)
+        out = block.take(np.maximum(columns, 0), axis=1)
+        if (columns < 0).any():
+            out = out.astype(float) if out.dtype.kind != 'f' else out
+            out[:, columns < 0] = np.nan
+        return out
+
+    def frame(self, field, securities=None, end_date=None, count=None, start_date=None):
+        """区间数据的 DataFrame；不指定证券时直接包装视图"""
+        start, stop = self.row_range(end_date, count, start_date)
+        index = pd.DatetimeIndex(self.trade_days[start:stop])
+        if securities is None:
+            return pd.DataFrame(self.arrays[field][start:stop, :self.n_securities],
+                                index=index, columns=self.securities, copy=False)
+        values = self.get(field, securities, end_date, count, start_date)
+        return pd.DataFrame(values, index=index, columns=list(securities))
+
+
+def build_store(data_dir, fields=None):
+    """
+    把 data_dir 下的日线宽表导入 data_dir/store
+    market_cap 不在 daily/ 中时取自 fundamentals/valuation
+    """
+    from jqlocal.data import LocalData
+
+    data = LocalData(data_dir)
+    frames = {}
+    for field in fields or DEFAULT_FIELDS:
+        df = data.daily(field)
+        if df is None and field == 'market_cap':
+            valuation = data.table('fundamentals', 'valuation')
+            if valuation is not None and 'market_cap' in valuation.columns:
+                df = valuation.pivot_table(index='day', columns='code', values='market_cap')
+                df.index = pd.to_datetime(df.index)
+        if df is not None:
+            frames[field] = df
+    return MatrixStore.from_frames(os.path.join(data_dir, 'store'), frames)
+
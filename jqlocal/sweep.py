@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+"""
+策略参数扫描
+
+网格或随机搜索 g 参数组合，在本地进程池中并行回测（默认每个CPU核一个进程）。
+行情数据先导入 data_dir/store 的内存映射矩阵，各进程以只读方式映射同一组文件，
+由操作系统页缓存共享，不在每个进程中各自加载一份。每完成一组参数就追加一行到
+结果CSV，重新运行时跳过已完成的组合，中断后可以继续。
+
+用法：
+    python -m jqlocal.sweep joinquant_daban.py --data ./data --start 2023-01-01 --end 2023-12-31 \\
+        --space '{"stop_loss_ratio": [-0.04, -0.06, -0.08], "holding_days": [2, 3, 5]}' \\
+        --out sweep.csv
+    加 --random 50 改为在同一参数空间中随机抽取 50 组；
+    随机搜索时 [下限, 上限] 写成 {"min": a, "max": b} 表示连续区间。
+"""
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import traceback
+
+from jqlocal.store import build_store
+
+METRICS = ['total_return', 'annual_return', 'max_drawdown', 'turnover', 'final_value']
+
+
+def grid(space):
+    """参数网格：space 为 参数名 -> 取值列表，返回全部组合"""
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[n] for n in names])]
+
+
+def random_search(space, n, seed=0):
+    """
+    随机搜索：列表取值随机选一个，{"min", "max"} 区间均匀抽样（两端都是整数时抽整数）
+    重复的组合只保留一次
+    """
+    rng = random.Random(seed)
+    names = sorted(space)
+    combos, seen = [], set()
+    for _ in range(n * 20):
+        if len(combos) >= n:
+            break
+        params = {}
+        for name in names:
+            choice = space[name]
+            if isinstance(choice, dict):
+                low, high = choice['min'], choice['max']
+                if isinstance(low, int) and isinstance(high, int):
+                    params[name] = rng.randint(low, high)
+                else:
+                    params[name] = round(rng.uniform(low, high), 6)
+            else:
+                params[name] = rng.choice(list(choice))
+        key = param_key(params)
+        if key not in seen:
+            seen.add(key)
+            combos.append(params)
+    return combos
+
+
+def param_key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def load_done(path):
+    """已完成（成功）的参数组合"""
+    if not os.path.exists(path):
+        return set()
+    with open(path, newline='') as f:
+        return {row['params'] for row in csv.DictReader(f) if row.get('status') == 'ok'}
+
+
+def _run_one(task):
+    """子进程：执行一组参数的回测"""
+    strategy, data_dir, start, end, options, params = task
+    from jqlocal.runner import Backtest
+
+    row = {'params': param_key(params)}
+    try:
+        backtest = Backtest(strategy, data_dir, start, end, params=params, **options)
+        result = backtest.run()
+        row.update({m: result[m] for m in METRICS})
+        row['status'] = 'ok'
+    except Exception:
+        row['status'] = 'error'
+        row['error'] = traceback.format_exc().strip().splitlines()[-1]
+    return row
+
+
+class ParameterSweep(object):
+    """
+    参数扫描
+    combos: 参数组合列表（grid/random_search 的结果）
+    out: 结果CSV路径；已存在时跳过其中成功的组合
+    options: 传给 Backtest 的其他参数（starting_cash/frequency/log_level 等）
+    """
+
+    def __init__(self, strategy, data_dir, start, end, combos, out, workers=None, **options):
+        self.strategy = os.path.abspath(strategy)
+        self.data_dir = os.path.abspath(data_dir)
+        self.start = start
+        self.end = end
+        self.combos = combos
+        self.out = out
+        self.workers = workers or os.cpu_count() or 1
+        self.options = dict({'log_level': 'error'}, **options)
+        self.names = sorted({name for params in combos for name in params})
+
+    def prepare_data(self):
+        """行情矩阵不存在时导入一次，之后各进程共享内存映射"""
+        if os.path.exists(os.path.join(self.data_dir, 'store', 'meta.json')):
+            return
+        daily_dir = os.path.join(self.data_dir, 'daily')
+        fields = sorted({os.path.splitext(name)[0] for name in os.listdir(daily_dir)})
+        build_store(self.data_dir, fields + ['market_cap'])
+
+    def _writer(self):
+        header = ['params'] + self.names + METRICS + ['status', 'error']
+        exists = os.path.exists(self.out)
+        f = open(self.out, 'a', newline='')
+        writer = csv.DictWriter(f, fieldnames=header, extrasaction='ignore')
+        if not exists:
+            writer.writeheader()
+        return f, writer
+
+    def run(self):
+        """执行扫描，返回本次完成的结果行"""
+        self.prepare_data()
+        done = load_done(self.out)
+        pending = [p for p in self.combos if param_key(p) not in done]
+        tasks = [(self.strategy, self.data_dir, self.start, self.end, self.options, p) for p in pending]
+        rows = []
+        if not tasks:
+            return rows
+
+        f, writer = self._writer()
+        try:
+            # 每个进程只跑一组参数，避免策略模块状态在组合之间残留
+            with multiprocessing.Pool(min(self.workers, len(tasks)), maxtasksperchild=1) as pool:
+                for row in pool.imap_unordered(_run_one, tasks):
+                    row.update(json.loads(row['params']))
+                    writer.writerow(row)
+                    f.flush()
+                    rows.append(row)
+                    print('[%d/%d] %s %s' % (len(rows), len(tasks), row['params'],
+                                             row.get('total_return', row.get('error'))))
+        finally:
+            f.close()
+        return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='并行扫描策略参数')
+    parser.add_argument('strategy')
+    parser.add_argument('--data', required=True)
+    parser.add_argument('--start', required=True)
+    parser.add_argument('--end', required=True)
+    parser.add_argument('--space', required=True, help='参数空间 JSON 字符串或 JSON 文件路径')
+    parser.add_argument('--random', type=int, default=0, help='随机抽取的组合数，0 为网格搜索')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='sweep_results.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--cash', type=float, default=1000000)
+    parser.add_argument('--frequency', choices=['day', 'minute'], default='day')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.space):
+        with open(args.space) as f:
+            space = json.load(f)
+    else:
+        space = json.loads(args.space)
+    combos = random_search(space, args.random, args.seed) if args.random else grid(space)
+    sweep = ParameterSweep(args.strategy, args.data, args.start, args.end, combos, args.out,
+                           workers=args.workers, starting_cash=args.cash, frequency=args.frequency)
+    sweep.run()
+
+
+if __name__ == '__main__':
+    main()
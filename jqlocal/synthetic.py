@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+合成数据生成
+
+按 data.py 的目录结构生成一个随机市场：主板/创业板/科创板/北交所股票、日线行情
+（含按本地规则计算的涨跌停价和随机涨停）、ST标记、市值/换手率、非流动负债和分红记录。
+用于在没有真实数据时冒烟测试策略和运行时。
+
+用法：
+    python -m jqlocal.synthetic ./data --stocks 300 --days 120 --format csv
+"""
+import argparse
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from jqlocal.data import write_table
+from price_limit import limit_table
+
+# (交易所后缀, 代码前缀, 占比)
+BOARD_LAYOUT = [
+    ('.XSHG', '600', 0.35),
+    ('.XSHE', '000', 0.30),
+    ('.XSHE', '300', 0.20),
+    ('.XSHG', '688', 0.10),
+    ('.BJSE', '830', 0.05),
+]
+
+
+def make_codes(n_stocks):
+    codes = []
+    for suffix, prefix, share in BOARD_LAYOUT:
+        count = max(int(round(n_stocks * share)), 1)
+        codes.extend('%s%03d%s' % (prefix, i, suffix) for i in range(count))
+    return codes[:n_stocks]
+
+
+def make_trade_days(start, days):
+    """从 start 起的 days 个工作日（不考虑节假日）"""
+    return pd.bdate_range(pd.Timestamp(start), periods=days)
+
+
+def generate_market(n_stocks=300, start='2023-01-03', days=120, seed=0):
+    """生成合成市场，返回 {相对路径: DataFrame}"""
+    rng = np.random.RandomState(seed)
+    codes = make_codes(n_stocks)
+    n = len(codes)
+    index = make_trade_days(start, days)
+    first_day = index[0].date()
+
+    is_st = rng.rand(n) < 0.05
+    # 少数股票在区间中途上市
+    start_dates = [first_day - datetime.timedelta(days=int(rng.randint(30, 3000))) for _ in range(n)]
+    late = rng.rand(n) < 0.03
+    for i in np.nonzero(late)[0]:
+        start_dates[i] = index[rng.randint(1, days)].date()
+    securities = pd.DataFrame({
+        'code': codes,
+        'display_name': [('ST股票%d' % i) if st else ('股票%d' % i) for i, st in enumerate(is_st)],
+        'name': ['S%d' % i for i in range(n)],
+        'start_date': start_dates,
+        'end_date': datetime.date(2200, 1, 1),
+        'type': 'stock',
+    })
+
+    st_series = pd.Series(is_st, index=codes)
+    close = np.zeros((days, n))
+    open_ = np.zeros((days, n))
+    high_limit = np.zeros((days, n))
+    low_limit = np.zeros((days, n))
+    pre_close = np.round(rng.lognormal(2.3, 0.6, n), 2)
+    paused = (rng.rand(days, n) < 0.01).astype(float)
+    for t in range(days):
+        limits = limit_table(pd.Series(pre_close, index=codes), st_series, index[t].date())
+        high, low = limits['high_limit'].values, limits['low_limit'].values
+        ret = rng.normal(0.0005, 0.025, n)
+        # 约2%的股票当日涨停
+        ret[rng.rand(n) < 0.02] = 1.0
+        today = np.clip(np.round(pre_close * (1 + ret), 2), low, high)
+        gap = np.clip(np.round(pre_close * (1 + rng.normal(0, 0.01, n)), 2), low, high)
+        today = np.where(paused[t] > 0, pre_close, today)
+        gap = np.where(paused[t] > 0, pre_close, gap)
+        close[t], open_[t], high_limit[t], low_limit[t] = today, gap, high, low
+        pre_close = today
+
+    def wide(values):
+        return pd.DataFrame(values, index=index, columns=codes)
+
+    high = np.maximum(open_, close) * (1 + rng.uniform(0, 0.01, (days, n)))
+    low = np.minimum(open_, close) * (1 - rng.uniform(0, 0.01, (days, n)))
+    volume = np.round(rng.lognormal(13, 1, (days, n)), -2) * (1 - paused)
+    shares = rng.lognormal(19.5, 0.8, n)
+    market_cap = close * shares / 1e8
+    turnover = volume / shares * 100
+
+    tables = {
+        'securities': securities,
+        'daily/open': wide(open_),
+        'daily/close': wide(close),
+        'daily/high': wide(np.minimum(np.round(high, 2), high_limit)),
+        'daily/low': wide(np.maximum(np.round(low, 2), low_limit)),
+        'daily/pre_close': wide(np.vstack([close[:1], close[:-1]])),
+        'daily/high_limit': wide(high_limit),
+        'daily/low_limit': wide(low_limit),
+        'daily/paused': wide(paused),
+        'daily/volume': wide(volume),
+        'daily/money': wide(volume * close),
+        'extras/is_st': wide(np.tile(is_st, (days, 1))),
+    }
+
+    day_col = np.repeat([d.date() for d in index], n)
+    code_col = np.tile(codes, days)
+    tables['fundamentals/valuation'] = pd.DataFrame({
+        'code': code_col, 'day': day_col,
+        'market_cap': market_cap.ravel(),
+        'circulating_market_cap': (market_cap * rng.uniform(0.3, 1.0, n)).ravel(),
+        'turnover_ratio': turnover.ravel(),
+        'pe_ratio': np.tile(rng.uniform(-50, 200, n), days),
+    })
+    tables['fundamentals/balance'] = pd.DataFrame({
+        'code': codes, 'day': first_day - datetime.timedelta(days=60),
+        'total_non_current_liability': rng.lognormal(20, 1.5, n),
+    })
+    payers = [c for c in codes if rng.rand() < 0.6]
+    tables['finance/STK_XR_XD'] = pd.DataFrame({
+        'code': payers,
+        'a_registration_date': [first_day - datetime.timedelta(days=int(rng.randint(1, 300)))
+                                for _ in payers],
+        'bonus_amount_rmb': rng.lognormal(8, 1.5, len(payers)),
+    })
+    tables['benchmark'] = pd.DataFrame({'day': index, 'close': close.mean(axis=1)})
+    return tables
+
+
+def generate(data_dir, n_stocks=300, start='2023-01-03', days=120, seed=0, fmt='csv'):
+    """生成合成市场并写入 data_dir"""
+    tables = generate_market(n_stocks, start, days, seed)
+    for name, df in tables.items():
+        if name.startswith('daily/') or name.startswith('extras/'):
+            write_table(df, '%s/%s' % (data_dir, name), fmt)
+        else:
+            write_table(df.reset_index(drop=True) if fmt == 'parquet' else df.set_index(df.columns[0]),
+                        '%s/%s' % (data_dir, name), fmt)
+    return data_dir
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='生成合成行情数据')
+    parser.add_argument('data_dir')
+    parser.add_argument('--stocks', type=int, default=300)
+    parser.add_argument('--days', type=int, default=120)
+    parser.add_argument('--start', default='2023-01-03')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    args = parser.parse_args(argv)
+    generate(args.data_dir, args.stocks, args.start, args.days, args.seed, args.format)
+
+
+if __name__ == '__main__':
+    main()
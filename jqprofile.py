@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+定时任务与数据接口的性能统计（可选开启）
+
+在 initialize 中、调用 run_daily/run_weekly 之前执行：
+    if g.profile:
+        install_profiler(globals())
+之后注册的定时任务都会记录耗时，get_price / get_fundamentals / get_current_data /
+history / finance.run_query / get_security_info 等接口按调用点统计次数和耗时，
+每天收盘后把当日汇总和最慢的调用点写入日志。
+
+get_current_data 返回的对象按需取数，统计到的只是创建快照的耗时。
+"""
+import functools
+import os
+import sys
+import time
+from collections import defaultdict
+
+DEFAULT_APIS = ('get_price', 'history', 'attribute_history', 'get_current_data', 'get_fundamentals',
+                'get_security_info', 'get_all_securities', 'get_extras', 'get_trade_days',
+                'get_call_auction', 'get_bars')
+
+
+class CallStats(object):
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+
+
+class Profiler(object):
+    """
+    统计定时任务和数据接口的耗时
+    top: 日报中列出的最慢调用点数量
+    """
+
+    def __init__(self, log, top=10):
+        self.log = log
+        self.top = top
+        self.reset()
+
+    def reset(self):
+        self.callbacks = defaultdict(CallStats)
+        self.apis = defaultdict(CallStats)
+        self.callsites = defaultdict(CallStats)  # (接口, 文件:行号 函数) -> 统计
+
+    def wrap_api(self, name, func):
+        apis = self.apis
+        callsites = self.callsites
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                frame = sys._getframe(1)
+                site = '%s:%d %s' % (os.path.basename(frame.f_code.co_filename), frame.f_lineno,
+                                     frame.f_code.co_name)
+                apis[name].add(elapsed)
+                callsites[(name, site)].add(elapsed)
+        return wrapper
+
+    def wrap_callback(self, func):
+        callbacks = self.callbacks
+
+        @functools.wraps(func)
+        def wrapper(context, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(context, *args, **kwargs)
+            finally:
+                callbacks[func.__name__].add(time.perf_counter() - start)
+        return wrapper
+
+    def report_lines(self, date=None):
+        lines = ['=== 性能统计 %s ===' % (date or '')]
+        for name, stats in sorted(self.callbacks.items(), key=lambda x: -x[1].total):
+            lines.append('任务 %s: %d次, 合计 %.1fms, 最长 %.1fms' % (
+                name, stats.count, stats.total * 1000, stats.max * 1000))
+        for name, stats in sorted(self.apis.items(), key=lambda x: -x[1].total):
+            lines.append('接口 %s: %d次, 合计 %.1fms' % (name, stats.count, stats.total * 1000))
+        slowest = sorted(self.callsites.items(), key=lambda x: -x[1].total)[:self.top]
+        if slowest:
+            lines.append('最慢调用点:')
+        for (name, site), stats in slowest:
+            lines.append('  %s %s: %d次, 合计 %.1fms' % (site, name, stats.count, stats.total * 1000))
+        return lines
+
+    def daily_report(self, context):
+        """收盘后写出当日统计并清零"""
+        for line in self.report_lines(context.current_dt.date()):
+            self.log.info(line)
+        self.reset()
+
+
+class FinanceProxy(object):
+    """finance 模块的代理，只替换 run_query（jqrecord 也使用）"""
+
+    def __init__(self, finance, run_query):
+        self._finance = finance
+        self.run_query = run_query
+
+    def __getattr__(self, name):
+        return getattr(self._finance, name)
+
+
+def install_profiler(namespace, apis=DEFAULT_APIS, top=10):
+    """
+    在策略的全局命名空间中安装统计：替换数据接口和 run_daily/run_weekly/run_monthly，
+    并注册收盘后的日报任务。重复调用返回已安装的 Profiler
+    """
+    if '__profiler' in namespace:
+        return namespace['__profiler']
+    profiler = Profiler(namespace['log'], top)
+
+    for name in apis:
+        if name in namespace:
+            namespace[name] = profiler.wrap_api(name, namespace[name])
+    finance = namespace.get('finance')
+    if finance is not None:
+        namespace['finance'] = FinanceProxy(finance, profiler.wrap_api('finance.run_query',
+                                                                       finance.run_query))
+
+    def wrap_scheduler(run):
+        @functools.wraps(run)
+        def schedule(func, *args, **kwargs):
+            wrapped = profiler.wrap_callback(func)
+            # 平台按函数名恢复定时任务时也能找到包装后的函数
+            if namespace.get(func.__name__) is func:
+                namespace[func.__name__] = wrapped
+            return run(wrapped, *args, **kwargs)
+        return schedule
+
+    for name in ('run_daily', 'run_weekly', 'run_monthly'):
+        if name in namespace:
+            namespace[name] = wrap_scheduler(namespace[name])
+
+    namespace['profiler_daily_report'] = profiler.daily_report
+    run_daily = namespace['run_daily'].__wrapped__
+    run_daily(profiler.daily_report, time='after_close')
+    namespace['__profiler'] = profiler
+    return profiler
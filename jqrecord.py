@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+jqdata 接口调用的录制与回放
+
+录制模式下每次接口调用的参数和返回值写入本地归档目录：DataFrame 存为 Parquet
+（没有 pyarrow 时退回 pickle），其他返回值存为 pickle，index.jsonl 记录
+键 -> 文件。回放模式启动时把索引读入字典，按键 O(1) 查找并从磁盘读取结果，
+不访问数据源，同一次运行看到的数据可以离线确定性地重现。
+
+键由接口名、调用时的行情时间和规范化后的参数组成，所以同一参数在不同时间
+（如 get_current_data、history）的调用分别录制。
+
+平台上使用（在 initialize 中、run_daily 之前）：
+    install_recorder(globals(), 'record_20240102', mode='record')
+本地回测中使用：
+    recorder = Recorder('record_20240102', 'replay')
+    Backtest(..., wrap_api=recorder.wrap); recorder.clock = lambda: backtest.runtime.current_dt
+    backtest.run(); recorder.flush()  # 录制模式下写出最后一个时刻的 get_current_data 快照
+"""
+import datetime
+import functools
+import hashlib
+import json
+import os
+import pickle
+import types
+
+import numpy as np
+import pandas as pd
+
+from jqprofile import FinanceProxy
+
+DEFAULT_APIS = ('get_price', 'history', 'attribute_history', 'get_current_data', 'get_fundamentals',
+                'get_security_info', 'get_all_securities', 'get_extras', 'get_trade_days',
+                'get_call_auction', 'HSL')
+# get_current_data 单元录制的字段
+UNIT_FIELDS = ('last_price', 'high_limit', 'low_limit', 'paused', 'is_st', 'name', 'day_open')
+
+
+def normalize(value):
+    """把调用参数转换为确定性的、可 JSON 序列化的结构"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (datetime.date, datetime.datetime, pd.Timestamp)):
+        return value.isoformat()
+    if isinstance(value, dict):
+        return [[str(k), normalize(v)] for k, v in sorted(value.items(), key=lambda x: str(x[0]))]
+    if isinstance(value, (set, frozenset)):
+        return sorted(normalize(v) for v in value)
+    if isinstance(value, (list, tuple, np.ndarray, pd.Index, pd.Series)):
+        return [normalize(v) for v in value]
+    statement = getattr(value, 'statement', None)
+    if statement is not None:
+        # sqlalchemy 查询：带参数值的 SQL 文本
+        try:
+            return str(statement.compile(compile_kwargs={'literal_binds': True}))
+        except Exception:
+            return str(statement)
+    return repr(value)
+
+
+def call_key(name, now, args, kwargs):
+    payload = json.dumps([name, normalize(now), normalize(args), normalize(kwargs)],
+                         ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _plain(value):
+    """平台对象（如 get_security_info 的结果）不能 pickle 时转换为普通对象"""
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        attrs = {k: v for k, v in vars(value).items() if not k.startswith('_')} \
+            if hasattr(value, '__dict__') else {}
+        return types.SimpleNamespace(**attrs)
+
+
+class CurrentDataRecorder(dict):
+    """get_current_data 结果的录制代理：第一次访问某只证券时读出全部字段"""
+
+    def __init__(self, source):
+        dict.__init__(self)
+        self._source = source
+
+    def __missing__(self, code):
+        unit = self._source[code]
+        values = {}
+        for field in UNIT_FIELDS:
+            try:
+                values[field] = getattr(unit, field)
+            except Exception:
+                values[field] = None
+        record = types.SimpleNamespace(code=code, **values)
+        self[code] = record
+        return record
+
+
+class Recorder(object):
+    """
+    录制/回放
+    archive: 归档目录；mode: 'record' 或 'replay'
+    clock: 返回当前行情时间的函数；install_recorder 会在每个定时任务开始时更新
+    """
+
+    def __init__(self, archive, mode='record', clock=None, apis=DEFAULT_APIS):
+        if mode not in ('record', 'replay'):
+            raise ValueError('mode 只能是 record 或 replay: %s' % mode)
+        self.archive = archive
+        self.mode = mode
+        self.clock = clock or (lambda: None)
+        self.apis = apis
+        self.now = None
+        self.index = {}
+        self.hits = 0
+        self.misses = 0
+        self._pending = []  # 录制中的 get_current_data 代理，flush 时写出
+        self._pending_time = None
+        self._parquet = _parquet_available()
+        if not os.path.exists(os.path.join(archive, 'calls')):
+            os.makedirs(os.path.join(archive, 'calls'))
+        self._load_index()
+
+    def _index_path(self):
+        return os.path.join(self.archive, 'index.jsonl')
+
+    def _load_index(self):
+        if not os.path.exists(self._index_path()):
+            return
+        with open(self._index_path()) as f:
+            for line in f:
+                entry = json.loads(line)
+                self.index[entry['key']] = entry
+
+    def current_time(self):
+        now = self.clock()
+        return now if now is not None else self.now
+
+    # ---------- 存取 ----------
+
+    def _write(self, key, name, value):
+        calls = os.path.join(self.archive, 'calls')
+        if isinstance(value, pd.DataFrame) and self._parquet:
+            filename, fmt = key + '.parquet', 'parquet'
+            frame = value.copy()
+            frame.columns = [str(c) for c in frame.columns]
+            frame.to_parquet(os.path.join(calls, filename))
+        else:
+            filename, fmt = key + '.pkl', 'pickle'
+            with open(os.path.join(calls, filename), 'wb') as f:
+                pickle.dump(_plain(value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        entry = {'key': key, 'api': name, 'file': filename, 'format': fmt}
+        self.index[key] = entry
+        with open(self._index_path(), 'a') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+    def _read(self, entry):
+        path = os.path.join(self.archive, 'calls', entry['file'])
+        if entry['format'] == 'parquet':
+            return pd.read_parquet(path)
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def flush(self):
+        """写出录制中的 get_current_data 快照"""
+        for key, proxy in self._pending:
+            if key not in self.index:
+                self._write(key, 'get_current_data', dict(proxy))
+        self._pending = []
+
+    # ---------- 包装 ----------
+
+    def wrap_function(self, name, func):
+        recorder = self
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            now = recorder.current_time()
+            if recorder._pending and now != recorder._pending_time:
+                # 行情时间推进后上一时刻的快照不会再被访问
+                recorder.flush()
+            key = call_key(name, now, args, kwargs)
+            if recorder.mode == 'replay':
+                entry = recorder.index.get(key)
+                if entry is None:
+                    recorder.misses += 1
+                    raise KeyError('归档中没有这次调用: %s%r @ %s' % (name, args, recorder.current_time()))
+                recorder.hits += 1
+                return recorder._read(entry)
+            value = func(*args, **kwargs)
+            if name == 'get_current_data':
+                proxy = CurrentDataRecorder(value)
+                recorder._pending.append((key, proxy))
+                recorder._pending_time = now
+                return proxy
+            if key not in recorder.index:
+                recorder._write(key, name, value)
+            return value
+        return wrapper
+
+    def wrap_callback(self, func):
+        recorder = self
+
+        @functools.wraps(func)
+        def wrapper(context, *args, **kwargs):
+            recorder.now = context.current_dt
+            try:
+                return func(context, *args, **kwargs)
+            finally:
+                recorder.flush()
+        return wrapper
+
+    def wrap(self, namespace):
+        """返回替换了数据接口的名字表（可用作 jqlocal Backtest 的 wrap_api）"""
+        wrapped = dict(namespace)
+        for name in self.apis:
+            if name in namespace:
+                wrapped[name] = self.wrap_function(name, namespace[name])
+        finance = namespace.get('finance')
+        if finance is not None and getattr(finance, 'run_query', None) is not None:
+            wrapped['finance'] = FinanceProxy(finance, self.wrap_function('finance.run_query',
+                                                                          finance.run_query))
+        return wrapped
+
+
+def install_recorder(namespace, archive, mode='record', apis=DEFAULT_APIS):
+    """
+    在策略的全局命名空间中安装录制/回放：替换数据接口，之后用 run_daily/run_weekly
+    注册的任务以及 handle_data/before_trading_start/after_trading_end 在开始时
+    记录行情时间，结束时写出快照
+    """
+    if '__recorder' in namespace:
+        return namespace['__recorder']
+    recorder = Recorder(archive, mode, apis=apis)
+    namespace.update(recorder.wrap(namespace))
+
+    def wrap_scheduler(run):
+        @functools.wraps(run)
+        def schedule(func, *args, **kwargs):
+            wrapped = recorder.wrap_callback(func)
+            if namespace.get(func.__name__) is func:
+                namespace[func.__name__] = wrapped
+            return run(wrapped, *args, **kwargs)
+        return schedule
+
+    for name in ('run_daily', 'run_weekly', 'run_monthly'):
+        if name in namespace:
+            namespace[name] = wrap_scheduler(namespace[name])
+    for name in ('handle_data', 'before_trading_start', 'after_trading_end'):
+        if name in namespace:
+            namespace[name] = recorder.wrap_callback(namespace[name])
+    namespace['__recorder'] = recorder
+    return recorder
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+本地计算涨跌停价
+
+按前收盘价、板块（主板/创业板/科创板/北交所）和ST状态计算涨跌停价：
+涨停价 = 前收盘价 × (1 + 涨跌幅比例)，跌停价 = 前收盘价 × (1 - 涨跌幅比例)，
+结果按交易所规则四舍五入到分。计算全部在整数"分"上进行，避免浮点误差，
+对全市场一次性向量化计算，返回涨停/跌停布尔掩码。
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from code_table import shared_code_table, MAIN, CHINEXT, STAR, BSE
+
+# 各板块涨跌幅（百分比，整数）
+BOARD_LIMIT = {MAIN: 10, CHINEXT: 20, STAR: 20, BSE: 30}
+# 主板ST股票涨跌幅
+MAIN_ST_LIMIT = 5
+# 创业板注册制改革前（2020-08-24之前）涨跌幅为10%，ST为5%
+CHINEXT_REFORM_DATE = datetime.date(2020, 8, 24)
+
+
+def limit_percent(boards, is_st=None, date=None):
+    """各证券的涨跌幅（整数百分比）"""
+    boards = np.asarray(boards, dtype=np.int8)
+    percent = np.full(len(boards), BOARD_LIMIT[MAIN], dtype=np.int64)
+    for board, value in BOARD_LIMIT.items():
+        percent[boards == board] = value
+    old_chinext = date is not None and date < CHINEXT_REFORM_DATE
+    if old_chinext:
+        percent[boards == CHINEXT] = BOARD_LIMIT[MAIN]
+    if is_st is not None:
+        is_st = np.asarray(is_st, dtype=bool)
+        st_boards = (boards == MAIN) | ((boards == CHINEXT) & old_chinext)
+        percent[is_st & st_boards] = MAIN_ST_LIMIT
+    return percent
+
+
+def limit_prices(pre_close, boards, is_st=None, date=None):
+    """
+    计算涨跌停价
+    pre_close: 前收盘价数组；boards: 板块数组（code_table 中的 MAIN/CHINEXT/STAR/BSE）
+    is_st: ST标记数组；date: 交易日（用于区分创业板改革前后的规则）
+    返回 (涨停价数组, 跌停价数组)，前收盘价无效的位置为 NaN
+    """
+    pre_close = np.asarray(pre_close, dtype=float)
+    valid = np.isfinite(pre_close) & (pre_close > 0)
+    cents = np.where(valid, np.round(pre_close * 100), 0).astype(np.int64)
+    percent = limit_percent(boards, is_st, date)
+
+    # 分 × (100 ± 涨跌幅) 得到"万分之一元"，加 50 后整除 100 即四舍五入到分
+    high = (cents * (100 + percent) + 50) // 100
+    low = (cents * (100 - percent) + 50) // 100
+    high = np.where(valid, high / 100.0, np.nan)
+    low = np.where(valid, np.maximum(low, 1) / 100.0, np.nan)
+    return high, low
+
+
+def limit_masks(price, high, low):
+    """最新价是否涨停/跌停，返回 (涨停掩码, 跌停掩码)"""
+    price = np.asarray(price, dtype=float)
+    with np.errstate(invalid='ignore'):
+        up = price >= np.asarray(high) - 0.005
+        down = price <= np.asarray(low) + 0.005
+    return up, down
+
+
+def limit_table(pre_close, is_st=None, date=None):
+    """
+    按证券计算涨跌停价
+    pre_close: pd.Series，证券 -> 前收盘价；is_st: pd.Series，证券 -> 是否ST
+    返回 DataFrame，列为 high_limit、low_limit
+    """
+    codes = list(pre_close.index)
+    table = shared_code_table().ensure(codes)
+    boards = table.arrays()['board'][table.rows(codes)] if codes else np.zeros(0, dtype=np.int8)
+    st = None if is_st is None else is_st.reindex(codes).fillna(False).values.astype(bool)
+    high, low = limit_prices(pre_close.values, boards, st, date)
+    return pd.DataFrame({'high_limit': high, 'low_limit': low}, index=codes)
+
+
+def limit_status(pre_close, price, is_st=None, date=None):
+    """
+    全市场涨跌停判断
+    pre_close/price: pd.Series，证券 -> 前收盘价/最新价
+    返回 DataFrame，列为 high_limit、low_limit、limit_up、limit_down
+    """
+    table = limit_table(pre_close, is_st, date)
+    up, down = limit_masks(price.reindex(table.index).values, table['high_limit'].values,
+                           table['low_limit'].values)
+    table['limit_up'] = up
+    table['limit_down'] = down
+    return table
+
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+目标持仓与当前持仓的向量化调仓差异计算
+
+目标权重、当前持仓数量和价格按证券对齐成数组，一次性算出所有证券的
+偏离度和容忍带判断，返回最少的有序订单列表（先卖后买）。
+各策略的 daily_adjustment / weekly_adjustment 可共用。
+"""
+import numpy as np
+import pandas as pd
+
+# 订单原因
+EXIT = 'exit'        # 不在目标中，清仓
+TRIM = 'trim'        # 偏离超出容忍带，减仓
+ENTRY = 'entry'      # 新进入目标，建仓
+TOP_UP = 'top_up'    # 偏离超出容忍带，加仓
+
+
+def plan_rebalance(target_weights, holdings, prices, total_value, band=0.2,
+                   buyable=None, keep=None):
+    """
+    计算调仓订单
+    target_weights: pd.Series，证券 -> 目标权重（按顺序决定买单先后）
+    holdings: pd.Series，证券 -> 当前持仓数量
+    prices: pd.Series，证券 -> 当前价格
+    total_value: 组合总资产
+    band: 偏离容忍度，|现值-目标|/目标 超过 band 才调整；None 表示已持有的不做调整
+    buyable: pd.Series[bool]，为 False 的证券不产生买单（如涨停）
+    keep: 不卖出的证券列表（如昨日涨停的持仓）
+    返回订单列表，每个订单为 {'security', 'target_value', 'current_value', 'reason'}，先卖后买
+    """
+    holdings = holdings[holdings > 0]
+    codes = target_weights.index.append(holdings.index.difference(target_weights.index))
+
+    weight = target_weights.reindex(codes).fillna(0).values.astype(float)
+    quantity = holdings.reindex(codes).fillna(0).values.astype(float)
+    price = prices.reindex(codes).fillna(0).values.astype(float)
+    can_buy = (np.ones(len(codes), dtype=bool) if buyable is None
+               else buyable.reindex(codes).fillna(False).values.astype(bool))
+    can_sell = (np.ones(len(codes), dtype=bool) if keep is None
+                else ~codes.isin(list(keep)))
+
+    current_value = quantity * price
+    target_value = weight * total_value
+    held = quantity > 0
+    wanted = target_value > 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drift = np.where(wanted, np.abs(current_value - target_value) / target_value, np.inf)
+    out_of_band = np.zeros(len(codes), dtype=bool) if band is None else drift > band
+
+    reason = np.full(len(codes), '', dtype=object)
+    reason[held & ~wanted & can_sell] = EXIT
+    reason[held & wanted & out_of_band & (current_value > target_value) & can_sell] = TRIM
+    reason[~held & wanted & can_buy & (price > 0)] = ENTRY
+    reason[held & wanted & out_of_band & (current_value < target_value) & can_buy] = TOP_UP
+
+    orders = []
+    # 先卖后买，卖单中清仓在前
+    for kind in (EXIT, TRIM, ENTRY, TOP_UP):
+        for i in np.flatnonzero(reason == kind):
+            orders.append({
+                'security': codes[i],
+                'target_value': float(target_value[i]),
+                'current_value': float(current_value[i]),
+                'reason': kind
+            })
+    return orders
+
+
+def positions_frame(positions):
+    """把 context.portfolio.positions 转为 (持仓数量, 价格) 两个 pd.Series"""
+    codes = [s for s, pos in positions.items() if pos.total_amount > 0]
+    quantity = pd.Series([positions[s].total_amount for s in codes], index=codes, dtype=float)
+    price = pd.Series([positions[s].price for s in codes], index=codes, dtype=float)
+    return quantity, price
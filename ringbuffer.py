@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+按证券维护的行情环形缓冲区
+
+每个字段一个预分配的 (2 × 容量, 证券数) NumPy 数组，每根K线同时写入第 k 行和
+第 k + 容量 行，这样"最近 N 根"始终是一段连续的行，取数直接返回视图，
+不分配内存。启动时用一次批量 get_price 预热，之后每天（或每分钟）只写入一根，
+替代策略中反复调用的 get_price(count=N)。日线和分钟线通用，时间轴由调用方决定。
+"""
+import numpy as np
+import pandas as pd
+
+
+class BarRingBuffer(object):
+    """
+    行情环形缓冲区
+    fields: 字段列表，如 ['close', 'high_limit', 'paused']
+    capacity: 保留的K线根数
+    """
+
+    def __init__(self, fields, capacity, securities=()):
+        self.fields = list(fields)
+        self.capacity = int(capacity)
+        self.securities = []
+        self.positions = {}
+        self._data = {}
+        self._times = [None] * (2 * self.capacity)
+        self.count = 0
+        self.head = 0  # 下一根K线写入的位置
+        self.last_time = None
+        self.set_securities(securities)
+
+    # ---------- 证券列表 ----------
+
+    def set_securities(self, securities):
+        """设置证券列表；保留仍在列表中的证券的历史，新增证券历史为缺失值"""
+        securities = list(securities)
+        if securities == self.securities:
+            return
+        columns = self.columns(securities)
+        known = columns >= 0
+        data = {}
+        for field in self.fields:
+            matrix = np.full((2 * self.capacity, len(securities)), np.nan)
+            if field in self._data and known.any():
+                matrix[:, known] = self._data[field][:, columns[known]]
+            data[field] = matrix
+        self._data = data
+        self.securities = securities
+        self.positions = {code: i for i, code in enumerate(securities)}
+
+    def columns(self, stocks):
+        """证券 -> 列位置数组，不在缓冲区中的证券为 -1"""
+        return np.array([self.positions.get(s, -1) for s in stocks], dtype=np.int64)
+
+    # ---------- 写入 ----------
+
+    def reset(self):
+        for matrix in self._data.values():
+            matrix[:] = np.nan
+        self._times = [None] * (2 * self.capacity)
+        self.count = 0
+        self.head = 0
+        self.last_time = None
+
+    def push(self, values, time):
+        """
+        写入一根K线
+        values: 字段 -> pd.Series（证券 -> 数值）或按 securities 顺序排列的数组
+        """
+        row = self.head
+        for field in self.fields:
+            value = values.get(field)
+            if value is None:
+                value = np.nan
+            elif isinstance(value, pd.Series):
+                value = value.reindex(self.securities).values
+            matrix = self._data[field]
+            matrix[row] = value
+            matrix[row + self.capacity] = value
+        self._times[row] = self._times[row + self.capacity] = time
+        self.head = (row + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.last_time = time
+
+    def warm(self, frames, times=None):
+        """
+        用一次批量取数的结果预热
+        frames: 字段 -> DataFrame（时间 × 证券），如 get_price 返回的 panel
+        times: 各行的时间标签，默认取 DataFrame 的索引
+        """
+        self.reset()
+        index = list(frames[self.fields[0]].index) if times is None else list(times)
+        aligned = {f: frames[f].reindex(columns=self.securities).values if f in frames else None
+                   for f in self.fields}
+        for i in range(max(len(index) - self.capacity, 0), len(index)):
+            self.push({f: (v[i] if v is not None else None) for f, v in aligned.items()}, index[i])
+
+    # ---------- 读取 ----------
+
+    def last(self, field, n=None):
+        """最近 n 根K线（n × 证券数 的视图，按时间升序）"""
+        n = self.count if n is None else min(n, self.count)
+        end = self.head + self.capacity
+        return self._data[field][end - n:end]
+
+    def latest(self, field):
+        """最近一根K线（一维视图）"""
+        return self._data[field][self.head + self.capacity - 1]
+
+    def times(self, n=None):
+        n = self.count if n is None else min(n, self.count)
+        end = self.head + self.capacity
+        return self._times[end - n:end]
+
+    def get(self, field, n, stocks):
+        """指定证券最近 n 根K线（n × len(stocks)），不在缓冲区中的证券为 NaN"""
+        columns = self.columns(stocks)
+        values = self.last(field, n).take(np.maximum(columns, 0), axis=1)
+        if (columns < 0).any():
+            values[:, columns < 0] = np.nan
+        return values
+
+    def frame(self, field, n, stocks=None):
+        """最近 n 根K线的 DataFrame，与 get_price panel[field] 的形状一致"""
+        index = pd.Index(self.times(n))
+        if stocks is None:
+            return pd.DataFrame(self.last(field, n), index=index, columns=self.securities, copy=False)
+        return pd.DataFrame(self.get(field, n, stocks), index=index, columns=list(stocks))
+
+    def covers(self, stocks):
+        """缓冲区是否包含全部 stocks"""
+        return all(s in self.positions for s in stocks)
+
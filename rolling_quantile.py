@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+滚动分位数索引（历史低位判断）
+
+按证券维护最近 N 个有效交易日收盘价的环形窗口，整个股票池共用一个
+lookback × 证券数 的二维数组。每天只写入一行新收盘价，分位数对全市场
+一次性向量化计算，之后"收盘价是否低于N日中位数/分位数"的查询都是O(1)。
+
+停牌（收盘价缺失或<=0）的证券当日不写入，与 get_price(skip_paused=True)
+取最近N个有效交易日的口径一致。
+"""
+import warnings
+
+import numpy as np
+import pandas as pd
+
+
+class RollingQuantileIndex(object):
+    """全市场滚动分位数索引"""
+
+    def __init__(self, lookback=30, quantile=0.5, min_ratio=0.8):
+        self.lookback = int(lookback)
+        self.quantile = float(quantile)
+        # 有效数据不足 lookback * min_ratio 时不判定为低位
+        self.min_periods = int(np.ceil(self.lookback * min_ratio))
+        self.last_date = None
+        self.reset()
+
+    def reset(self):
+        """清空所有窗口"""
+        self.securities = []
+        self._col = {}
+        self._buf = np.full((self.lookback, 0), np.nan)
+        self._pos = np.zeros(0, dtype=np.int64)    # 每列下一个写入位置
+        self._count = np.zeros(0, dtype=np.int64)  # 每列已写入的有效数据个数
+        self._last = np.zeros(0)                   # 每列最新收盘价
+        self._level = None                         # 分位数缓存，写入后失效
+        self._mask = None                          # 低位判定缓存，写入后失效
+        self.last_date = None
+
+    def _columns(self, codes):
+        """返回证券对应的列号，新证券追加新列"""
+        new_codes = [c for c in codes if c not in self._col]
+        if new_codes:
+            n = len(new_codes)
+            for i, code in enumerate(new_codes):
+                self._col[code] = len(self.securities) + i
+            self.securities.extend(new_codes)
+            self._buf = np.hstack([self._buf, np.full((self.lookback, n), np.nan)])
+            self._pos = np.concatenate([self._pos, np.zeros(n, dtype=np.int64)])
+            self._count = np.concatenate([self._count, np.zeros(n, dtype=np.int64)])
+            self._last = np.concatenate([self._last, np.full(n, np.nan)])
+        return np.array([self._col[c] for c in codes], dtype=np.int64)
+
+    def update(self, closes, date=None):
+        """
+        写入一个交易日的收盘价
+        closes: pd.Series，索引为证券代码；缺失或<=0视为停牌
+        date: 交易日，重复写入同一天（或更早的日期）会被忽略
+        """
+        if date is not None and self.last_date is not None and date <= self.last_date:
+            return False
+        cols = self._columns(list(closes.index))
+        values = np.asarray(closes.values, dtype=float)
+        valid = np.isfinite(values) & (values > 0)
+        cols = cols[valid]
+        values = values[valid]
+
+        self._buf[self._pos[cols], cols] = values
+        self._pos[cols] = (self._pos[cols] + 1) % self.lookback
+        self._count[cols] = np.minimum(self._count[cols] + 1, self.lookback)
+        self._last[cols] = values
+        self._level = None
+        self._mask = None
+        if date is not None:
+            self.last_date = date
+        return True
+
+    def warm(self, close_df, date=None):
+        """
+        用历史收盘价矩阵（行=交易日升序，列=证券）重建索引
+        """
+        self.reset()
+        for _, row in close_df.tail(self.lookback).iterrows():
+            self.update(row)
+        self.last_date = date if date is not None else (
+            close_df.index[-1] if len(close_df) > 0 else None)
+
+    def levels(self):
+        """各证券窗口内的分位数，按 self.securities 顺序"""
+        if self._level is None:
+            with warnings.catch_warnings():
+                # 从未有过有效数据的列全为NaN，结果保持NaN即可
+                warnings.simplefilter('ignore', RuntimeWarning)
+                self._level = np.nanquantile(self._buf, self.quantile, axis=0)
+        return self._level
+
+    def below_mask(self):
+        """最新收盘价低于分位数（且数据充足）的布尔数组"""
+        if self._mask is None:
+            level = self.levels()
+            with np.errstate(invalid='ignore'):
+                self._mask = (self._count >= self.min_periods) & (self._last < level)
+        return self._mask
+
+    def below(self, stocks=None):
+        """返回 pd.Series[bool]，stocks 为空时覆盖全部证券"""
+        mask = pd.Series(self.below_mask(), index=self.securities)
+        if stocks is None:
+            return mask
+        return mask.reindex(list(stocks), fill_value=False)
+
+    def is_below(self, stock):
+        """单只证券是否处于低位"""
+        col = self._col.get(stock)
+        if col is None:
+            return False
+        return bool(self.below_mask()[col])
+
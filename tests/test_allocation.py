@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""allocate_lots 整手分配：不超资金、整手、单只不超过目标 (1 + tolerance)，资金利用率高于逐只向下取整"""
+import numpy as np
+import pandas as pd
+
+from allocation import allocate_lots, order_cost
+
+
+def universe(n=400, seed=3):
+    rng = np.random.RandomState(seed)
+    codes = ['%06d.XSHE' % i for i in range(n)]
+    return pd.Series(rng.uniform(2, 80, n), index=codes)
+
+
+def test_constraints_and_utilisation():
+    prices = universe()
+    cash = 10000000.0
+    targets = pd.Series(cash / len(prices), index=prices.index)
+    shares = allocate_lots(targets, prices, cash)
+    spent = order_cost(shares * prices).sum()
+    assert spent <= cash
+    assert (shares % 100 == 0).all()
+    assert (shares * prices <= targets * 1.2 + 1e-6).all()
+    # 逐只向下取整的投入比例明显更低
+    naive = np.floor(targets / prices / 100) * 100
+    assert spent / cash > (naive * prices).sum() / cash
+    assert spent / cash > 0.99
+
+
+def test_short_cash_scales_down():
+    prices = universe(50)
+    targets = pd.Series(100000.0, index=prices.index)
+    cash = 1000000.0
+    shares = allocate_lots(targets, prices, cash, commission=0.0003, min_commission=5)
+    assert order_cost(shares * prices, 0.0003, 5).sum() <= cash
+    assert (shares * prices <= targets * 1.2 + 1e-6).all()
+
+
+def test_invalid_prices_and_targets_get_nothing():
+    targets = pd.Series({'a': 10000.0, 'b': 10000.0, 'c': 0.0, 'd': 10000.0})
+    prices = pd.Series({'a': 10.0, 'b': np.nan, 'c': 10.0})
+    shares = allocate_lots(targets, prices, 30000.0)
+    assert list(shares.index) == ['a', 'b', 'c', 'd']
+    # 剩余资金给 a 补到目标的 1.2 倍为止
+    assert shares['a'] == 1200 and shares[['b', 'c', 'd']].sum() == 0
+
+
+def test_slippage_and_lot_below_target():
+    # 一手的花费超过目标的 1.2 倍时不买
+    shares = allocate_lots(pd.Series({'a': 500.0}), pd.Series({'a': 10.0}), 100000.0)
+    assert shares['a'] == 0
+    # 按 价格 * (1 + slippage / 2) 估算，资金只够 9 手
+    shares = allocate_lots(pd.Series({'a': 10000.0}), pd.Series({'a': 10.0}), 10000.0, commission=0,
+                           slippage=0.02)
+    assert shares['a'] == 900
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""daily_bars 的数据接口走策略名字表：install_recorder 回放时涨跌停判断不访问数据源"""
+import collections
+import os
+
+import pytest
+
+from jqlocal.runner import Backtest
+from jqlocal.synthetic import generate
+from jqrecord import install_recorder
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SOURCE_APIS = ('get_price', 'history', 'get_extras')
+
+
+@pytest.fixture(scope='module')
+def data_dir(tmp_path_factory):
+    return generate(str(tmp_path_factory.mktemp('syn')), n_stocks=20, days=30)
+
+
+def counting(calls):
+    """统计到达数据源的调用（作为 Backtest 的 wrap_api）"""
+    def wrap(namespace):
+        wrapped = dict(namespace)
+        for name in SOURCE_APIS:
+            if name in namespace:
+                def api(*args, _func=namespace[name], _name=name, **kwargs):
+                    calls[_name] += 1
+                    return _func(*args, **kwargs)
+                wrapped[name] = api
+        return wrapped
+    return wrap
+
+
+def run_limit_filters(data_dir, archive, mode):
+    calls = collections.Counter()
+    backtest = Backtest(os.path.join(REPO_DIR, 'joinquant_nodb.py'), data_dir, '2023-02-01', '2023-02-10',
+                        log_level='error', wrap_api=counting(calls))
+    context = backtest.initialize()
+    module = backtest.strategy
+    recorder = install_recorder(module.__dict__, archive, mode)
+    recorder.clock = lambda: backtest.runtime.current_dt
+    day = backtest.data.trade_days[-5]
+    backtest.start_day(day)
+    backtest.set_time(day, '10:30')
+    stocks = list(backtest.data.securities.index[:10])
+    module.g.hold_list = stocks[:3]
+    module.update_daily_bars(module.g.daily_bars, context, module.g.hold_list, module.__dict__)
+    calls.clear()
+    result = (module.filter_limitup_stock(context, stocks), module.filter_limitdown_stock(context, stocks))
+    return result, calls, recorder
+
+
+def test_replay_does_not_reach_source(data_dir, tmp_path):
+    archive = str(tmp_path / 'archive')
+    recorded, record_calls, _ = run_limit_filters(data_dir, archive, 'record')
+    # 录制时前收盘价（缓冲区未覆盖的部分）、最新价和ST状态都经过数据源
+    assert record_calls['history'] and record_calls['get_extras'] and record_calls['get_price']
+    replayed, replay_calls, recorder = run_limit_filters(data_dir, archive, 'replay')
+    assert replayed == recorded
+    assert sum(replay_calls.values()) == 0 and recorder.misses == 0 and recorder.hits > 0
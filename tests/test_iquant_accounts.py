@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""iquant_accounts 多账户分发：按比例取整手，各账户在调用线程上依次执行，全部账户完成后才算结清"""
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from jqlocal.exchange import SimulatedExchange
+from iquant_accounts import Account, FanOut, SUBMITTED, SLICING, SKIPPED, ERROR
+
+
+@pytest.fixture
+def accounts():
+    return Account('A', 1.0), Account('B', 0.35)
+
+
+def submit_all(account, todo):
+    for order in todo:
+        account.status[order['pk']] = SUBMITTED
+
+
+def test_scale_rounds_down_to_lots(accounts):
+    first, second = accounts
+    assert second.scale(1000) == 300 and second.scale(600) == 200
+    assert first.scale(99) == 0 and first.scale(1000) == 1000
+
+
+def test_passes_run_serially_on_the_calling_thread(accounts):
+    first, second = accounts
+    threads, ran = set(), []
+
+    def run_pass(account, todo):
+        threads.add(threading.current_thread())
+        ran.append(account.account_id)
+        if account is first:
+            raise RuntimeError('broker down')
+        submit_all(account, todo)
+
+    fanout = FanOut(accounts)
+    orders = [{'pk': 'p1'}, {'pk': 'p2'}]
+    # 一个账户报错不影响其他账户
+    assert fanout.dispatch(run_pass, orders) == [first, second]
+    assert threads == {threading.current_thread()} and ran == ['A', 'B']
+    assert second.settled('p1') and not first.settled('p1')
+    assert fanout.settled_orders(['p1', 'p2']) == []
+    # 只有还有未结清订单的账户再次执行
+    assert fanout.dispatch(run_pass, orders) == [first]
+    first.status.update(p1=SUBMITTED, p2=SKIPPED)
+    assert fanout.dispatch(run_pass, orders) == []
+    assert fanout.settled_orders(['p1', 'p2']) == ['p1', 'p2']
+
+
+def test_errored_orders_are_retried(accounts):
+    first, second = accounts
+    fanout = FanOut(accounts)
+    first.status['p1'] = ERROR
+    second.status['p1'] = SUBMITTED
+    assert fanout.dispatch(submit_all, [{'pk': 'p1'}]) == [first]
+    assert fanout.settled_orders(['p1']) == ['p1']
+    fanout.forget(['p1'])
+    assert not first.status and not second.status
+
+
+def test_sliced_orders_wait_for_the_slicer(accounts):
+    first, second = accounts
+    fanout = FanOut(accounts)
+    first.status['p3'] = second.status['p3'] = SLICING
+    assert fanout.dispatch(submit_all, [{'pk': 'p3'}]) == []
+    assert fanout.settled_orders(['p3']) == []
+    first.status['p3'] = second.status['p3'] = SUBMITTED
+    assert fanout.settled_orders(['p3']) == ['p3']
+
+
+def test_account_routing_and_positions(accounts):
+    first, second = accounts
+    fanout = FanOut(accounts)
+    assert fanout.primary is first
+    assert fanout.account_for(SimpleNamespace(m_strAccountID='B')) is second
+    # 没有账户号或账户号未知时归主账户
+    assert fanout.account_for(SimpleNamespace()) is first
+    assert fanout.account_for(SimpleNamespace(m_strAccountID='X')) is first
+
+    exchange = SimulatedExchange({'600000': [(9.99, 10.00, 1000)]}, positions={'600000': 500, '000001': 0},
+                                 account_id='B')
+    positions = second.refresh_positions(exchange.get_trade_detail_data, lambda code: code.split('.')[0])
+    assert positions == {'600000': 500} and second.positions is positions
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""iquant_dedupe 幂等下单：用户委托编号由 pk 确定，重启后从券商委托列表重建已下单集合"""
+from jqlocal.exchange import SimulatedExchange
+from iquant_dedupe import SubmissionIndex, user_order_id, child_order_id, parent_order_id
+
+ACCOUNT = 'SIM'
+
+
+def test_user_order_id_is_deterministic_and_compact():
+    pk = '4f1c2a9e-0000-4000-8000-000000000001'
+    uid = user_order_id(pk)
+    assert uid == user_order_id(pk) and uid != user_order_id('another-pk')
+    assert uid.startswith('jq') and len(uid) == 18
+    assert parent_order_id(child_order_id(uid, 12)) == uid and parent_order_id(uid) == uid
+
+
+def test_rebuild_from_broker_orders():
+    exchange = SimulatedExchange({'600000': [(9.99, 10.00, 1000)]})
+    uid = user_order_id('pk-1')
+    exchange.passorder(23, 1101, ACCOUNT, '600000', 11, 9.50, 100, '', 2, uid)
+    exchange.passorder(23, 1101, ACCOUNT, '600000', 11, 9.50, 100, '', 2, 'manual')
+    index = SubmissionIndex()
+    # 手工下的单（备注不以 jq 开头）不计入
+    assert index.rebuild(ACCOUNT, exchange.get_trade_detail_data) == 1
+    assert uid in index and 'manual' not in index
+
+
+def test_uncertain_submission_is_resolved_from_the_broker():
+    exchange = SimulatedExchange({'600000': [(9.99, 10.00, 1000)]})
+    index = SubmissionIndex()
+    sent, lost = user_order_id('pk-sent'), user_order_id('pk-lost')
+    # passorder 报错：拆单的一笔子单其实到了券商，另一笔没有
+    index.mark_uncertain(sent)
+    index.mark_uncertain(lost)
+    exchange.passorder(23, 1101, ACCOUNT, '600000', 11, 9.50, 100, '', 2, child_order_id(sent, 3))
+    index.resolve(ACCOUNT, exchange.get_trade_detail_data)
+    assert sent in index and lost not in index
+    assert not index.is_uncertain(sent) and not index.is_uncertain(lost)
+
+
+def test_resolve_skips_the_query_without_uncertain_ids():
+    index = SubmissionIndex()
+    index.add(user_order_id('pk-1'))
+
+    def query(*args):
+        raise AssertionError('没有未确定的下单时不查询券商')
+
+    index.resolve(ACCOUNT, query)
+    assert len(index) == 1
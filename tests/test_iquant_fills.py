@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""iquant_fills 成交回写：回调与轮询合并、成交去重、按备注/代码方向数量匹配、批量写回"""
+from types import SimpleNamespace
+
+import pytest
+
+from jqlocal.exchange import SimulatedExchange
+from iquant_fills import (FillTracker, BUY_DIRECTION, SELL_DIRECTION, PARTIAL, FILLED, CANCELLED,
+                          REJECTED)
+
+ACCOUNT = 'SIM'
+
+
+@pytest.fixture
+def written():
+    return []
+
+
+@pytest.fixture
+def tracker(written):
+    return FillTracker(lambda rows: written.extend(rows) or True, flush_interval=0, poll_interval=0)
+
+
+def rows_by_pk(written):
+    return dict((row[4], row) for row in written)
+
+
+def test_callbacks_match_by_code_then_broker_id_and_drop_duplicate_deals(tracker, written):
+    tracker.register('pk-1', '600000.SH', BUY_DIRECTION, 1000, 10.0)
+    tracker.on_order(SimpleNamespace(m_strOrderSysID='A1', m_strInstrumentID='600000', m_nOffsetFlag=48,
+                                     m_nVolumeTotalOriginal=1000, m_nVolumeTraded=0, m_nOrderStatus=50))
+    assert tracker.orders['pk-1'].broker_id == 'A1'
+    deal = SimpleNamespace(m_strOrderSysID='A1', m_strTradeID='T1', m_nVolume=400, m_dPrice=10.01)
+    tracker.on_deal(deal)
+    tracker.on_deal(deal)
+    assert tracker.orders['pk-1'].status == PARTIAL and tracker.orders['pk-1'].filled == 400
+    tracker.on_deal(SimpleNamespace(m_strOrderSysID='A1', m_strTradeID='T2', m_nVolume=600, m_dPrice=10.02))
+    tracker.flush()
+    assert rows_by_pk(written)['pk-1'][:3] == (1000, 10.016, FILLED)
+    # 写回后的终态订单被移除
+    assert not tracker.orders
+
+
+def test_polling_the_simulated_exchange(tracker, written):
+    exchange = SimulatedExchange({'000001': [(11.98, 11.99, 400)] + [(11.90, 11.91, 400)] * 5,
+                                  '600000': [(9.99, 10.00, 4000)] * 6},
+                                 positions={'000001': 500}, fill_ratio=0.5)
+    tracker.register('pk-2', '000001.SZ', SELL_DIRECTION, 500, 11.98, 'jq0002')
+    tracker.register('pk-3', '600000.SH', BUY_DIRECTION, 1000, 10.00, 'jq0003')
+    exchange.passorder(SELL_DIRECTION, 1101, ACCOUNT, '000001.SZ', 11, 11.98, 500, '', 2, 'jq0002')
+    exchange.passorder(BUY_DIRECTION, 1101, ACCOUNT, '600000.SH', 11, 10.00, 1000, '', 2, 'jq0003')
+    # 卖单成交 200 股后价格走低，撤单；买单一次成交
+    exchange.advance()
+    exchange.cancel(exchange.orders[0].m_strOrderSysID)
+    tracker.tick(ACCOUNT, exchange.get_trade_detail_data)
+    rows = rows_by_pk(written)
+    assert rows['pk-2'][:3] == (200, 11.98, CANCELLED)
+    assert rows['pk-3'][:3] == (1000, 10.0, FILLED)
+    assert not tracker.open_orders()
+
+
+def test_order_error_rejects_by_remark(tracker, written):
+    tracker.register('pk-3', '300750.SZ', BUY_DIRECTION, 200, 150.0, 'jq0003')
+    tracker.on_error(SimpleNamespace(m_strRemark='jq0003'), 'insufficient funds')
+    tracker.flush()
+    assert rows_by_pk(written)['pk-3'][2] == REJECTED
+
+
+def test_late_report_of_a_finished_order_is_ignored(tracker):
+    tracker.register('pk-1', '600000.SH', BUY_DIRECTION, 1000, 10.0)
+    filled = SimpleNamespace(m_strOrderSysID='A1', m_strInstrumentID='600000', m_nOffsetFlag=48,
+                             m_nVolumeTotalOriginal=1000, m_nVolumeTraded=1000, m_dTradedPrice=10.0,
+                             m_nOrderStatus=56)
+    tracker.on_order(filled)
+    tracker.flush()
+    # 同代码同方向同数量的新订单不能接上已完成订单的迟到回报
+    tracker.register('pk-4', '600000.SH', BUY_DIRECTION, 1000, 10.0)
+    assert tracker.on_order(filled) is None
+    assert tracker.orders['pk-4'].broker_id is None
+
+
+@pytest.mark.parametrize('remark', ['jq0004-1', 'manual'])
+def test_unknown_remark_never_takes_over_a_tracked_order(tracker, remark):
+    tracker.register('pk-4', '600000.SH', BUY_DIRECTION, 1000, 10.0)
+    # 拆单子单、其他账户或手工下的单带有本跟踪器未登记的备注
+    assert tracker.on_order(SimpleNamespace(m_strOrderSysID='C-' + remark, m_strInstrumentID='600000',
+                                            m_nOffsetFlag=48, m_nVolumeTotalOriginal=1000, m_nOrderStatus=56,
+                                            m_strRemark=remark)) is None
+    assert tracker.orders['pk-4'].broker_id is None and tracker.orders['pk-4'].status != FILLED
+
+
+def test_failed_write_keeps_rows_for_the_next_flush(written):
+    attempts = []
+    tracker = FillTracker(lambda rows: attempts.append(rows) and False, flush_interval=0, poll_interval=0)
+    tracker.register('pk-1', '600000.SH', BUY_DIRECTION, 1000, 10.0, 'jq0001')
+    tracker.on_error('pk-1', 'rejected')
+    assert tracker.flush() == 0 and 'pk-1' in tracker.orders
+    tracker.writer = lambda rows: written.extend(rows) or True
+    assert tracker.flush() == 1 and not tracker.orders
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""iquant_journal 预写日志：按账户折叠订单状态、忽略截断的最后一行、只在显式 sync 或积满 sync_every 条时落盘"""
+import os
+
+import pytest
+
+import iquant_journal
+from iquant_journal import Journal, CLAIM, SUBMIT, ERROR, SKIP, MARK, ACK
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    calls = []
+    real = os.fsync
+
+    def fsync(fd):
+        calls.append(fd)
+        real(fd)
+
+    monkeypatch.setattr(iquant_journal.os, 'fsync', fsync)
+    return calls
+
+
+def write_day(journal):
+    journal.append(CLAIM, acct='A', pk='a', uid='jq01', code='600000', direction=23, volume=1000,
+                   price=10.02, base_price=10.00)
+    journal.append(SUBMIT, acct='A', pk='a')
+    journal.append(SKIP, acct='B', pk='a')
+    journal.append(CLAIM, acct='A', pk='b', uid='jq02', code='000001', direction=24, volume=500,
+                   price=11.98, sliced=True)
+    journal.append(ERROR, acct='A', pk='b', message='timeout')
+    journal.append(MARK, pks=['a'])
+    journal.append(ACK, acct='A', pk='a', status='filled', qty=1000, avg_price=10.01)
+
+
+def test_replay_folds_records_per_account(tmp_path):
+    journal = Journal(str(tmp_path))
+    write_day(journal)
+    journal.sync()
+    with open(journal.path, 'a') as f:
+        f.write('{"ev": "claim", "pk": "c", "ui')  # 崩溃时写了一半的最后一行
+
+    # 重启：重新打开同一天的日志
+    journal = Journal(str(tmp_path))
+    states = journal.replay()
+    assert set(states) == {('A', 'a'), ('B', 'a'), ('A', 'b')}
+    a = states[('A', 'a')]
+    assert a.submitted and a.marked and a.status == 'filled' and a.fill_qty == 1000
+    assert a.price == 10.02 and a.base_price == 10.00 and not a.sliced
+    # 标记对该订单的所有账户生效
+    assert states[('B', 'a')].skipped and states[('B', 'a')].marked
+    b = states[('A', 'b')]
+    assert b.errored and b.sliced and not b.submitted and not b.marked and b.uid == 'jq02'
+    # 截断的行之后继续写入的记录从新行开始
+    journal.append(SUBMIT, acct='A', pk='b')
+    journal.sync()
+    assert journal.replay()[('A', 'b')].submitted
+
+
+def test_append_does_not_fsync_on_its_own(tmp_path, fsyncs):
+    journal = Journal(str(tmp_path), sync_every=32)
+    write_day(journal)
+    assert fsyncs == [] and journal.unsynced == 7
+    # 回放读取缓冲中的记录，但不落盘
+    assert journal.replay()[('A', 'a')].submitted and fsyncs == []
+    journal.sync()
+    assert len(fsyncs) == 1 and journal.unsynced == 0
+    # 没有新记录时 sync 不再 fsync
+    journal.sync()
+    assert len(fsyncs) == 1
+
+
+def test_append_syncs_after_sync_every_records(tmp_path, fsyncs):
+    journal = Journal(str(tmp_path), sync_every=3)
+    for i in range(7):
+        journal.append(SUBMIT, acct='A', pk=str(i))
+    assert len(fsyncs) == 2 and journal.unsynced == 1
+    journal.close()
+    assert len(fsyncs) == 3
+
+
+def test_old_days_are_pruned(tmp_path):
+    for day in ('20240101', '20240102', '20240103', '20240104'):
+        (tmp_path / 'journal_{}.log'.format(day)).write_text('')
+    journal = Journal(str(tmp_path), keep_days=3)
+    names = sorted(os.listdir(str(tmp_path)))
+    assert names == ['journal_20240103.log', 'journal_20240104.log', os.path.basename(journal.path)]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""iquant_quotes 行情缓存：在模拟交易所上验证推送、批量补取、过期回退到数据库价格和订阅同步"""
+import pytest
+
+from jqlocal.exchange import SimulatedExchange
+from iquant_quotes import QuoteCache
+
+BUY, SELL = 23, 24
+
+
+@pytest.fixture
+def exchange():
+    return SimulatedExchange({'600000': [(10.04, 10.05, 1000), (10.09, 10.10, 1000), (0.0, 0.0, 0)],
+                              '000001': [(12.50, 12.51, 1000)]}, step_seconds=3)
+
+
+def subscribe(exchange):
+    return lambda code, callback: exchange.subscribe_quote(code, callback=callback)
+
+
+def test_pushed_tick_prices_from_the_counter_side(exchange):
+    cache = QuoteCache(max_age=5, clock=exchange.clock)
+    cache.watch(subscribe(exchange), exchange.unsubscribe_quote, ['600000.SH'])
+    assert cache.get('600000') is None
+    exchange.advance()
+    # 买单按卖一 10.10 上浮 0.2%，卖单按买一 10.09 下浮 0.2%
+    assert cache.get('600000.SH') == (10.09, 10.10, 10.095)
+    assert cache.limit_price('600000', BUY, 10.00, 0.002, 0.03) == 10.12
+    assert cache.limit_price('600000', SELL, 10.00, 0.002, 0.03) == 10.07
+    assert cache.stats['fresh'] == 2
+
+
+def test_pull_only_missing_codes_and_grow_the_table(exchange):
+    cache = QuoteCache(max_age=5, capacity=1, clock=exchange.clock)
+    cache.watch(subscribe(exchange), exchange.unsubscribe_quote, ['600000.SH'])
+    exchange.advance()
+    # 600000 有推送，只补取未订阅的 000001；第二行触发扩容
+    assert cache.refresh(exchange.get_full_tick, ['600000.SH', '000001.SZ']) == 1
+    assert len(cache.table) >= 2 and len(cache) == 2
+    assert cache.refresh(exchange.get_full_tick, ['000001.SZ']) == 0
+    # 数据库价格过时：按买一定价后被限制在其 3% 以内
+    assert cache.limit_price('000001', SELL, 11.00, 0.002, 0.03) == 11.33
+    assert cache.stats['clamped'] == 1
+
+
+def test_stale_or_empty_quote_falls_back_to_the_db_price(exchange):
+    cache = QuoteCache(max_age=5, clock=exchange.clock)
+    cache.watch(subscribe(exchange), exchange.unsubscribe_quote, ['600000.SH'])
+    cache.refresh(exchange.get_full_tick, ['000001.SZ'])
+    exchange.advance(2)
+    # 600000 的推送买卖盘为空；000001 没有推送，6 秒后过期
+    assert cache.get('600000') is None and cache.get('000001') is None
+    assert cache.limit_price('600000', BUY, 10.00, 0.002, 0.03) == 10.02
+    assert cache.limit_price('000001', SELL, 11.00, 0.002, 0.03) == 10.98
+    assert cache.stats['stale'] == 2
+
+
+def test_last_price_is_used_when_the_counter_side_is_empty():
+    cache = QuoteCache(clock=lambda: 0.0)
+    # 涨停封板：卖盘为空，按最新价定价
+    cache.on_tick({'600000.SH': {'bidPrice': [11.00, 10.99], 'askPrice': [], 'lastPrice': 11.00}})
+    assert cache.limit_price('600000', BUY, 10.98, 0.0, 0.03) == 11.00
+
+
+def test_watch_follows_the_wanted_codes(exchange):
+    cache = QuoteCache(clock=exchange.clock)
+    cache.watch(subscribe(exchange), exchange.unsubscribe_quote, ['600000.SH', '000001.SZ'])
+    assert set(cache.subscriptions) == {'600000', '000001'} and len(exchange.subscribers) == 2
+    cache.watch(subscribe(exchange), exchange.unsubscribe_quote, ['000001.SZ'])
+    assert set(cache.subscriptions) == {'000001'} and len(exchange.subscribers) == 1
+    cache.watch(subscribe(exchange), exchange.unsubscribe_quote, [])
+    assert not cache.subscriptions and not exchange.subscribers
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""iquant_slicer 拆单调度：在模拟交易所上验证撤单改价、重启恢复和未在券商委托列表中出现的子单"""
+from jqlocal.exchange import SimulatedExchange
+from iquant_fills import CANCELLED, FILLED
+from iquant_slicer import SliceScheduler, PARTICIPATION, TWAP
+
+ACCOUNT = 'SIM'
+
+
+def make_scheduler(exchange, query=None, place=None, **kwargs):
+    options = dict(schedule=TWAP, horizon=30, interval=30, reprice_after=9, max_steps=3, price_offset=0.0,
+                   grace=30, clock=exchange.clock)
+    options.update(kwargs)
+    return SliceScheduler(
+        place=place or (lambda parent, child: exchange.passorder(parent.direction, 1101, ACCOUNT, parent.code, 11,
+                                                                 child.price, child.volume, '', 2, child.uid)),
+        cancel=lambda child: exchange.cancel(child.broker_id),
+        query=query or (lambda: exchange.get_trade_detail_data(ACCOUNT, 'stock', 'order')),
+        **options)
+
+
+def run(scheduler, exchange, steps):
+    for _ in range(steps):
+        scheduler.tick()
+        exchange.advance()
+
+
+def thin_book():
+    # 薄盘口：前 10 步（每步 3 秒）买一/卖一 9.99/10.00，之后卖一涨到 10.03
+    path = {'600000': [(9.99, 10.00, 4000)] * 10 + [(10.02, 10.03, 4000)] * 200,
+            '000001': [(11.99, 12.00, 6000)] * 210}
+    return SimulatedExchange(path, positions={'000001': 9000}, fill_ratio=0.5, step_seconds=3)
+
+
+def participation_scheduler(exchange, written, finished):
+    def writer(rows):
+        for row in rows:
+            written[row[-1]] = row
+        return True
+
+    return make_scheduler(exchange, writer=writer, schedule=PARTICIPATION, horizon=120, interval=15,
+                          participation=0.25, recent_volume=lambda code: exchange.quote(code)[2] * 5,
+                          reprice_step=0.001, on_done=lambda parent: finished.append(parent.pk))
+
+
+def run_to_end(scheduler, exchange, last_step=200):
+    while len(scheduler) and exchange.step < last_step:
+        scheduler.tick()
+        exchange.advance()
+
+
+def check_fills(exchange, written, finished):
+    assert sorted(finished) == ['buy-1', 'sell-1']
+    # 子单编号不重复；买单在卖一上移后逐步改价，不超过 3 档的上限
+    assert len(set(o.m_strRemark for o in exchange.orders)) == len(exchange.orders)
+    assert max(o.m_dLimitPrice for o in exchange.orders if o.m_strRemark.startswith('jqbuy')) <= 10.03
+    assert all(0 < o.m_nVolumeTotalOriginal <= 5000 for o in exchange.orders)
+    assert written['buy-1'][0] == 10000 and written['buy-1'][2] == FILLED
+    assert written['sell-1'][0] == 9000 and exchange.positions['000001'] == 0
+    assert exchange.cancels > 0
+
+
+def test_participation_slices_are_repriced_until_filled():
+    exchange = thin_book()
+    written, finished = {}, []
+    scheduler = participation_scheduler(exchange, written, finished)
+    scheduler.add('buy-1', 'jqbuy', '600000', 23, 10000, 10.00)
+    scheduler.add('sell-1', 'jqsell', '000001', 24, 9000, 12.00)
+    run(scheduler, exchange, 1)
+    # 120 秒分 8 片，第一片为父单的 1/8 向下取整手（参与率上限 4000 * 5 * 25% 未起作用）
+    assert [o.m_nVolumeTotalOriginal for o in exchange.orders] == [1200, 1100]
+    run_to_end(scheduler, exchange)
+    check_fills(exchange, written, finished)
+    assert len(scheduler) == 0 and not scheduler.codes()
+
+
+def test_resume_after_restart_finishes_the_remainder():
+    exchange = thin_book()
+    written, finished = {}, []
+    scheduler = participation_scheduler(exchange, written, finished)
+    scheduler.add('buy-1', 'jqbuy', '600000', 23, 10000, 10.00)
+    scheduler.add('sell-1', 'jqsell', '000001', 24, 9000, 12.00)
+    run(scheduler, exchange, 12)
+    assert scheduler.active('buy-1') and scheduler.codes() == {'600000', '000001'}
+    # 重启：父单由券商委托列表中的子单重建，剩余数量重新排期
+    sent = len(exchange.orders)
+    scheduler = participation_scheduler(exchange, written, finished)
+    orders = exchange.get_trade_detail_data(ACCOUNT, 'stock', 'order')
+    resumed = scheduler.resume('buy-1', 'jqbuy', '600000', 23, 10000, 10.00, orders)
+    scheduler.resume('sell-1', 'jqsell', '000001', 24, 9000, 12.00, orders)
+    assert resumed.committed > 0 and resumed.seq == sum(o.m_strRemark.startswith('jqbuy') for o in orders)
+    assert resumed.filled == exchange.filled('600000')
+    run_to_end(scheduler, exchange)
+    assert len(exchange.orders) > sent
+    check_fills(exchange, written, finished)
+
+
+def test_participation_caps_children_at_recent_market_volume():
+    exchange = thin_book()
+    scheduler = make_scheduler(exchange, schedule=PARTICIPATION, horizon=120, interval=15, participation=0.25,
+                               recent_volume=lambda code: 2000)
+    scheduler.add('buy-1', 'jqbuy', '600000', 23, 10000, 10.00)
+    run(scheduler, exchange, 1)
+    assert [o.m_nVolumeTotalOriginal for o in exchange.orders] == [500]
+
+
+def resting_exchange():
+    # 卖一价 10.50，基准价 10.00 的买单一直挂着不成交
+    return SimulatedExchange({'600000': [(10.49, 10.50, 4000)] * 100}, step_seconds=3)
+
+
+def test_unlisted_child_stays_committed_until_a_later_poll():
+    exchange = resting_exchange()
+    hidden = {'polls': 5}
+
+    def query():
+        # 第一笔子单在前 5 次查询中不出现（券商回报慢）
+        orders = exchange.get_trade_detail_data(ACCOUNT, 'stock', 'order')
+        if hidden['polls']:
+            hidden['polls'] -= 1
+            return [o for o in orders if o.m_strRemark != 'jqbuy-1']
+        return orders
+
+    scheduler = make_scheduler(exchange, query=query)
+    parent = scheduler.add('buy-1', 'jqbuy', '600000', 23, 1000, 10.00)
+    run(scheduler, exchange, 5)
+    # 过了 reprice_after 仍未出现：数量不退回，也不重发
+    assert len(exchange.orders) == 1 and parent.children[0].live
+    assert parent.committed == 1000
+    run(scheduler, exchange, 3)
+    # 出现后按正常的撤单改价处理，挂单总量不超过父单
+    child = parent.children[0]
+    assert child.broker_id == exchange.orders[0].m_strOrderSysID and not child.abandoned
+    open_volume = sum(o.remaining for o in exchange.orders if o.is_open)
+    assert open_volume <= 1000
+
+
+def test_missing_child_is_given_back_after_a_second_interval():
+    exchange = resting_exchange()
+    failures = {'left': 1}
+
+    def place(parent, child):
+        if failures['left']:
+            failures['left'] -= 1
+            raise RuntimeError('timeout')
+        exchange.passorder(parent.direction, 1101, ACCOUNT, parent.code, 11, child.price, child.volume, '', 2,
+                           child.uid)
+
+    scheduler = make_scheduler(exchange, place=place)
+    parent = scheduler.add('buy-1', 'jqbuy', '600000', 23, 1000, 10.00)
+    run(scheduler, exchange, 4)
+    # 第一次发现缺失（reprice_after 时）只记下时间
+    first = parent.children[0]
+    assert first.live and first.missing_since is not None and not exchange.orders
+    run(scheduler, exchange, 3)
+    # 又过了 reprice_after 仍然没有：退回数量，重发一笔
+    assert first.status == CANCELLED and first.abandoned
+    assert len(exchange.orders) == 1 and exchange.orders[0].m_nVolumeTotalOriginal == 1000
+
+
+def test_abandoned_child_showing_up_late_is_cancelled():
+    exchange = resting_exchange()
+    late = []
+
+    def place(parent, child):
+        if not late:
+            # 下单接口报错，但委托其实到了券商，只是很久之后才出现在委托列表中
+            late.append(child)
+            raise RuntimeError('timeout')
+        exchange.passorder(parent.direction, 1101, ACCOUNT, parent.code, 11, child.price, child.volume, '', 2,
+                           child.uid)
+
+    scheduler = make_scheduler(exchange, place=place)
+    parent = scheduler.add('buy-1', 'jqbuy', '600000', 23, 1000, 10.00)
+    run(scheduler, exchange, 7)
+    assert late[0].abandoned and len(exchange.orders) == 1
+    child = late[0]
+    exchange.passorder(23, 1101, ACCOUNT, '600000', 11, child.price, child.volume, '', 2, child.uid)
+    run(scheduler, exchange, 1)
+    assert not exchange.orders[-1].is_open and child.cancelling
+    assert sum(o.remaining for o in exchange.orders if o.is_open) <= 1000
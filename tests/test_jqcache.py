@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""ApiCache 交易日内缓存：未绑定时透传、盘中当日日线不缓存、快照按 ttl 失效、跨日失效和 LRU 淘汰"""
+import datetime
+from types import SimpleNamespace
+
+import pytest
+
+from jqcache import ApiCache, BARS, DAILY, SNAPSHOT
+
+
+@pytest.fixture
+def context():
+    return SimpleNamespace(current_dt=datetime.datetime(2024, 1, 2, 9, 0))
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def price(calls):
+    def get_price(security, start_date=None, end_date=None, frequency='daily', **kwargs):
+        calls.append(end_date)
+        return len(calls)
+    return get_price
+
+
+def call_price(cache, price, security, end_date, **kwargs):
+    kwargs['end_date'] = end_date
+    return cache.call('get_price', price, BARS, (security,), kwargs)
+
+
+def test_unbound_cache_passes_through(price):
+    cache = ApiCache()
+    assert call_price(cache, price, ['a'], '2024-01-01') == 1
+    assert call_price(cache, price, ['a'], '2024-01-01') == 2
+    assert cache.stats['get_price'] == [0, 0, 2]
+
+
+def test_settled_daily_bars_are_cached(context, price):
+    cache = ApiCache()
+    cache.bind(context)
+    assert call_price(cache, price, ['a'], '2024-01-01') == 1
+    # 列表和元组参数规范化为同一个键
+    assert call_price(cache, price, ('a',), '2024-01-01') == 1
+    # 分钟线、盘中取当日日线不缓存
+    assert call_price(cache, price, ['a'], '2024-01-01', frequency='1m') == 2
+    assert call_price(cache, price, ['a'], '2024-01-02') == 3
+    assert call_price(cache, price, ['a'], '2024-01-02') == 4
+    # 收盘后当日日线不再变化
+    context.current_dt = datetime.datetime(2024, 1, 2, 15, 30)
+    assert call_price(cache, price, ['a'], '2024-01-02') == 5
+    assert call_price(cache, price, ['a'], '2024-01-02') == 5
+    assert cache.hits == 2 and cache.misses == 2
+
+
+def test_snapshot_expires_after_ttl(context):
+    cache = ApiCache(snapshot_ttl=30)
+    cache.bind(context)
+    snap = lambda: cache.call('get_current_data', object, SNAPSHOT, (), {})  # noqa: E731
+    first = snap()
+    context.current_dt += datetime.timedelta(seconds=10)
+    assert snap() is first
+    context.current_dt += datetime.timedelta(seconds=30)
+    assert snap() is not first
+
+
+def test_new_day_clears_and_lru_evicts(context, price):
+    cache = ApiCache(maxsize=2)
+    cache.bind(context)
+    call_price(cache, price, ['a'], '2024-01-01')
+    assert call_price(cache, price, ['a'], '2024-01-01') == 1
+    context.current_dt = datetime.datetime(2024, 1, 3, 9, 0)
+    assert call_price(cache, price, ['a'], '2024-01-01') == 2
+    call_price(cache, price, ['b'], '2024-01-01')
+    # a 最近被访问，淘汰的是 b
+    call_price(cache, price, ['a'], '2024-01-01')
+    call_price(cache, price, ['c'], '2024-01-01')
+    assert len(cache._entries) == 2 and cache.evictions == 1
+    assert call_price(cache, price, ['a'], '2024-01-01') == 2
+    assert call_price(cache, price, ['b'], '2024-01-01') == 5
+
+
+def test_unhashable_arguments_pass_through(context):
+    cache = ApiCache()
+    cache.bind(context)
+    results = iter(range(10))
+    func = lambda query: next(results)  # noqa: E731
+    query = SimpleNamespace(statement='select 1')
+    assert cache.call('get_fundamentals', func, DAILY, (query,), {}) == 0
+    assert cache.call('get_fundamentals', func, DAILY, (query,), {}) == 1
+    assert cache.stats['get_fundamentals'] == [0, 0, 2]
+
+
+def test_daily_helper_and_report(context):
+    cache = ApiCache()
+    cache.bind(context)
+    calls = []
+
+    def get_index_stocks(index):
+        calls.append(index)
+        return ['a']
+
+    assert cache.daily(get_index_stocks, '399101.XSHE') == cache.daily(get_index_stocks, '399101.XSHE')
+    assert calls == ['399101.XSHE'] and cache.hit_rate() == 0.5
+    assert 'get_index_stocks' in '\n'.join(cache.report_lines())
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""joinquant.py 涨停持仓开板监控：09:30 不做判断，第一根分钟线走完后按当日分钟价判断"""
+import datetime
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip('sqlalchemy')
+
+from jqlocal.api import minute_time
+from jqlocal.data import write_table
+from jqlocal.runner import Backtest
+from jqlocal.synthetic import generate
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def backtest(tmp_path):
+    data_dir = generate(str(tmp_path), n_stocks=20, days=30)
+    backtest = Backtest(os.path.join(REPO_DIR, 'joinquant.py'), data_dir, '2023-02-01', '2023-02-10',
+                        frequency='minute', log_level='error')
+    context = backtest.initialize()
+    day = backtest.data.trade_days[-5]
+    stock = backtest.data.securities.index[0]
+    high_limit = float(backtest.runtime.day_value('high_limit', stock, day))
+    # 开盘封板 5 分钟后开板
+    times = [minute_time(day, i) for i in range(1, 241)]
+    closes = np.where(np.arange(240) < 5, high_limit, round(high_limit * 0.98, 2))
+    write_table(pd.DataFrame({stock: closes}, index=times),
+                os.path.join(data_dir, 'minute', day.strftime('%Y%m%d')), 'csv')
+
+    module = backtest.strategy
+    sold = []
+    module.sell_opened_limit_up = lambda context, stocks, prices: sold.append((context.current_dt.time(), stocks))
+    backtest.start_day(day)
+    module.g.high_limit_list = [stock]
+    module.g.today_high_limit = {stock: high_limit}
+    return backtest, context, day, stock, sold
+
+
+def call_handle_data(backtest, context, day, time):
+    backtest.set_time(day, time)
+    backtest.strategy.handle_data(context, backtest.runtime.get_current_data())
+
+
+def test_no_sell_at_0930(backtest):
+    backtest, context, day, stock, sold = backtest
+    call_handle_data(backtest, context, day, '09:30')
+    assert sold == []
+
+
+def test_sell_after_board_opens(backtest):
+    backtest, context, day, stock, sold = backtest
+    for time in ('09:31', '09:35'):
+        call_handle_data(backtest, context, day, time)
+    assert sold == []
+    call_handle_data(backtest, context, day, '09:36')
+    assert sold == [(datetime.time(9, 36), [stock])]
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""price_limit 本地涨跌停价：各板块和ST的涨跌幅、创业板改革前后的规则、按分四舍五入（.005 进位）"""
+import datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from code_table import MAIN, CHINEXT, STAR, BSE
+from price_limit import limit_percent, limit_prices, limit_table, limit_status
+
+AFTER_REFORM = datetime.date(2024, 1, 2)
+BEFORE_REFORM = datetime.date(2020, 8, 21)
+
+
+@pytest.mark.parametrize('pre_close, board, is_st, high, low', [
+    # 前收, 板块, ST, 涨停, 跌停
+    (10.05, MAIN, False, 11.06, 9.05),    # 11.055 / 9.045 进位
+    (3.33, MAIN, True, 3.50, 3.16),       # ST 5%
+    (1.01, MAIN, True, 1.06, 0.96),       # 1.0605 / 0.9595
+    (2.50, MAIN, True, 2.63, 2.38),       # 2.625 / 2.375 进位
+    (0.10, MAIN, True, 0.11, 0.10),       # 0.105 / 0.095：浮点 round 会舍掉
+    (12.35, CHINEXT, False, 14.82, 9.88),
+    (12.35, CHINEXT, True, 14.82, 9.88),  # 改革后创业板 ST 也是 20%
+    (45.67, STAR, False, 54.80, 36.54),
+    (45.67, STAR, True, 54.80, 36.54),
+    (8.88, BSE, False, 11.54, 6.22),
+    (8.88, BSE, True, 11.54, 6.22),
+])
+def test_board_rules_and_half_up(pre_close, board, is_st, high, low):
+    highs, lows = limit_prices([pre_close], [board], [is_st], AFTER_REFORM)
+    assert (highs[0], lows[0]) == (high, low)
+
+
+def test_chinext_before_reform_uses_main_board_limits():
+    boards = [CHINEXT, CHINEXT, STAR]
+    is_st = [False, True, True]
+    assert limit_percent(boards, is_st, BEFORE_REFORM).tolist() == [10, 5, 20]
+    assert limit_percent(boards, is_st, datetime.date(2020, 8, 24)).tolist() == [20, 20, 20]
+    high, low = limit_prices([12.35, 12.35], [CHINEXT, CHINEXT], [False, True], BEFORE_REFORM)
+    assert high.tolist() == [13.59, 12.97] and low.tolist() == [11.12, 11.73]
+
+
+def test_invalid_pre_close_and_low_floor():
+    high, low = limit_prices([np.nan, 0.0, 0.01], [MAIN, MAIN, MAIN])
+    assert np.isnan(high[0]) and np.isnan(low[0]) and np.isnan(high[1])
+    # 跌停价至少一分钱
+    assert (high[2], low[2]) == (0.01, 0.01)
+
+
+def test_matches_decimal_half_up():
+    rng = np.random.RandomState(11)
+    pre_close = np.round(rng.uniform(0.5, 500, 200000), 2)
+    boards = rng.randint(0, 4, len(pre_close))
+    is_st = rng.rand(len(pre_close)) < 0.1
+    high, low = limit_prices(pre_close, boards, is_st)
+    percent = limit_percent(boards, is_st)
+    for i in range(0, len(pre_close), 97):
+        p = Decimal('%.2f' % pre_close[i])
+        r = Decimal(int(percent[i])) / 100
+        exp_high = float((p * (1 + r)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+        exp_low = float((p * (1 - r)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP))
+        assert (high[i], low[i]) == (exp_high, exp_low), (pre_close[i], boards[i], is_st[i])
+
+
+def test_limit_table_resolves_boards_from_codes():
+    codes = ['600000.XSHG', '000001.XSHE', '300750.XSHE', '688001.XSHG', '830799.BJ']
+    pre_close = pd.Series(10.0, index=codes)
+    # is_st 中缺失的证券按非ST处理
+    is_st = pd.Series({'000001.XSHE': True})
+    table = limit_table(pre_close, is_st, AFTER_REFORM)
+    assert list(table.index) == codes
+    assert table['high_limit'].tolist() == [11.0, 10.5, 12.0, 12.0, 13.0]
+    assert table['low_limit'].tolist() == [9.0, 9.5, 8.0, 8.0, 7.0]
+
+
+def test_limit_status_masks():
+    pre_close = pd.Series({'600000.XSHG': 10.0, '300750.XSHE': 10.0, '000001.XSHE': 10.0})
+    price = pd.Series({'600000.XSHG': 11.0, '300750.XSHE': 11.0, '000001.XSHE': 9.5})
+    status = limit_status(pre_close, price, pd.Series({'000001.XSHE': True}), AFTER_REFORM)
+    assert status['limit_up'].tolist() == [True, False, False]
+    assert status['limit_down'].tolist() == [False, False, True]
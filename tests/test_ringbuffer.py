@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""BarRingBuffer 与逐根保留的 deque 对照：最近 N 根为连续视图，预热、调整证券列表后历史保持一致"""
+from collections import deque
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ringbuffer import BarRingBuffer
+
+CODES = ['%06d.XSHE' % i for i in range(20)]
+
+
+@pytest.fixture
+def rng():
+    return np.random.RandomState(5)
+
+
+def test_last_n_matches_a_deque_across_wraparound(rng):
+    buffer = BarRingBuffer(['close', 'paused'], capacity=5, securities=CODES)
+    reference = deque(maxlen=5)
+    for t in range(23):
+        close = pd.Series(rng.rand(20), index=CODES)
+        buffer.push({'close': close}, t)
+        reference.append(close.values)
+        for n in (1, 3, 5, 8):
+            assert np.array_equal(buffer.last('close', n), np.array(list(reference)[-n:])), (t, n)
+        assert buffer.times(2) == list(range(max(t - 1, 0), t + 1))
+        assert np.array_equal(buffer.latest('close'), close.values)
+    # 未写入的字段为缺失值
+    assert np.isnan(buffer.latest('paused')).all()
+
+
+def test_reads_are_views(rng):
+    buffer = BarRingBuffer(['close'], capacity=5, securities=CODES)
+    for t in range(7):
+        buffer.push({'close': rng.rand(20)}, t)
+    assert np.shares_memory(buffer.last('close', 5), buffer._data['close'])
+    assert np.shares_memory(buffer.latest('close'), buffer._data['close'])
+
+
+def test_warm_matches_the_last_capacity_rows(rng):
+    panel = pd.DataFrame(rng.rand(8, 20), index=range(8), columns=CODES)
+    buffer = BarRingBuffer(['close', 'high_limit'], capacity=5, securities=CODES)
+    buffer.warm({'close': panel})
+    assert np.array_equal(buffer.last('close'), panel.values[-5:])
+    assert buffer.last_time == 7 and buffer.times() == [3, 4, 5, 6, 7]
+    assert np.isnan(buffer.last('high_limit')).all()
+    pd.testing.assert_frame_equal(buffer.frame('close', 3), panel.iloc[-3:], check_index_type=False)
+
+
+def test_changing_securities_keeps_history(rng):
+    panel = pd.DataFrame(rng.rand(8, 20), index=range(8), columns=CODES)
+    buffer = BarRingBuffer(['close'], capacity=5, securities=CODES)
+    buffer.warm({'close': panel})
+    buffer.set_securities(CODES[5:] + ['NEW.XSHE'])
+    assert buffer.covers(CODES[5:]) and not buffer.covers(CODES[:1])
+    got = buffer.frame('close', 2, [CODES[5], 'NEW.XSHE', CODES[0]])
+    assert np.array_equal(got[CODES[5]].values, panel[CODES[5]].values[-2:])
+    # 新加入和已移出的证券为缺失值
+    assert got['NEW.XSHE'].isna().all() and got[CODES[0]].isna().all()
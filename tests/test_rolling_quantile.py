@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""RollingQuantileIndex 与 pandas rolling().median()/quantile() 对照：停牌不写入，数据不足时不判定为低位"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_quantile import RollingQuantileIndex
+
+LOOKBACK = 30
+
+
+@pytest.fixture(scope='module')
+def prices():
+    rng = np.random.RandomState(7)
+    days, n_stocks = 120, 50
+    frame = pd.DataFrame(np.cumprod(1 + rng.normal(0, 0.02, (days, n_stocks)), axis=0) * 10,
+                         columns=['%06d.XSHE' % i for i in range(n_stocks)])
+    # 随机停牌，另有一只从第 40 天才上市、一只停牌日收盘价记为 0
+    frame = frame.mask(rng.rand(days, n_stocks) < 0.1)
+    frame.iloc[:40, 1] = np.nan
+    frame.iloc[::7, 2] = 0.0
+    return frame
+
+
+def expected_level(series, quantile, min_periods):
+    rolling = series.rolling(LOOKBACK, min_periods=min_periods)
+    level = rolling.median() if quantile == 0.5 else rolling.quantile(quantile)
+    return level.iloc[-1] if len(series) else np.nan
+
+
+@pytest.mark.parametrize('quantile', [0.5, 0.3])
+def test_matches_pandas_rolling(prices, quantile):
+    index = RollingQuantileIndex(LOOKBACK, quantile)
+    for day in range(len(prices)):
+        index.update(prices.iloc[day], date=day)
+        for stock in prices.columns:
+            # 停牌日（缺失或<=0）不计入窗口，对应 skip_paused=True 的最近 N 个有效交易日
+            series = prices[stock].iloc[:day + 1]
+            series = series[series > 0]
+            level = expected_level(series, quantile, index.min_periods)
+            expected = bool(len(series) and not np.isnan(level) and series.iloc[-1] < level)
+            if not np.isnan(level):
+                assert np.isclose(index.levels()[index._col[stock]], level), (day, stock)
+            assert index.is_below(stock) == expected, (day, stock)
+
+
+def test_warm_up_window_is_never_below():
+    index = RollingQuantileIndex(LOOKBACK, 0.5, min_ratio=0.8)
+    assert index.min_periods == 24
+    # 一路下跌：数据充足后最新价一定低于中位数
+    closes = np.linspace(20, 10, 40)
+    for day, close in enumerate(closes):
+        index.update(pd.Series([close], index=['000001.XSHE']), date=day)
+        assert index.is_below('000001.XSHE') == (day + 1 >= index.min_periods), day
+
+
+def test_paused_rows_do_not_advance_the_window():
+    index = RollingQuantileIndex(5, 0.5, min_ratio=1.0)
+    for day, close in enumerate([10, 11, np.nan, 12, 0, 13, 9]):
+        index.update(pd.Series([close], index=['000001.XSHE']), date=day)
+    # 有效收盘价 10, 11, 12, 13, 9：中位数 11，最新价 9
+    assert index._count[0] == 5
+    assert index.levels()[0] == 11
+    assert index.is_below('000001.XSHE')
+
+
+def test_warm_rebuilds_from_the_last_lookback_rows(prices):
+    index = RollingQuantileIndex(LOOKBACK)
+    index.update(pd.Series([1.0], index=['999999.XSHE']), date=0)
+    index.warm(prices)
+    # warm 先清空，再写入最后 lookback 行（其中的停牌日同样跳过）
+    assert index.securities == list(prices.columns)
+    assert index.last_date == prices.index[-1]
+    tail = prices.tail(LOOKBACK)
+    tail = tail.where(tail > 0)
+    assert np.allclose(index.levels(), tail.median().values, equal_nan=True)
+    assert list(index._count) == list(tail.count().values)
+
+
+def test_same_or_earlier_date_is_ignored():
+    index = RollingQuantileIndex(5)
+    assert index.update(pd.Series([10.0], index=['000001.XSHE']), date=3)
+    assert not index.update(pd.Series([11.0], index=['000001.XSHE']), date=3)
+    assert not index.update(pd.Series([11.0], index=['000001.XSHE']), date=2)
+    assert index._count[0] == 1
+
+
+def test_below_for_unknown_stocks_is_false():
+    index = RollingQuantileIndex(5, min_ratio=0.2)
+    index.update(pd.Series([10.0, 10.0], index=['000001.XSHE', '000002.XSHE']), date=0)
+    below = index.below(['000001.XSHE', '600000.XSHG'])
+    assert list(below.index) == ['000001.XSHE', '600000.XSHG'] and not below.any()
+    assert not index.is_below('600000.XSHG')
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""jqlocal.store 内存映射行情矩阵：追加与扩容、重新打开后读取、视图不复制、由宽表建库"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from jqlocal.store import MatrixStore
+
+CODES = ['%06d.XSHE' % i for i in range(50)]
+DATES = pd.bdate_range('2024-01-01', periods=40)
+
+
+@pytest.fixture(scope='module')
+def close():
+    rng = np.random.RandomState(3)
+    return pd.DataFrame(rng.rand(40, 50), index=DATES, columns=CODES)
+
+
+@pytest.fixture
+def root(tmp_path, close):
+    root = str(tmp_path / 's')
+    store = MatrixStore.create(root, day_capacity=4, security_capacity=8)
+    for i, date in enumerate(DATES):
+        # 后加入的证券触发列扩容，行数超过容量触发行扩容
+        live = CODES[:min(10 + 2 * i, 50)]
+        store.append_day(date, {'close': close.loc[date, live], 'paused': pd.Series(1, index=live)})
+    assert store.day_capacity >= 40 and store.security_capacity >= 50
+    assert store.n_days == 40 and store.n_securities == 50
+    store.flush()
+    return root
+
+
+def test_reopened_store_reads_the_appended_days(root, close):
+    store = MatrixStore(root)
+    got = store.frame('close', CODES[:5], end_date=DATES[-1], count=3)
+    assert np.allclose(got.values, close[CODES[:5]].iloc[-3:].values)
+    assert list(got.index) == list(DATES[-3:])
+    # end_date 落在非交易日时取之前最近的交易日
+    got = store.frame('close', CODES[:2], end_date=DATES[4] + pd.Timedelta(days=1), count=1)
+    assert DATES[4].dayofweek == 4 and got.index[0] == DATES[4]
+    got = store.frame('close', CODES[:2], start_date=DATES[5], end_date=DATES[7])
+    assert list(got.index) == list(DATES[5:8])
+
+
+def test_windows_are_views(root):
+    store = MatrixStore(root)
+    view = store.window('close', count=5)
+    assert view.shape == (5, 50) and np.shares_memory(view, store.arrays['close'])
+    assert np.shares_memory(store.frame('close').values, store.arrays['close'])
+
+
+def test_missing_values_before_listing_and_for_unknown_codes(root):
+    store = MatrixStore(root)
+    # 上市前浮点字段为 NaN，停牌字段为 0
+    assert np.isnan(store.get('close', [CODES[-1]], end_date=DATES[0])[-1, 0])
+    assert store.get('paused', [CODES[-1]], end_date=DATES[0])[-1, 0] == 0
+    assert store.get('paused', [CODES[0]], end_date=DATES[0])[-1, 0] == 1
+    out = store.get('paused', [CODES[0], 'UNKNOWN'], count=2)
+    assert out.dtype.kind == 'f' and np.isnan(out[:, 1]).all()
+
+
+def test_days_must_increase(root):
+    store = MatrixStore(root, 'r+')
+    with pytest.raises(ValueError):
+        store.append_day(DATES[-1], {'close': pd.Series({CODES[0]: 1.0})})
+
+
+def test_from_frames_matches_the_input(tmp_path, close):
+    built = MatrixStore.from_frames(str(tmp_path / 'b'), {'close': close})
+    assert np.allclose(built.frame('close').values, close.values)
+    reopened = MatrixStore(str(tmp_path / 'b'))
+    assert reopened.securities == CODES and len(reopened.trade_days) == 40
+    assert os.path.exists(str(tmp_path / 'b' / 'close.npy'))